@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the analysis pipeline on synthetic corpora of growing size.
+
+For each size and storage layout a seeded corpus is generated
+(synthetic_corpus.py, profile fitted to the real logs unless --profile is
+given) and every stage of compare_gpt_vs_gemini_v4_ptbr.py is timed
+separately. --layouts picks the layouts: "files" (the old conversa_*.json,
+one per conversation) and "index" (day shards + indice.jsonl, written by the
+server's storage and read through per-shard unit indexes, as v4 does by
+default).
+
+  generate    write the synthetic corpus
+  units       split the index into unit indexes (index layout only)
+  load        parse every conversation (conversations.iter_conversations)
+  metrics     per-conversation metrics (analyze_paths, --workers processes)
+  store       columnar store build + save + memory-mapped load
+  stats       batched paired tests (bootstrap / permutation / Wilcoxon)
+  plots       render the standard figures (skipped with --no_plots)
+  near_dups   MinHash signatures + LSH boilerplate clusters (with --near_duplicates)
+
+Memory is the tracemalloc peak of each stage (Python allocations, including
+NumPy buffers); --no_tracemalloc removes its overhead and reports only the
+max RSS. Both only see the benchmarking process: with --workers > 1 the
+metrics and plots stages run in worker processes, whose memory is
+children_rss_mb -- the max RSS of the largest worker so far (RUSAGE_CHILDREN,
+updated as each pool exits; n workers can hold up to n times that). Every
+size/layout runs in a fresh process, so neither RSS column carries over from
+an earlier run. Results go to benchmark_results.csv in --output_dir.
+
+Usage:
+  python benchmark_analysis.py --sizes 100,1000,10000 --output_dir /tmp/bench
+  python benchmark_analysis.py --sizes 1000 --workers 4 --near_duplicates --no_plots
+  python benchmark_analysis.py --sizes 10000 --layouts index
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import gc
+import os
+import resource
+import shutil
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+from compare_gpt_vs_gemini_v4_ptbr import (
+    UNITS_DIR,
+    AnalysisParams,
+    analyze_paths,
+    collect_near_duplicates,
+    figure_job,
+    render_figures,
+)
+from conversations import expand_inputs, iter_conversations
+from metrics_store import MetricsStore
+from near_duplicates import boilerplate_report
+from paired_stats import paired_tests
+from synthetic_corpus import CorpusGenerator, add_profile_args, build_profile
+
+FIELDS = ["size", "layout", "stage", "seconds", "peak_mb", "max_rss_mb", "children_rss_mb", "conversations", "turns"]
+LAYOUTS = ("files", "index")
+
+
+def _max_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    return resource.getrusage(who).ru_maxrss / 1024.0  # KiB on Linux
+
+
+def timed(stage: str, fn: Callable[[], Any], trace: bool) -> Tuple[Any, Dict[str, Any]]:
+    gc.collect()
+    if trace:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    out = fn()
+    secs = time.perf_counter() - t0
+    peak = None
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1] / (1024.0 * 1024.0)
+        tracemalloc.stop()
+    return out, {
+        "stage": stage,
+        "seconds": secs,
+        "peak_mb": peak,
+        "max_rss_mb": _max_rss_mb(),
+        "children_rss_mb": _max_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+
+def bench_size(n: int, layout: str, args: argparse.Namespace, profile: Any, work_dir: str) -> List[Dict[str, Any]]:
+    corpus = os.path.join(work_dir, f"corpus_{layout}_{n}")
+    out_dir = os.path.join(work_dir, f"out_{layout}_{n}")
+    shutil.rmtree(corpus, ignore_errors=True)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+    trace = not args.no_tracemalloc
+    params = AnalysisParams(
+        decision_classes=("Qualificado", "Desqualificado"),
+        gpt_out_per_m=args.gpt_out_per_m,
+        gemini_out_per_m=args.gemini_out_per_m,
+        max_turns=None,
+    )
+    results = []
+
+    gen = CorpusGenerator(profile, seed=args.seed)
+    write = gen.write_shards if layout == "index" else gen.write
+    paths, r = timed("generate", lambda: write(corpus, n), trace)
+    results.append(r)
+
+    if layout == "index":
+        units, r = timed("units", lambda: expand_inputs(paths, os.path.join(out_dir, UNITS_DIR)), trace)
+        results.append(r)
+        paths = [p for p, _ in units]
+
+    convs, r = timed("load", lambda: list(iter_conversations(paths)), trace)
+    results.append(r)
+    n_turns = sum(len(c.turns) for c in convs)
+    del convs
+
+    (rows, paired, turn_metrics), r = timed("metrics", lambda: analyze_paths(paths, params, workers=args.workers), trace)
+    results.append(r)
+
+    def store_stage() -> MetricsStore:
+        MetricsStore.from_results(rows, turn_metrics).save(out_dir)
+        return MetricsStore.load(out_dir, mmap=True)
+
+    store, r = timed("store", store_stage, trace)
+    results.append(r)
+
+    def stats_stage() -> Any:
+        inputs = {}
+        for metric in ("decision_turn", "output_tokens_used", "cost_used_usd", "repetitiveness_used", "avg_words_used"):
+            col = store.by_model(metric)
+            inputs[metric] = (col["gpt"], col["gemini"])
+        return paired_tests(inputs, n_resamples=args.n_resamples, seed=args.seed)
+
+    _, r = timed("stats", stats_stage, trace)
+    results.append(r)
+
+    if not args.no_plots:
+        def plots_stage() -> None:
+            dt = store.by_model("decision_turn")
+            tok = store.by_model("output_tokens_used")
+            jobs = [
+                figure_job("decision_turn_box", "box", dt, "Turno de decisão", "Índice do turno",
+                           out_png=os.path.join(out_dir, "decision_turn_box_trimmed.png")),
+                figure_job("output_tokens_box", "box", tok, "Tokens de saída", "Tokens",
+                           out_png=os.path.join(out_dir, "output_tokens_box_trimmed.png")),
+                figure_job("output_tokens_hist", "hist", tok, "Tokens de saída", "Tokens",
+                           out_png=os.path.join(out_dir, "output_tokens_hist_trimmed.png")),
+                figure_job("decision_vs_tokens", "scatter", dt, tok, "Turno de decisão vs tokens", "Turno", "Tokens",
+                           out_png=os.path.join(out_dir, "decisao_vs_tokens_trimmed.png")),
+            ]
+            render_figures(jobs, out_dir, workers=args.workers)
+
+        _, r = timed("plots", plots_stage, trace)
+        results.append(r)
+
+    if args.near_duplicates:
+        def near_dups_stage() -> None:
+            within, refs, sigs = collect_near_duplicates(paths, params, rows, args.dup_threshold)
+            boilerplate_report(refs, sigs, threshold=args.dup_threshold)
+
+        _, r = timed("near_dups", near_dups_stage, trace)
+        results.append(r)
+
+    del store
+    if not args.keep:
+        shutil.rmtree(corpus, ignore_errors=True)
+        shutil.rmtree(out_dir, ignore_errors=True)
+    for r in results:
+        r.update(size=n, layout=layout, conversations=len(paired), turns=n_turns)
+    return results
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Time and memory of each analysis stage on synthetic corpora")
+    ap.add_argument("--sizes", default="100,1000,10000", help="Comma-separated corpus sizes (conversations)")
+    ap.add_argument("--output_dir", default="benchmark_out", help="Scratch corpora + benchmark_results.csv")
+    ap.add_argument("--layouts", default=",".join(LAYOUTS), help="Comma-separated storage layouts: files, index")
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--n_resamples", type=int, default=10000)
+    ap.add_argument("--gpt_out_per_m", type=float, default=1.6)
+    ap.add_argument("--gemini_out_per_m", type=float, default=2.5)
+    ap.add_argument("--no_plots", "--no-plots", action="store_true")
+    ap.add_argument("--near_duplicates", action="store_true")
+    ap.add_argument("--dup_threshold", type=float, default=0.7)
+    ap.add_argument("--no_tracemalloc", action="store_true", help="Skip tracemalloc (faster; only max RSS is reported)")
+    ap.add_argument("--keep", action="store_true", help="Keep the generated corpora and outputs")
+    add_profile_args(ap)
+    args = ap.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    layouts = [s.strip() for s in args.layouts.split(",") if s.strip()]
+    for layout in layouts:
+        if layout not in LAYOUTS:
+            raise SystemExit(f"--layouts: unknown layout {layout!r} (choose from {', '.join(LAYOUTS)})")
+    os.makedirs(args.output_dir, exist_ok=True)
+    profile = build_profile(args)
+
+    results: List[Dict[str, Any]] = []
+    for n in sizes:
+        for layout in layouts:
+            print(f"\n=== {n} conversations, {layout} ===")
+            # fresh process per run: the max RSS counters only grow
+            with ProcessPoolExecutor(max_workers=1) as runner:
+                run = runner.submit(bench_size, n, layout, args, profile, args.output_dir).result()
+            for r in run:
+                results.append(r)
+                peak = f"{r['peak_mb']:.1f} MB" if r["peak_mb"] is not None else "-"
+                print(f"{r['stage']:<10} {r['seconds']:>9.3f} s   peak {peak:>10}   rss {r['max_rss_mb']:.0f} MB"
+                      f"   workers rss {r['children_rss_mb']:.0f} MB")
+
+    out_csv = os.path.join(args.output_dir, "benchmark_results.csv")
+    with open(out_csv, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=FIELDS)
+        w.writeheader()
+        for r in results:
+            w.writerow({k: r.get(k) for k in FIELDS})
+    print(f"\nWrote: {out_csv}")
+
+
+if __name__ == "__main__":
+    main()
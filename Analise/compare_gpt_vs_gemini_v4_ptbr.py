@@ -10,7 +10,8 @@ Key changes (v2):
   token/cost/quality stats, per your requirement.
 - Adds a qualitative evaluation workflow (human annotation template + analysis of ratings if provided).
 
-Expected input format (per file):
+Input: any log handled by conversations.py (IA user "historico" files, Human user
+"conversation" files, JSONL turn logs). Reference format (per file):
 {
   "historico": [
     {
@@ -26,7 +27,7 @@ Expected input format (per file):
 
 Usage:
   python compare_gpt_vs_gemini_v2.py \
-    --input_glob "D:\FURG 2025\TCC\parte pratica\IA user\JSON_Conversas\conversa_*.json" \
+    --input_glob "D:\FURG 2025\TCC\parte pratica\IA user\JSON_Conversas\indice.jsonl" \
     --output_dir "D:\FURG 2025\TCC\parte pratica\IA user\JSON_Conversas\out" \
     --gpt_out_per_m 1.60 \
     --gemini_out_per_m 2.50
@@ -34,31 +35,61 @@ Usage:
 Optional (qualitative):
   # 1) export an annotation sheet you (or 2 annotators) can fill
   python compare_gpt_vs_gemini_v2.py \
-    --input_glob "D:\FURG 2025\TCC\parte pratica\IA user\JSON_Conversas\conversa_*.json" \
+    --input_glob "D:\FURG 2025\TCC\parte pratica\IA user\JSON_Conversas\indice.jsonl" \
     --output_dir "D:\FURG 2025\TCC\parte pratica\IA user\JSON_Conversas\out" \
     --export_annotation_template "./out/annotation_template.csv"
 
   # 2) after you fill it, analyze it
   python compare_gpt_vs_gemini_v2.py \
-    --input_glob "D:\FURG 2025\TCC\parte pratica\IA user\JSON_Conversas\conversa_*.json" \
+    --input_glob "D:\FURG 2025\TCC\parte pratica\IA user\JSON_Conversas\indice.jsonl" \
     --output_dir "D:\FURG 2025\TCC\parte pratica\IA user\JSON_Conversas\out" \
     --ratings_csv "./out/annotation_filled.csv"
+
+Sharded storage (IA user/armazenamento.py): by default the index
+("...\JSON_Conversas\indice.jsonl") and the old conversa_*.json files are read
+together, skipping old files already migrated into the index; --input_glob
+(repeatable) can also point at the day shards
+("...\JSON_Conversas\*\*\*\conversas.jsonl.gz"). With the index, --where selects records
+without reading the others, e.g. --where experimento=noite01 --where modelos=gpt
+--where decisao=gemini:Qualificado --where desde=2026-01-05. The index is split
+into per-shard units (<output_dir>/unidades_indice), so --workers spreads them and
+the metrics cache only recomputes the units that received new records.
 """
 
 from __future__ import annotations
 
 import argparse
 import glob
-import json
 import math
 import os
-import re
 import statistics
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
-
-import matplotlib.pyplot as plt
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from conversations import INDEX_NAME, Conversation, Turn, expand_inputs, load_conversations
+from latency import (
+    CONVERSATION_FIELDS as LATENCY_CONVERSATION_FIELDS,
+    SUMMARY_FIELDS as LATENCY_SUMMARY_FIELDS,
+    THROUGHPUT_FIELDS,
+    TURN_FIELDS as LATENCY_TURN_FIELDS,
+    conversation_latency,
+    experiment_name,
+    flag_outliers,
+    format_latency_summary,
+    latency_summary,
+    throughput,
+)
+from input_tokens import DEFAULT_PROMPTS_DIR, client_text_is_input, input_token_counts, load_system_prompts, prompts_digest
+from metrics_cache import MetricsManifest
+from metrics_store import MetricsStore
+from near_duplicates import MessageRef, MinHasher, boilerplate_report, within_pairs
+from paired_stats import PairedResult, format_result, paired_tests
+from partials import default_node, format_summary, load_partial, merge_partials, save_partial, summarize
+from text_features import FeatureBatch, consecutive_jaccard, extract_batch
+from token_counts import DEFAULT_ENCODINGS, TOKEN_CACHE_NAME, count_tokens, get_cache, get_counter
 
 # -----------------------------
 # Plot configuration (Portuguese labels + colors)
@@ -82,8 +113,6 @@ MODEL_MARKERS = {
 # Utilities
 # -----------------------------
 
-_WORD_RE = re.compile(r"\b\w+\b", re.UNICODE)
-
 def safe_mean(xs: List[float]) -> float:
     xs = [x for x in xs if x is not None and not (isinstance(x, float) and math.isnan(x))]
     return float(statistics.mean(xs)) if xs else float("nan")
@@ -96,26 +125,6 @@ def safe_stdev(xs: List[float]) -> float:
     xs = [x for x in xs if x is not None and not (isinstance(x, float) and math.isnan(x))]
     return float(statistics.stdev(xs)) if len(xs) >= 2 else float("nan")
 
-def approx_tokens(text: str) -> int:
-    """
-    Rough token estimator (works okay for relative comparison):
-      ~ 1 token per 4 chars, clamped to >= 0
-    """
-    if not text:
-        return 0
-    return max(0, int(math.ceil(len(text) / 4.0)))
-
-def word_count(text: str) -> int:
-    return len(_WORD_RE.findall(text or ""))
-
-def jaccard(a: List[str], b: List[str]) -> float:
-    sa, sb = set(a), set(b)
-    if not sa and not sb:
-        return 1.0
-    if not sa or not sb:
-        return 0.0
-    return len(sa & sb) / len(sa | sb)
-
 def iqr_outlier_flags(values: List[float]) -> List[bool]:
     """
     Tukey IQR outliers: outside [Q1 - 1.5*IQR, Q3 + 1.5*IQR]
@@ -149,23 +158,6 @@ def iqr_outlier_flags(values: List[float]) -> List[bool]:
             flags.append(v < lo or v > hi)
     return flags
 
-def try_wilcoxon_paired(a: List[float], b: List[float]) -> Optional[Tuple[float, float]]:
-    """
-    Wilcoxon signed-rank test if scipy is available.
-    Returns (statistic, p_value) or None.
-    """
-    pairs = [(x, y) for x, y in zip(a, b) if x is not None and y is not None and not (math.isnan(x) or math.isnan(y))]
-    if len(pairs) < 5:
-        return None
-    xa = [p[0] for p in pairs]
-    xb = [p[1] for p in pairs]
-    try:
-        from scipy.stats import wilcoxon  # type: ignore
-        stat, p = wilcoxon(xa, xb, zero_method="wilcox", alternative="two-sided", mode="auto")
-        return float(stat), float(p)
-    except Exception:
-        return None
-
 
 # -----------------------------
 # Core parsing
@@ -191,20 +183,27 @@ class ModelMetrics:
     cost_used_usd: Optional[float]
     cost_post_decision_usd: Optional[float]
 
-def first_decision_turn(hist: List[Dict[str, Any]], model_key: str, decision_classes: List[str]) -> Optional[int]:
+def first_decision_turn(hist: List[Turn], model_key: str, decision_classes: List[str]) -> Optional[int]:
     for i, turn in enumerate(hist):
-        cls = (turn.get(model_key) or {}).get("class")
-        if cls in decision_classes:
+        if turn.cls(model_key) in decision_classes:
             return i
     return None
 
 def compute_metrics_for_model(
-    hist: List[Dict[str, Any]],
+    hist: List[Turn],
     model_key: str,
     decision_classes: List[str],
     price_out_per_m: Optional[float],
     max_turns: Optional[int] = None,
+    features: Optional[FeatureBatch] = None,
+    token_counts: Optional[np.ndarray] = None,
 ) -> ModelMetrics:
+    """
+    `features` is the single-pass FeatureBatch of this model's messages in the
+    observed segment (hist[:turns_total]); it is extracted here if not given.
+    `token_counts` are exact per-message counts for the same segment (tokenizer
+    mode); without them tokens are approximated from characters.
+    """
     n_total = len(hist)
     dturn = first_decision_turn(hist, model_key, decision_classes)
     if max_turns is not None:
@@ -216,38 +215,29 @@ def compute_metrics_for_model(
     if max_turns is not None:
         effective_end = min(effective_end, max_turns - 1)
 
-    used = hist[: effective_end + 1]
-    post = hist[effective_end + 1 : n_total]
+    # USED segment = features[:n_used], post-decision segment = features[n_used:]
+    n_used = len(hist[: effective_end + 1])
+    if features is None:
+        features = extract_batch([t.msg(model_key) for t in hist[:n_total]])
 
     decision_class = None
     if dturn is not None and dturn <= effective_end:
-        decision_class = (hist[dturn].get(model_key) or {}).get("class")
+        decision_class = hist[dturn].cls(model_key)
 
-    def msgs(h: List[Dict[str, Any]]) -> List[str]:
-        out = []
-        for t in h:
-            m = (t.get(model_key) or {}).get("msg") or ""
-            out.append(m)
-        return out
-
-    used_msgs = msgs(used)
-    post_msgs = msgs(post)
-
-    used_tokens = sum(approx_tokens(m) for m in used_msgs)
-    post_tokens = sum(approx_tokens(m) for m in post_msgs)
+    tokens = features.approx_tokens if token_counts is None else token_counts
+    used_tokens = int(tokens[:n_used].sum())
+    post_tokens = int(tokens[n_used:].sum())
 
     # avg words / questions in USED segment
-    if used_msgs:
-        avg_words = statistics.mean([word_count(m) for m in used_msgs])
-        avg_q = statistics.mean([m.count("?") for m in used_msgs])
+    if n_used:
+        avg_words = int(features.words[:n_used].sum()) / n_used
+        avg_q = int(features.questions[:n_used].sum()) / n_used
     else:
         avg_words = float("nan")
         avg_q = float("nan")
 
     # repetitiveness in USED segment (avg Jaccard between consecutive turns)
-    sims = []
-    for a, b in zip(used_msgs, used_msgs[1:]):
-        sims.append(jaccard(_WORD_RE.findall(a.lower()), _WORD_RE.findall(b.lower())))
+    sims = consecutive_jaccard(features, 0, n_used).tolist()
     rep = float(statistics.mean(sims)) if sims else float("nan")
 
     wasted = max(0, n_total - (effective_end + 1)) if (dturn is not None and dturn <= effective_end) else 0
@@ -262,7 +252,7 @@ def compute_metrics_for_model(
         decision_turn=dturn if (dturn is not None and dturn <= effective_end) else None,
         decision_class=decision_class,
         turns_total=n_total,
-        turns_used=len(used),
+        turns_used=n_used,
         wasted_turns_post_decision=wasted,
         output_tokens_used=used_tokens,
         output_tokens_post_decision=post_tokens,
@@ -273,13 +263,390 @@ def compute_metrics_for_model(
         cost_post_decision_usd=cost_post,
     )
 
-def load_conversation_file(path: str) -> List[Dict[str, Any]]:
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    hist = data.get("historico")
-    if not isinstance(hist, list):
-        raise ValueError(f"File {path} missing 'historico' list.")
-    return hist
+def load_conversation_file(path: str) -> List[Turn]:
+    """Turns of the first conversation in `path` (see conversations.py for the schemas)."""
+    return next(iter(load_conversations(path))).turns
+
+
+# -----------------------------
+# Per-conversation analysis (serial or process pool)
+# -----------------------------
+
+@dataclass(frozen=True)
+class AnalysisParams:
+    decision_classes: Tuple[str, ...]
+    gpt_out_per_m: Optional[float]
+    gemini_out_per_m: Optional[float]
+    max_turns: Optional[int]
+    tokenizer: str = "approx"  # "approx" (len/4) | "tiktoken"
+    gpt_encoding: str = DEFAULT_ENCODINGS["gpt"]
+    gemini_encoding: str = DEFAULT_ENCODINGS["gemini"]
+    # input side (input_tokens.py): payload reconstruction, input prices, hash of the system prompts
+    input_tokens: bool = False
+    gpt_in_per_m: Optional[float] = None
+    gemini_in_per_m: Optional[float] = None
+    prompts_digest: str = ""
+    # where counts persist / prompts are read; not part of the metric definition (excluded from the manifest fingerprint)
+    token_cache: Optional[str] = field(default=None, repr=False, compare=False)
+    prompts_dir: Optional[str] = field(default=None, repr=False, compare=False)
+
+def observed_turns(conv: Conversation, params: AnalysisParams) -> List[Turn]:
+    return conv.turns if params.max_turns is None else conv.turns[: params.max_turns]
+
+def file_token_counts(
+    convs: List[Conversation], params: AnalysisParams
+) -> List[Optional[Dict[str, np.ndarray]]]:
+    """
+    Exact token counts per conversation and model (observed segment), or None
+    per conversation in approx mode. All messages of the file go to each
+    model's encoder in one batch; cached messages are not re-encoded.
+    """
+    if params.tokenizer == "approx":
+        return [None] * len(convs)
+    cache = get_cache(params.token_cache) if params.token_cache else None
+    hists = [observed_turns(c, params) for c in convs]
+    bounds = np.cumsum([len(h) for h in hists])[:-1]
+    per_model = {}
+    for model_key, encoding in (("gpt", params.gpt_encoding), ("gemini", params.gemini_encoding)):
+        texts = [t.msg(model_key) for h in hists for t in h]
+        per_model[model_key] = np.split(count_tokens(texts, get_counter(encoding), cache), bounds)
+    return [{k: per_model[k][i] for k in per_model} for i in range(len(convs))]
+
+def file_input_token_counts(
+    convs: List[Conversation], params: AnalysisParams
+) -> List[Optional[Dict[str, np.ndarray]]]:
+    """
+    Reconstructed input tokens per turn, per conversation and model (observed
+    segment), or None per conversation when --input_tokens is off. Same
+    batching and cache as file_token_counts.
+    """
+    if not params.input_tokens:
+        return [None] * len(convs)
+    prompts = load_system_prompts(params.prompts_dir or DEFAULT_PROMPTS_DIR)
+    cache = get_cache(params.token_cache) if params.token_cache and params.tokenizer != "approx" else None
+    items = [(observed_turns(c, params), client_text_is_input(c)) for c in convs]
+    per_model = {}
+    for model_key, encoding in (("gpt", params.gpt_encoding), ("gemini", params.gemini_encoding)):
+        counter = None if params.tokenizer == "approx" else get_counter(encoding)
+        per_model[model_key] = input_token_counts(items, prompts[model_key], counter, cache)
+    return [{k: per_model[k][i] for k in per_model} for i in range(len(convs))]
+
+def input_cost_fields(
+    inp: np.ndarray, mm: ModelMetrics, price_in_per_m: Optional[float]
+) -> Dict[str, Any]:
+    """Input-side columns of one per-model row; total = input + output cost until decision."""
+    used = int(inp[: mm.turns_used].sum())
+    post = int(inp[mm.turns_used :].sum())
+    cost_used = cost_post = total = None
+    if price_in_per_m is not None:
+        cost_used = used * (price_in_per_m / 1_000_000.0)
+        cost_post = post * (price_in_per_m / 1_000_000.0)
+        if mm.cost_used_usd is not None:
+            total = cost_used + mm.cost_used_usd
+    return {
+        "input_tokens_used": used,
+        "input_tokens_post_decision": post,
+        "input_cost_used_usd": cost_used,
+        "input_cost_post_decision_usd": cost_post,
+        "total_cost_used_usd": total,
+    }
+
+def analyze_conversation(
+    conv: Conversation,
+    params: AnalysisParams,
+    token_counts: Optional[Dict[str, np.ndarray]] = None,
+    input_counts: Optional[Dict[str, np.ndarray]] = None,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any], Dict[str, Dict[str, List[int]]]]:
+    """Returns the two per-model rows, the paired row and the per-turn metrics for one conversation."""
+    hist = conv.turns
+    conv_id = conv.conversation_id
+    decision_classes = list(params.decision_classes)
+    # experiment-runner files carry their matrix cell; manual saves have none
+    experiment = conv.meta.get("experimento") or {}
+    tags = {"experiment_cell": experiment["celula"]} if experiment.get("celula") else {}
+
+    # one tokenization pass per message, shared by the metrics and the per-turn store
+    obs = observed_turns(conv, params)
+    feats = {k: extract_batch([t.msg(k) for t in obs]) for k in ("gpt", "gemini")}
+    tokens = token_counts or {k: fb.approx_tokens for k, fb in feats.items()}
+
+    g = compute_metrics_for_model(
+        hist, "gpt", decision_classes, params.gpt_out_per_m, max_turns=params.max_turns,
+        features=feats["gpt"], token_counts=tokens["gpt"],
+    )
+    m = compute_metrics_for_model(
+        hist, "gemini", decision_classes, params.gemini_out_per_m, max_turns=params.max_turns,
+        features=feats["gemini"], token_counts=tokens["gemini"],
+    )
+
+    # assistant final msg (USED segment)
+    def final_msg(model_key: str, mm: ModelMetrics) -> str:
+        used_end = mm.turns_used - 1
+        if used_end < 0:
+            return ""
+        return hist[used_end].msg(model_key)
+
+    rows = [
+        {
+            "conversation_id": conv_id,
+            "model": "gpt",
+            **tags,
+            **g.__dict__,
+            "assistant_final_msg": final_msg("gpt", g),
+        },
+        {
+            "conversation_id": conv_id,
+            "model": "gemini",
+            **tags,
+            **m.__dict__,
+            "assistant_final_msg": final_msg("gemini", m),
+        },
+    ]
+    paired = {
+        "conversation_id": conv_id,
+        **tags,
+        "gpt_decision_turn": g.decision_turn,
+        "gemini_decision_turn": m.decision_turn,
+        "gpt_output_tokens_used": g.output_tokens_used,
+        "gemini_output_tokens_used": m.output_tokens_used,
+        "gpt_cost_used_usd": g.cost_used_usd,
+        "gemini_cost_used_usd": m.cost_used_usd,
+        "gpt_repetitiveness_used": g.repetitiveness_used,
+        "gemini_repetitiveness_used": m.repetitiveness_used,
+        "gpt_avg_words_used": g.avg_words_used,
+        "gemini_avg_words_used": m.avg_words_used,
+    }
+    if input_counts is not None:
+        prices_in = {"gpt": params.gpt_in_per_m, "gemini": params.gemini_in_per_m}
+        for row, mm in zip(rows, (g, m)):
+            extra = input_cost_fields(input_counts[row["model"]], mm, prices_in[row["model"]])
+            row.update(extra)
+            for k in ("input_tokens_used", "input_cost_used_usd", "total_cost_used_usd"):
+                paired[f"{row['model']}_{k}"] = extra[k]
+
+    # per-turn metrics for the columnar store (observed segment, flagged if used)
+    turn_metrics: Dict[str, Dict[str, List[int]]] = {}
+    for model_key, mm in (("gpt", g), ("gemini", m)):
+        fb = feats[model_key]
+        turn_metrics[model_key] = {
+            "output_tokens": tokens[model_key].tolist(),
+            "words": fb.words.tolist(),
+            "questions": fb.questions.tolist(),
+            "used": [i < mm.turns_used for i in range(len(fb))],
+        }
+        if input_counts is not None:
+            turn_metrics[model_key]["input_tokens"] = input_counts[model_key].tolist()
+    return rows, paired, turn_metrics
+
+def analyze_file(path: str, params: AnalysisParams) -> List[Tuple[Any, ...]]:
+    """Parses one file and analyzes every conversation in it (unit of work for the pool)."""
+    convs = list(load_conversations(path))
+    counts = file_token_counts(convs, params)
+    inputs = file_input_token_counts(convs, params)
+    return [analyze_conversation(conv, params, tc, ic) for conv, tc, ic in zip(convs, counts, inputs)]
+
+def analyze_files(
+    paths: List[str],
+    params: AnalysisParams,
+    workers: int = 1,
+    manifest: Optional[MetricsManifest] = None,
+) -> List[List[Tuple[Any, ...]]]:
+    """
+    Per-file results for every file in `paths`, in input order. With workers > 1
+    the files are spread over a process pool; the output is identical to the
+    serial run. With a manifest, only new/changed files are recomputed.
+    """
+    per_file: List[Any] = [manifest.lookup(p) if manifest else None for p in paths]
+    todo = [i for i, r in enumerate(per_file) if r is None]
+    todo_paths = [paths[i] for i in todo]
+
+    if workers > 1 and len(todo_paths) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        from functools import partial
+
+        chunksize = max(1, len(todo_paths) // (workers * 8))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            computed = list(pool.map(partial(analyze_file, params=params), todo_paths, chunksize=chunksize))
+    else:
+        computed = [analyze_file(p, params) for p in todo_paths]
+
+    for i, results in zip(todo, computed):
+        per_file[i] = results
+        if manifest:
+            manifest.store(paths[i], results)
+    if manifest:
+        manifest.save()
+        print(f"Metrics cache: {manifest.hits} reused, {manifest.misses} recomputed ({manifest.path})")
+    return per_file
+
+def flatten_results(
+    per_file: List[List[Tuple[Any, ...]]],
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Dict[str, List[int]]]]]:
+    rows: List[Dict[str, Any]] = []  # per (conversation, model)
+    paired: List[Dict[str, Any]] = []  # per conversation, both models
+    turn_metrics: List[Dict[str, Dict[str, List[int]]]] = []  # per conversation, model -> per-turn columns
+    for results in per_file:
+        for conv_rows, conv_paired, conv_turns in results:
+            rows.extend(conv_rows)
+            paired.append(conv_paired)
+            turn_metrics.append(conv_turns)
+    return rows, paired, turn_metrics
+
+def analyze_paths(
+    paths: List[str],
+    params: AnalysisParams,
+    workers: int = 1,
+    manifest: Optional[MetricsManifest] = None,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Dict[str, List[int]]]]]:
+    """(rows, paired, turn_metrics) for every conversation in `paths`; see analyze_files."""
+    return flatten_results(analyze_files(paths, params, workers=workers, manifest=manifest))
+
+
+# -----------------------------
+# Near-duplicate messages (MinHash / LSH)
+# -----------------------------
+
+def collect_near_duplicates(
+    paths: List[str],
+    params: AnalysisParams,
+    rows: List[Dict[str, Any]],
+    threshold: float,
+) -> Tuple[List[Dict[str, Any]], List[MessageRef], np.ndarray]:
+    """
+    Over the observed segment: every near-duplicate pair of turns of the same
+    model inside a conversation (any lag), plus one MessageRef and one MinHash
+    signature per message for the corpus-wide clustering. Token counts follow
+    --tokenizer.
+    """
+    turns_used = {(r["conversation_id"], r["model"]): r["turns_used"] for r in rows}
+    hasher = MinHasher()
+    refs: List[MessageRef] = []
+    sig_blocks: List[np.ndarray] = []
+    within: List[Dict[str, Any]] = []
+    for path in paths:
+        convs = list(load_conversations(path))
+        for conv, counts in zip(convs, file_token_counts(convs, params)):
+            obs = observed_turns(conv, params)
+            for model_key in ("gpt", "gemini"):
+                texts = [t.msg(model_key) for t in obs]
+                feats = extract_batch(texts)
+                tokens = (counts or {}).get(model_key, feats.approx_tokens)
+                n_used = turns_used.get((conv.conversation_id, model_key), len(obs))
+                sigs = hasher.signatures(texts)
+                for i, j, sim in within_pairs(sigs, threshold):
+                    within.append({
+                        "conversation_id": conv.conversation_id,
+                        "model": model_key,
+                        "turn_a": i,
+                        "turn_b": j,
+                        "lag": j - i,
+                        "similarity": round(sim, 4),
+                        "used": j < n_used,
+                        "tokens_b": int(tokens[j]),
+                    })
+                refs.extend(
+                    MessageRef(conv.conversation_id, model_key, i, i < n_used, int(tokens[i]), texts[i])
+                    for i in range(len(texts))
+                )
+                sig_blocks.append(sigs)
+    sigs_all = np.concatenate(sig_blocks) if sig_blocks else np.empty((0, hasher.num_perm), dtype=np.uint32)
+    return within, refs, sigs_all
+
+def collect_latency(
+    paths: List[str],
+    params: AnalysisParams,
+    rows: List[Dict[str, Any]],
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Dict[str, str]]:
+    """
+    Per-turn and per-(conversation, model) latency rows over the observed
+    segment, with IQR outlier flags, plus conversation_id -> experiment name.
+    Decision turns come from the metric rows, so both agree.
+    """
+    decisions = {(r["conversation_id"], r["model"]): r["decision_turn"] for r in rows}
+    turn_rows: List[Dict[str, Any]] = []
+    conv_rows: List[Dict[str, Any]] = []
+    experiments: Dict[str, str] = {}
+    for path in paths:
+        for conv in load_conversations(path):
+            obs = conv._replace(turns=observed_turns(conv, params))
+            turns, per_model = conversation_latency(
+                obs, {m: decisions.get((conv.conversation_id, m)) for m in ("gpt", "gemini")}
+            )
+            turn_rows.extend(turns)
+            conv_rows.extend(per_model)
+            experiments[conv.conversation_id] = experiment_name(conv)
+    flag_outliers(turn_rows, conv_rows)
+    return turn_rows, conv_rows, experiments
+
+def write_latency_reports(
+    turn_rows: List[Dict[str, Any]],
+    conv_rows: List[Dict[str, Any]],
+    experiments: Dict[str, str],
+    output_dir: str,
+    window_min: float,
+) -> None:
+    """Writes latency_turns.csv, latency_conversations.csv, latency_throughput.csv and latency_summary.csv."""
+    import csv
+
+    summary = latency_summary(turn_rows, conv_rows)
+    tables = [
+        ("latency_turns.csv", LATENCY_TURN_FIELDS, turn_rows),
+        ("latency_conversations.csv", LATENCY_CONVERSATION_FIELDS, conv_rows),
+        ("latency_throughput.csv", THROUGHPUT_FIELDS, throughput(turn_rows, experiments, window_min * 60.0)),
+        ("latency_summary.csv", LATENCY_SUMMARY_FIELDS, summary),
+    ]
+    for name, fields, table in tables:
+        out_csv = os.path.join(output_dir, name)
+        with open(out_csv, "w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=fields)
+            w.writeheader()
+            w.writerows(table)
+        print(f"Wrote: {out_csv}")
+
+    print("\n=== Latency (wall clock, until decision for time_to_decision) ===")
+    for line in format_latency_summary(summary):
+        print(line)
+
+def write_near_duplicate_reports(
+    within: List[Dict[str, Any]],
+    refs: List[MessageRef],
+    sigs_all: np.ndarray,
+    output_dir: str,
+    threshold: float,
+    min_conversations: int,
+) -> None:
+    """Writes near_duplicates_within.csv and boilerplate_report.csv (clusters recurring across conversations)."""
+    import csv
+
+    within_csv = os.path.join(output_dir, "near_duplicates_within.csv")
+    fields = ["conversation_id", "model", "turn_a", "turn_b", "lag", "similarity", "used", "tokens_b"]
+    with open(within_csv, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=fields)
+        w.writeheader()
+        w.writerows(within)
+    print(f"Wrote: {within_csv}")
+
+    report = boilerplate_report(refs, sigs_all, threshold=threshold, min_conversations=min_conversations)
+    report_csv = os.path.join(output_dir, "boilerplate_report.csv")
+    fields = ["model", "messages", "conversations", "messages_used", "tokens_total", "tokens_used",
+              "avg_tokens", "example_conversation_id", "example_turn", "example_text"]
+    with open(report_csv, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=fields)
+        w.writeheader()
+        w.writerows(report)
+    print(f"Wrote: {report_csv}")
+
+    print(f"\n=== Near-duplicates (MinHash, Jaccard >= {threshold}) ===")
+    for model_key in ("gpt", "gemini"):
+        pairs = [r for r in within if r["model"] == model_key and r["used"]]
+        back = [r for r in pairs if r["lag"] >= 2]
+        clusters = [r for r in report if r["model"] == model_key]
+        print(
+            f"{model_key}: {len(pairs)} repeated turn pairs until decision ({len(back)} non-consecutive, "
+            f"{sum(r['tokens_b'] for r in pairs)} tokens in the repeats); "
+            f"{len(clusters)} boilerplate clusters in >= {min_conversations} conversations "
+            f"({sum(r['tokens_used'] for r in clusters)} tokens until decision)"
+        )
 
 
 # -----------------------------
@@ -353,14 +720,79 @@ def to_float(x: Any) -> Optional[float]:
 # Plotting helpers
 # -----------------------------
 
+def write_cost_per_turn_csv(
+    rows: List[Dict[str, Any]],
+    turn_metrics: List[Dict[str, Dict[str, List[int]]]],
+    params: AnalysisParams,
+    out_path: str,
+) -> None:
+    """One row per (conversation, model, turn): input / output tokens and costs (empty costs without prices)."""
+    import csv
+
+    prices = {
+        "gpt": (params.gpt_in_per_m, params.gpt_out_per_m),
+        "gemini": (params.gemini_in_per_m, params.gemini_out_per_m),
+    }
+    conv_ids = [r["conversation_id"] for r in rows if r["model"] == "gpt"]
+    fields = ["conversation_id", "model", "turn", "used", "input_tokens", "output_tokens",
+              "input_cost_usd", "output_cost_usd", "total_cost_usd"]
+    with open(out_path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(fields)
+        for conv_id, tm in zip(conv_ids, turn_metrics):
+            for model_key in ("gpt", "gemini"):
+                t = tm[model_key]
+                p_in, p_out = prices[model_key]
+                for i, (n_in, n_out, used) in enumerate(zip(t["input_tokens"], t["output_tokens"], t["used"])):
+                    c_in = n_in * p_in / 1_000_000.0 if p_in is not None else None
+                    c_out = n_out * p_out / 1_000_000.0 if p_out is not None else None
+                    c_tot = c_in + c_out if c_in is not None and c_out is not None else None
+                    w.writerow([conv_id, model_key, i, used, n_in, n_out, c_in, c_out, c_tot])
+    print(f"Wrote: {out_path}")
+
+def print_cost_breakdown(store: MetricsStore) -> None:
+    """Input vs output tokens and cost until decision, per model (corpus totals and per-conversation mean)."""
+    print("\n=== Input vs output (until decision; input = rebuilt payload per turn) ===")
+    for model_key in ("gpt", "gemini"):
+        n_in = np.nansum(store.column(model_key, "input_tokens_used"))
+        n_out = np.nansum(store.column(model_key, "output_tokens_used"))
+        n_conv = max(1, len(store.column(model_key, "conversation_id")))
+        line = (f"{model_key}: input {n_in:.0f} tokens ({n_in / n_conv:.0f}/conversation), "
+                f"output {n_out:.0f} tokens ({n_out / n_conv:.0f}/conversation)")
+        c_in = store.column(model_key, "input_cost_used_usd")
+        c_out = store.column(model_key, "cost_used_usd")
+        if not np.isnan(c_in).all():
+            tot_in = float(np.nansum(c_in))
+            tot_out = float(np.nansum(c_out))
+            share = tot_in / (tot_in + tot_out) if tot_in + tot_out else float("nan")
+            line += (f"; cost input ${tot_in:.4f} + output ${tot_out:.4f} = ${tot_in + tot_out:.4f} "
+                     f"(input {share * 100:.1f}%, ${(tot_in + tot_out) / n_conv:.5f}/conversation)")
+        print(line)
+
+def write_paired_tests_csv(results: List[PairedResult], out_path: str) -> None:
+    import csv
+    with open(out_path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(PairedResult._fields)
+        w.writerows(results)
+    print(f"Wrote: {out_path}")
+
 def ensure_dir(p: str) -> None:
     Path(p).mkdir(parents=True, exist_ok=True)
 
 def _clean(values: List[float]) -> List[float]:
     return [v for v in values if v is not None and not (isinstance(v, float) and math.isnan(v))]
 
+def _pyplot():
+    """pyplot on the headless Agg backend, imported on first use (CSV-only runs never load it)."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
 def save_boxplot(values_by_model: Dict[str, List[float]], title: str, ylabel: str, out_png: str) -> None:
     """Boxplot com cores distintas e rótulos em PT-BR."""
+    plt = _pyplot()
     order = [k for k in ("gpt", "gemini") if k in values_by_model]
     data = [_clean(values_by_model[k]) for k in order]
     labels = [MODEL_LABELS.get(k, k) for k in order]
@@ -386,11 +818,12 @@ def save_boxplot(values_by_model: Dict[str, List[float]], title: str, ylabel: st
     plt.ylabel(ylabel)
     plt.grid(True, axis="y", alpha=0.25)
     plt.tight_layout()
-    plt.savefig(out_png, dpi=220)
+    plt.savefig(out_png, dpi=PLOT_DPI)
     plt.close()
 
 def save_hist_models(values_by_model: Dict[str, List[float]], title: str, xlabel: str, out_png: str, bins: int = 20) -> None:
     """Histograma sobreposto (um por modelo) + legenda."""
+    plt = _pyplot()
     plt.figure()
     for k in ("gpt", "gemini"):
         if k not in values_by_model:
@@ -406,7 +839,7 @@ def save_hist_models(values_by_model: Dict[str, List[float]], title: str, xlabel
     plt.grid(True, axis="y", alpha=0.25)
     plt.legend()
     plt.tight_layout()
-    plt.savefig(out_png, dpi=220)
+    plt.savefig(out_png, dpi=PLOT_DPI)
     plt.close()
 
 def save_scatter_models(
@@ -418,6 +851,7 @@ def save_scatter_models(
     out_png: str,
 ) -> None:
     """Dispersão com os dois modelos no mesmo gráfico + legenda."""
+    plt = _pyplot()
     plt.figure()
     for k in ("gpt", "gemini"):
         if k not in x_by_model or k not in y_by_model:
@@ -447,19 +881,158 @@ def save_scatter_models(
     plt.grid(True, alpha=0.25)
     plt.legend()
     plt.tight_layout()
-    plt.savefig(out_png, dpi=220)
+    plt.savefig(out_png, dpi=PLOT_DPI)
     plt.close()
 
 
+# -----------------------------
+# Figure rendering (selected, cached, optionally in a process pool)
+# -----------------------------
+
+PLOT_DPI = 220
+FIGURE_MANIFEST = "figures_manifest.json"
+PLOT_NAMES = (
+    "decision_turn_box",
+    "output_tokens_box",
+    "output_tokens_hist",
+    "cost_box",
+    "repetitiveness_box",
+    "decision_vs_tokens",
+    "qual",
+    "upstream_latency_box",
+    "time_to_decision_box",
+    "total_cost_box",
+)
+
+class FigureJob(NamedTuple):
+    name: str              # selector key (PLOT_NAMES) for --plots
+    kind: str              # "box" | "hist" | "scatter"
+    args: Tuple[Any, ...]  # positional args of the save_* function, without out_png
+    out_png: str
+
+def _plain(x: Any) -> Any:
+    """Arrays -> lists, so jobs pickle cheaply and hash the same way every run."""
+    if isinstance(x, dict):
+        return {k: _plain(v) for k, v in x.items()}
+    if isinstance(x, (list, tuple)):
+        return [_plain(v) for v in x]
+    if isinstance(x, np.ndarray):
+        return x.tolist()
+    return x
+
+def figure_job(name: str, kind: str, *args: Any, out_png: str) -> FigureJob:
+    return FigureJob(name, kind, tuple(_plain(a) for a in args), out_png)
+
+def figure_digest(job: FigureJob) -> str:
+    import hashlib
+    import json
+    payload = [job.kind, job.args, PLOT_DPI, MODEL_LABELS, MODEL_COLORS, MODEL_MARKERS]
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def _render(job: FigureJob) -> None:
+    funcs = {"box": save_boxplot, "hist": save_hist_models, "scatter": save_scatter_models}
+    funcs[job.kind](*job.args, out_png=job.out_png)
+
+def render_figures(
+    jobs: List[FigureJob],
+    output_dir: str,
+    selected: Optional[set] = None,
+    workers: int = 1,
+) -> None:
+    """
+    Renders the selected jobs. A figure whose inputs (data, labels, style,
+    dpi) hash the same as in the last run and whose PNG still exists is
+    skipped. With workers > 1 the figures are rendered in a process pool.
+    """
+    import json
+
+    jobs = [j for j in jobs if selected is None or j.name in selected]
+    if not jobs:
+        return
+    path = os.path.join(output_dir, FIGURE_MANIFEST)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            known = json.load(f)
+    except (OSError, ValueError):
+        known = {}
+    digests = {j.out_png: figure_digest(j) for j in jobs}
+    todo = [j for j in jobs if known.get(j.out_png) != digests[j.out_png] or not os.path.exists(j.out_png)]
+
+    if workers > 1 and len(todo) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(workers, len(todo))) as pool:
+            list(pool.map(_render, todo))
+    else:
+        for j in todo:
+            _render(j)
+
+    known.update(digests)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(known, f, indent=1)
+    os.replace(tmp, path)
+    print(f"Figures: {len(todo)} rendered, {len(jobs) - len(todo)} unchanged")
+
+
+UNITS_DIR = "unidades_indice"
+DEFAULT_INPUT_GLOBS = (
+    r"D:\FURG 2025\TCC\parte pratica\IA user\JSON_Conversas\indice.jsonl",
+    r"D:\FURG 2025\TCC\parte pratica\IA user\JSON_Conversas\conversa_*.json",
+)
+
+def input_units(patterns: List[str], where: List[str], output_dir: str) -> List[Tuple[str, str]]:
+    """
+    (path, source id) of every unit of work (conversations.expand_inputs):
+    conversation files as they are, and every matched shard index, filtered
+    by --where if given, split into per-shard unit indexes under
+    output_dir/unidades_indice. Each unit is one task for the pool and one
+    entry in the metrics cache, so a save only invalidates its own unit.
+    """
+    criteria = {}
+    for item in where:
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise SystemExit(f"--where expects FIELD=VALUE, got {item!r}")
+        criteria[key.strip()] = value.strip()
+    try:
+        units = expand_inputs(patterns, os.path.join(output_dir, UNITS_DIR), criteria or None)
+    except ValueError:
+        raise SystemExit(f"--where needs --input_glob to match a {INDEX_NAME}")
+    if not units:
+        raise SystemExit(f"No indexed records match {criteria}" if criteria else f"No files matched: {', '.join(patterns)}")
+    if criteria:
+        records = 0
+        for path, _ in units:
+            with open(path, "rb") as f:
+                records += sum(1 for _ in f)
+        print(f"Selected {records} indexed records ({len(units)} units)")
+    return units
+
+
 # -----------------------------
 # Main
 # -----------------------------
 
 def main() -> None:
     ap = argparse.ArgumentParser()
-    ap.add_argument("--input_glob", default=r"D:\FURG 2025\TCC\parte pratica\IA user\JSON_Conversas\conversa_*.json", help="Glob for JSON logs")
+    ap.add_argument("--input_glob", action="append", default=None,
+                    help="Glob for JSON logs or a shard index (repeatable; default: indice.jsonl + the old "
+                         "conversa_*.json, each conversation once)")
     ap.add_argument("--output_dir", default=r"D:\FURG 2025\TCC\parte pratica\IA user\JSON_Conversas\out")
     ap.add_argument("--max_turns", type=int, default=None, help="Optional cap of turns per conversation file")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Processes for parsing + per-model metrics (output is identical to the serial run)")
+    ap.add_argument("--no_cache", action="store_true",
+                    help="Ignore the per-file metrics manifest in output_dir and recompute everything")
+
+    ap.add_argument("--tokenizer", choices=["approx", "tiktoken"], default="approx",
+                    help="Output-token counting: approx (len/4) or tiktoken (same counts the servers log)")
+    ap.add_argument("--gpt_encoding", default=DEFAULT_ENCODINGS["gpt"],
+                    help="tiktoken model or encoding name for the GPT leg")
+    ap.add_argument("--gemini_encoding", default=DEFAULT_ENCODINGS["gemini"],
+                    help="tiktoken model or encoding name for the Gemini leg")
+    ap.add_argument("--token_cache", default=None,
+                    help=f"SQLite token-count cache shared across runs (default: <output_dir>/{TOKEN_CACHE_NAME})")
 
     ap.add_argument("--decision_classes", default=",".join(DECISION_CLASSES_DEFAULT),
                     help="Comma-separated class labels that indicate a decision (default: Qualificado,Desqualificado)")
@@ -469,6 +1042,54 @@ def main() -> None:
     ap.add_argument("--gpt_out_per_m", type=float, default=None)
     ap.add_argument("--gemini_out_per_m", type=float, default=None)
 
+    # Input side: rebuilt payload (system prompt + recent context + entrada) per turn.
+    # Input prices in IA user/nota.md: GPT = 0.40 ; Gemini 2.5 Flash = 0.30
+    ap.add_argument("--input_tokens", action="store_true",
+                    help="Reconstruct and count the input tokens of every turn (input_tokens.py); writes cost_per_turn.csv")
+    ap.add_argument("--gpt_in_per_m", type=float, default=None)
+    ap.add_argument("--gemini_in_per_m", type=float, default=None)
+    ap.add_argument("--prompts_dir", default=DEFAULT_PROMPTS_DIR,
+                    help="Folder with promptGPT.md / promptGEM.md (system prompts of the legs)")
+
+    # Near-duplicate / boilerplate reports
+    ap.add_argument("--near_duplicates", action="store_true",
+                    help="Write near_duplicates_within.csv and boilerplate_report.csv (MinHash/LSH)")
+    ap.add_argument("--dup_threshold", type=float, default=0.7,
+                    help="Estimated Jaccard above which two messages are near-duplicates")
+    ap.add_argument("--boilerplate_min_conversations", type=int, default=3,
+                    help="Minimum number of conversations a cluster must appear in to be reported")
+
+    # Latency (timestamps)
+    ap.add_argument("--latency", action="store_true",
+                    help="Write latency_*.csv: turn gaps, upstream (n8n) windows, time-to-decision, throughput")
+    ap.add_argument("--latency_window_min", type=float, default=10.0,
+                    help="Window (minutes) for the turns/minute throughput table")
+
+    # Shard index selection
+    ap.add_argument("--where", action="append", default=[], metavar="FIELD=VALUE",
+                    help="Filter the records of a matched indice.jsonl (repeatable; see conversations.filter_index)")
+
+    # Paired tests
+    ap.add_argument("--n_resamples", type=int, default=10_000,
+                    help="Bootstrap / permutation resamples for the paired tests")
+    ap.add_argument("--seed", type=int, default=0, help="RNG seed for the paired tests")
+    ap.add_argument("--correction", choices=["holm", "bh", "none"], default="holm",
+                    help="Multiple-comparison correction across the paired metrics")
+
+    # Sharded analysis (map/reduce)
+    ap.add_argument("--map_partial", default=None,
+                    help="Map step: analyze this node's --input_glob, write a partial-aggregate file (.npz) and exit")
+    ap.add_argument("--reduce_glob", default=None,
+                    help="Reduce step: merge partial files matching this glob instead of reading conversations")
+    ap.add_argument("--node", default=None,
+                    help="Map step: tag of this node in the partial (default: the --map_partial file name)")
+
+    # Figures
+    ap.add_argument("--no_plots", "--no-plots", action="store_true",
+                    help="Skip all figures (CSVs, store and tests only; matplotlib is never imported)")
+    ap.add_argument("--plots", default=None,
+                    help="Comma-separated subset of figures to render: " + ",".join(PLOT_NAMES))
+
     # Qualitative workflow
     ap.add_argument("--export_annotation_template", default=None,
                     help="If set, exports a CSV template for human qualitative annotation and exits.")
@@ -478,59 +1099,89 @@ def main() -> None:
     args = ap.parse_args()
 
     ensure_dir(args.output_dir)
+    plots: Optional[set] = None  # None = all figures
+    if args.no_plots:
+        plots = set()
+    elif args.plots:
+        plots = {p.strip() for p in args.plots.split(",") if p.strip()}
+        unknown = plots - set(PLOT_NAMES)
+        if unknown:
+            raise SystemExit(f"Unknown --plots entries: {', '.join(sorted(unknown))} (choose from {', '.join(PLOT_NAMES)})")
     decision_classes = [c.strip() for c in args.decision_classes.split(",") if c.strip()]
 
-    paths = sorted(glob.glob(args.input_glob))
-    if not paths:
-        raise SystemExit(f"No files matched: {args.input_glob}")
-
-    rows = []  # per (conversation, model)
-    paired = []  # per conversation, both models
-
-    for p in paths:
-        hist = load_conversation_file(p)
-        conv_id = Path(p).name
-
-        g = compute_metrics_for_model(
-            hist, "gpt", decision_classes, args.gpt_out_per_m, max_turns=args.max_turns
-        )
-        m = compute_metrics_for_model(
-            hist, "gemini", decision_classes, args.gemini_out_per_m, max_turns=args.max_turns
-        )
-
-        # assistant final msg (USED segment)
-        def final_msg(model_key: str, mm: ModelMetrics) -> str:
-            used_end = mm.turns_used - 1
-            if used_end < 0:
-                return ""
-            return (hist[used_end].get(model_key) or {}).get("msg") or ""
-
-        rows.append({
-            "conversation_id": conv_id,
-            "model": "gpt",
-            **g.__dict__,
-            "assistant_final_msg": final_msg("gpt", g),
-        })
-        rows.append({
-            "conversation_id": conv_id,
-            "model": "gemini",
-            **m.__dict__,
-            "assistant_final_msg": final_msg("gemini", m),
-        })
+    params = AnalysisParams(
+        decision_classes=tuple(decision_classes),
+        gpt_out_per_m=args.gpt_out_per_m,
+        gemini_out_per_m=args.gemini_out_per_m,
+        max_turns=args.max_turns,
+        tokenizer=args.tokenizer,
+        gpt_encoding=args.gpt_encoding,
+        gemini_encoding=args.gemini_encoding,
+        input_tokens=args.input_tokens,
+        gpt_in_per_m=args.gpt_in_per_m,
+        gemini_in_per_m=args.gemini_in_per_m,
+        prompts_digest=prompts_digest(load_system_prompts(args.prompts_dir)) if args.input_tokens else "",
+        token_cache=args.token_cache or os.path.join(args.output_dir, TOKEN_CACHE_NAME),
+        prompts_dir=args.prompts_dir,
+    )
 
-        paired.append({
-            "conversation_id": conv_id,
-            "gpt_decision_turn": g.decision_turn,
-            "gemini_decision_turn": m.decision_turn,
-            "gpt_output_tokens_used": g.output_tokens_used,
-            "gemini_output_tokens_used": m.output_tokens_used,
-            "gpt_cost_used_usd": g.cost_used_usd,
-            "gemini_cost_used_usd": m.cost_used_usd,
-            "gpt_repetitiveness_used": g.repetitiveness_used,
-            "gemini_repetitiveness_used": m.repetitiveness_used,
-            "gpt_avg_words_used": g.avg_words_used,
-            "gemini_avg_words_used": m.avg_words_used,
-        })
+    near_dups: Optional[Tuple[List[Dict[str, Any]], List[MessageRef], np.ndarray]] = None
+    latency: Optional[Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Dict[str, str]]] = None
+    dup_threshold = args.dup_threshold
+    if args.reduce_glob:
+        partial_paths = sorted(glob.glob(args.reduce_glob))
+        if not partial_paths:
+            raise SystemExit(f"No partials matched: {args.reduce_glob}")
+        try:
+            merged = merge_partials([load_partial(p) for p in partial_paths])
+        except ValueError as e:
+            raise SystemExit(str(e))
+        if merged["fingerprint"] != repr(params):
+            print(f"Note: partials were computed with {merged['fingerprint']}")
+        rows, paired, turn_metrics = flatten_results([g["results"] for g in merged["groups"]])
+        print(f"Merged {len(partial_paths)} partials: {len(merged['groups'])} sources, {len(paired)} conversations")
+        print("\n=== Corpus summary (merged partial aggregates) ===")
+        for line in format_summary(merged["summary"]):
+            print(line)
+        if merged["near_dups"]:
+            nd = merged["near_dups"]
+            near_dups = (nd["within"], [MessageRef(*r) for r in nd["refs"]], merged["signatures"])
+            dup_threshold = nd["threshold"]
+        if args.latency:
+            print("Note: --latency needs the conversation files; not available when reducing partials")
+    else:
+        units = input_units(args.input_glob or list(DEFAULT_INPUT_GLOBS), args.where, args.output_dir)
+        paths = [p for p, _ in units]
+        manifest = None if args.no_cache else MetricsManifest(args.output_dir, repr(params))
+        per_file = analyze_files(paths, params, workers=args.workers, manifest=manifest)
+        rows, paired, turn_metrics = flatten_results(per_file)
+        if args.near_duplicates:
+            near_dups = collect_near_duplicates(paths, params, rows, dup_threshold)
+        if args.latency:
+            latency = collect_latency(paths, params, rows)
+
+        if args.map_partial:
+            nd_meta = None
+            signatures = None
+            if near_dups is not None:
+                within, refs, signatures = near_dups
+                # examples only need the start of the text; keeps partials compact
+                nd_meta = {
+                    "threshold": dup_threshold,
+                    "within": within,
+                    "refs": [list(r._replace(text=" ".join(r.text.split())[:300])) for r in refs],
+                }
+            save_partial(
+                args.map_partial,
+                repr(params),
+                [{"source": source, "results": res} for (_, source), res in zip(units, per_file)],
+                summarize(rows, turn_metrics),
+                near_dups=nd_meta,
+                signatures=signatures,
+                node=args.node or default_node(args.map_partial),
+            )
+            print(f"Wrote partial: {args.map_partial} ({len(paths)} files, {len(paired)} conversations)")
+            return
 
     # Optionally export annotation template and exit
     if args.export_annotation_template:
@@ -552,32 +1203,23 @@ def main() -> None:
 
     paired_csv = os.path.join(args.output_dir, "paired_metrics_trimmed.csv")
     with open(paired_csv, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=sorted(paired[0].keys()))
+        w = csv.DictWriter(f, fieldnames=sorted({k for r in paired for k in r.keys()}))
         w.writeheader()
         for r in paired:
             w.writerow(r)
     print(f"Wrote: {paired_csv}")
 
-    # Summaries
-    def by_model(key: str) -> Dict[str, List[float]]:
-        out: Dict[str, List[float]] = {"gpt": [], "gemini": []}
-        for r in rows:
-            v = r.get(key)
-            if isinstance(v, bool):
-                v = float(v)
-            if v is None:
-                continue
-            try:
-                out[r["model"]].append(float(v))
-            except Exception:
-                pass
-        return out
+    if params.input_tokens:
+        write_cost_per_turn_csv(rows, turn_metrics, params, os.path.join(args.output_dir, "cost_per_turn.csv"))
+
+    # Columnar store (written next to the CSVs, read back memory-mapped);
+    # every summary, test and plot below reads from it.
+    store_dir = MetricsStore.from_results(rows, turn_metrics).save(args.output_dir)
+    print(f"Wrote: {store_dir}")
+    store = MetricsStore.load(args.output_dir, mmap=True)
 
     # Decision rate (decision exists in trimmed segment)
-    decision_rate = {}
-    for model in ["gpt", "gemini"]:
-        convs = [r for r in rows if r["model"] == model]
-        decision_rate[model] = sum(1 for r in convs if r.get("decision_turn") is not None) / max(1, len(convs))
+    decision_rate = {model: store.decision_rate(model) for model in ["gpt", "gemini"]}
 
     # Basic prints
     print("\n=== Decision Rate (within observed turns, post-decision excluded from metrics) ===")
@@ -586,93 +1228,96 @@ def main() -> None:
 
     # Stats + plots (TRIMMED)
     # decision_turn
-    dt = by_model("decision_turn")
-    save_boxplot(dt, "Turno de decisão (cortado na decisão)", "Índice do turno", os.path.join(args.output_dir, "decision_turn_box_trimmed.png"))
+    figures: List[FigureJob] = []
+    dt = store.by_model("decision_turn")
+    figures.append(figure_job("decision_turn_box", "box", dt, "Turno de decisão (cortado na decisão)", "Índice do turno",
+                              out_png=os.path.join(args.output_dir, "decision_turn_box_trimmed.png")))
 
     # output_tokens_used
-    tok = by_model("output_tokens_used")
-    save_boxplot(tok, "Tokens de saída (apenas trecho até a decisão)", "Tokens de saída (aprox.)", os.path.join(args.output_dir, "output_tokens_box_trimmed.png"))
-    save_hist_models(tok, "Distribuição de tokens de saída (até a decisão)", "Tokens de saída (aprox.)", os.path.join(args.output_dir, "output_tokens_hist_trimmed.png"))
+    tok = store.by_model("output_tokens_used")
+    tok_label = "Tokens de saída (aprox.)" if args.tokenizer == "approx" else "Tokens de saída (tiktoken)"
+    figures.append(figure_job("output_tokens_box", "box", tok, "Tokens de saída (apenas trecho até a decisão)", tok_label,
+                              out_png=os.path.join(args.output_dir, "output_tokens_box_trimmed.png")))
+    figures.append(figure_job("output_tokens_hist", "hist", tok, "Distribuição de tokens de saída (até a decisão)", tok_label,
+                              out_png=os.path.join(args.output_dir, "output_tokens_hist_trimmed.png")))
 
     # cost (output-only)
     if args.gpt_out_per_m is not None and args.gemini_out_per_m is not None:
-        cost = by_model("cost_used_usd")
-        save_boxplot(cost, "Custo estimado (USD) — somente saída (até a decisão)", "USD", os.path.join(args.output_dir, "cost_box_trimmed.png"))
+        cost = store.by_model("cost_used_usd")
+        figures.append(figure_job("cost_box", "box", cost, "Custo estimado (USD) — somente saída (até a decisão)", "USD",
+                                  out_png=os.path.join(args.output_dir, "cost_box_trimmed.png")))
+
+    # input side + total (input + output) cost
+    if params.input_tokens:
+        inp = store.by_model("input_tokens_used")
+        print_cost_breakdown(store)
+        total = store.by_model("total_cost_used_usd")
+        if not all(np.isnan(v).all() for v in total.values()):
+            figures.append(figure_job("total_cost_box", "box", total, "Custo total estimado (USD) — entrada + saída (até a decisão)",
+                                      "USD", out_png=os.path.join(args.output_dir, "total_cost_box_trimmed.png")))
 
     # repetitiveness
-    rep = by_model("repetitiveness_used")
-    save_boxplot(rep, "Repetição entre respostas (Jaccard) — até a decisão", "Similaridade Jaccard", os.path.join(args.output_dir, "repetitiveness_box_trimmed.png"))
+    rep = store.by_model("repetitiveness_used")
+    figures.append(figure_job("repetitiveness_box", "box", rep, "Repetição entre respostas (Jaccard) — até a decisão",
+                              "Similaridade Jaccard", out_png=os.path.join(args.output_dir, "repetitiveness_box_trimmed.png")))
 
     # Outliers (IQR) on output_tokens_used + cost
-    gpt_tok_out = iqr_outlier_flags([r.get("output_tokens_used") for r in rows if r["model"] == "gpt"])
-    gem_tok_out = iqr_outlier_flags([r.get("output_tokens_used") for r in rows if r["model"] == "gemini"])
-
-    # Optional paired Wilcoxon
-    g_dt = [r["gpt_decision_turn"] if r["gpt_decision_turn"] is not None else float("nan") for r in paired]
-    m_dt = [r["gemini_decision_turn"] if r["gemini_decision_turn"] is not None else float("nan") for r in paired]
-    g_tok = [float(r["gpt_output_tokens_used"]) for r in paired]
-    m_tok = [float(r["gemini_output_tokens_used"]) for r in paired]
-
-    print("\n=== Paired tests (Wilcoxon, if available) ===")
-    res = try_wilcoxon_paired(g_dt, m_dt)
-    if res:
-        stat, p = res
-        print(f"decision_turn: stat={stat:.3f} p={p:.4g}")
-    else:
-        print("decision_turn: (wilcoxon unavailable or too few paired samples)")
-
-    res = try_wilcoxon_paired(g_tok, m_tok)
-    if res:
-        stat, p = res
-        print(f"output_tokens_used: stat={stat:.3f} p={p:.4g}")
-    else:
-        print("output_tokens_used: (wilcoxon unavailable or too few paired samples)")
-
+    gpt_tok_out = iqr_outlier_flags(tok["gpt"].tolist())
+    gem_tok_out = iqr_outlier_flags(tok["gemini"].tolist())
+
+    # Paired tests over every paired metric in one batched call (store columns are aligned by conversation)
+    paired_inputs = {
+        "decision_turn": (dt["gpt"], dt["gemini"]),
+        "output_tokens_used": (tok["gpt"], tok["gemini"]),
+    }
     if args.gpt_out_per_m is not None and args.gemini_out_per_m is not None:
-        g_cost = [r["gpt_cost_used_usd"] for r in paired]
-        m_cost = [r["gemini_cost_used_usd"] for r in paired]
-        res = try_wilcoxon_paired([float(x) for x in g_cost], [float(x) for x in m_cost])
-        if res:
-            stat, p = res
-            print(f"cost_used_usd: stat={stat:.3f} p={p:.4g}")
-        else:
-            print("cost_used_usd: (wilcoxon unavailable or too few paired samples)")
-
-    # Scatter: decision_turn vs tokens used
-    # Convert Nones to NaN to keep alignment
-    def conv_list(model: str, key: str) -> List[float]:
-        out = []
-        for r in rows:
-            if r["model"] != model:
-                continue
-            v = r.get(key)
-            if v is None:
-                out.append(float("nan"))
-            else:
-                out.append(float(v))
-        return out
-
-    # We want aligned by conversation. Build per conversation map:
-    per_conv = {}
-    for r in rows:
-        per_conv.setdefault(r["conversation_id"], {})[r["model"]] = r
-    x_g, y_g, x_m, y_m = [], [], [], []
-    for cid, d in per_conv.items():
-        if "gpt" in d:
-            x_g.append(d["gpt"].get("decision_turn") if d["gpt"].get("decision_turn") is not None else float("nan"))
-            y_g.append(float(d["gpt"].get("output_tokens_used", float("nan"))))
-        if "gemini" in d:
-            x_m.append(d["gemini"].get("decision_turn") if d["gemini"].get("decision_turn") is not None else float("nan"))
-            y_m.append(float(d["gemini"].get("output_tokens_used", float("nan"))))
-
-    save_scatter_models(
-        {"gpt": x_g, "gemini": x_m},
-        {"gpt": y_g, "gemini": y_m},
+        paired_inputs["cost_used_usd"] = (cost["gpt"], cost["gemini"])
+    if params.input_tokens:
+        paired_inputs["input_tokens_used"] = (inp["gpt"], inp["gemini"])
+        if not all(np.isnan(v).all() for v in total.values()):
+            paired_inputs["total_cost_used_usd"] = (total["gpt"], total["gemini"])
+    paired_inputs["repetitiveness_used"] = (rep["gpt"], rep["gemini"])
+    words = store.by_model("avg_words_used")
+    paired_inputs["avg_words_used"] = (words["gpt"], words["gemini"])
+    tests = paired_tests(paired_inputs, n_resamples=args.n_resamples, seed=args.seed, correction=args.correction)
+
+    print(f"\n=== Paired tests, GPT - Gemini (bootstrap CI, permutation, Wilcoxon; {args.correction}-adjusted) ===")
+    for r in tests:
+        print(format_result(r))
+    write_paired_tests_csv(tests, os.path.join(args.output_dir, "paired_tests_trimmed.csv"))
+
+    # Scatter: decision_turn vs tokens used (NaN keeps the per-conversation alignment)
+    figures.append(figure_job(
+        "decision_vs_tokens",
+        "scatter",
+        dt,
+        tok,
         "Turno de decisão vs tokens de saída (até a decisão)",
         "Turno de decisão",
-        "Tokens de saída (aprox.)",
-        os.path.join(args.output_dir, "decisao_vs_tokens_trimmed.png"),
-    )
+        tok_label,
+        out_png=os.path.join(args.output_dir, "decisao_vs_tokens_trimmed.png"),
+    ))
+    if latency is not None:
+        lat_turns, lat_convs, _ = latency
+        upstream = {m: [r[f"{m}_upstream_s"] for r in lat_turns if r[f"{m}_upstream_s"] is not None]
+                    for m in ("gpt", "gemini")}
+        ttd = {m: [r["time_to_decision_s"] for r in lat_convs if r["model"] == m and r["time_to_decision_s"] is not None]
+               for m in ("gpt", "gemini")}
+        if any(upstream.values()):
+            figures.append(figure_job("upstream_latency_box", "box", upstream, "Latência do n8n por turno (janela da chamada)",
+                                      "Segundos", out_png=os.path.join(args.output_dir, "upstream_latency_box.png")))
+        figures.append(figure_job("time_to_decision_box", "box", ttd, "Tempo até a decisão", "Segundos",
+                                  out_png=os.path.join(args.output_dir, "time_to_decision_box.png")))
+    render_figures(figures, args.output_dir, selected=plots, workers=args.workers)
+
+    if near_dups is not None:
+        within, refs, sigs_all = near_dups
+        write_near_duplicate_reports(
+            within, refs, sigs_all, args.output_dir, dup_threshold, args.boilerplate_min_conversations
+        )
+
+    if latency is not None:
+        write_latency_reports(*latency, args.output_dir, args.latency_window_min)
 
     # -------------------------
     # Qualitative analysis
@@ -699,17 +1344,19 @@ def main() -> None:
                     dim_by_model[d][model].append(v)
 
         print("\n=== Qualitative scores (from ratings_csv) ===")
+        qual_figures: List[FigureJob] = []
         for d in dims:
             gvals = dim_by_model[d]["gpt"]
             mvals = dim_by_model[d]["gemini"]
             print(f"\n[{d}]")
             print(f"  gpt   n={len(gvals)} mean={safe_mean(gvals):.3f} median={safe_median(gvals):.3f} sd={safe_stdev(gvals):.3f}")
             print(f"  gemini n={len(mvals)} mean={safe_mean(mvals):.3f} median={safe_median(mvals):.3f} sd={safe_stdev(mvals):.3f}")
-            save_boxplot({"gpt": gvals, "gemini": mvals},
-                         f"Avaliação qualitativa: {d}", d, os.path.join(args.output_dir, f"qual_{d}_box.png"))
+            qual_figures.append(figure_job("qual", "box", {"gpt": gvals, "gemini": mvals}, f"Avaliação qualitativa: {d}", d,
+                                           out_png=os.path.join(args.output_dir, f"qual_{d}_box.png")))
+        render_figures(qual_figures, args.output_dir, selected=plots, workers=args.workers)
 
         # If the CSV contains per-conversation paired rows (same conversation_id for both models),
-        # you can also compute paired Wilcoxon per dimension:
+        # the dimensions are also tested pairwise:
         by_cid = {}
         for r in ratings:
             cid = r.get("conversation_id")
@@ -718,23 +1365,18 @@ def main() -> None:
                 continue
             by_cid.setdefault(cid, {})[model] = r
 
-        print("\n=== Qualitative paired tests (Wilcoxon, if available) ===")
-        for d in dims:
-            a, b = [], []
-            for cid, dd in by_cid.items():
-                if "gpt" in dd and "gemini" in dd:
-                    va = to_float(dd["gpt"].get(d))
-                    vb = to_float(dd["gemini"].get(d))
-                    if va is not None and vb is not None:
-                        a.append(va); b.append(vb)
-            res = try_wilcoxon_paired(a, b)
-            if res:
-                stat, p = res
-                print(f"{d}: stat={stat:.3f} p={p:.4g} (n={len(a)})")
-            else:
-                print(f"{d}: (wilcoxon unavailable or too few paired samples) (n={len(a)})")
-
-        print(f"\nQualitative plots written to: {args.output_dir}")
+        both = [dd for dd in by_cid.values() if "gpt" in dd and "gemini" in dd]
+        qual_tests = paired_tests(
+            {d: ([to_float(dd["gpt"].get(d)) for dd in both], [to_float(dd["gemini"].get(d)) for dd in both]) for d in dims},
+            n_resamples=args.n_resamples, seed=args.seed, correction=args.correction,
+        )
+        print(f"\n=== Qualitative paired tests, GPT - Gemini ({args.correction}-adjusted) ===")
+        for r in qual_tests:
+            print(format_result(r))
+        write_paired_tests_csv(qual_tests, os.path.join(args.output_dir, "qual_paired_tests.csv"))
+
+        if plots is None or "qual" in plots:
+            print(f"\nQualitative plots written to: {args.output_dir}")
         # Inter-rater agreement (optional): if you have exactly 2 annotators and provide "annotator"
         # with the same conversation_id+model rows, we compute simple Cohen's kappa for binary correctness,
         # and weighted kappa (approx) is NOT implemented (keep it simple + defensible).
@@ -799,7 +1441,8 @@ def main() -> None:
                         print(f"{model}: accuracy={safe_mean(acc[model]):.3f} (n={len(acc[model])})")
 
 
-    print(f"\nAll plots written to: {args.output_dir}")
+    if plots is None or plots:
+        print(f"\nAll plots written to: {args.output_dir}")
 
 
 if __name__ == "__main__":
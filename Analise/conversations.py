@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Unified loader for every conversation log the project writes.
+
+Supported inputs (detected per file):
+- IA user     (IA user/app.py):    {"historico": [{user_simulado, gpt: {msg, class}, gemini: {msg, class}}]}
+                                     (newer logs also carry "recebido" and gpt/gemini "inicio"/"fim")
+- Human user  (Human user/app.py): {"conversation": [{user_input, gpt_response, gemini_response,
+                                     gpt_classificacao?, gem_classificacao?, tokens}]}
+- JSONL turn logs: one turn per line, in either of the two turn shapes above.
+- Record shards (IA user/armazenamento.py): `AAAA/MM/DD/conversas.jsonl.gz` (or
+  `.zst`), one compressed IA user record {"id", "historico", ...} per line; each
+  record is one conversation, identified by its id.
+- The shard index `indice.jsonl`: one line per record with its shard, byte
+  offset and size; only the listed records are read (seek + decompress), so a
+  filtered index (see read_index / filter_index / write_index) selects a subset
+  of the corpus without scanning it. split_index cuts an index into per-shard
+  unit indexes (`*_indice.jsonl`) for the process pool and the metrics cache;
+  expand_inputs resolves the input globs of the analysis tools (index + old
+  files, each conversation once).
+
+Everything is normalized to `Turn`, a flat NamedTuple, and conversations are
+yielded lazily so a large corpus is never held in memory at once.
+
+In Human user logs a "reset" input clears the server memory, so it is treated
+as a conversation boundary: the file yields one conversation per segment
+(`file.json`, `file.json#1`, ...). The reset turn itself is dropped.
+"""
+
+from __future__ import annotations
+
+import glob
+import gzip
+import io
+import json
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+try:  # optional, ~3-5x faster parsing on large corpora
+    import orjson  # type: ignore
+
+    def _loads(raw: bytes) -> Any:
+        return orjson.loads(raw)
+except ImportError:  # pragma: no cover - depends on environment
+    def _loads(raw: bytes) -> Any:
+        return json.loads(raw)
+
+try:  # optional, only needed for .zst shards
+    import zstandard  # type: ignore
+except ImportError:  # pragma: no cover - depends on environment
+    zstandard = None
+
+INDEX_NAME = "indice.jsonl"
+SHARD_SUFFIXES = (".gz", ".zst")
+INDEX_UNIT_RECORDS = 200  # records per unit index (see split_index)
+
+
+class Turn(NamedTuple):
+    timestamp: str
+    loop: Optional[int]
+    user: str
+    gpt_msg: str
+    gpt_class: str
+    gemini_msg: str
+    gemini_class: str
+    # Timing recorded by the IA user server (ISO strings, "" in older logs):
+    # request received, and the upstream (n8n) call window of each leg that answered.
+    received: str = ""
+    gpt_start: str = ""
+    gpt_end: str = ""
+    gemini_start: str = ""
+    gemini_end: str = ""
+
+    def msg(self, model_key: str) -> str:
+        return self.gpt_msg if model_key == "gpt" else self.gemini_msg
+
+    def cls(self, model_key: str) -> str:
+        return self.gpt_class if model_key == "gpt" else self.gemini_class
+
+    def window(self, model_key: str) -> Tuple[str, str]:
+        """(start, end) of the leg's upstream call; ("", "") if not recorded."""
+        return (self.gpt_start, self.gpt_end) if model_key == "gpt" else (self.gemini_start, self.gemini_end)
+
+
+class Conversation(NamedTuple):
+    conversation_id: str
+    source: str  # "ia_user" | "human_user" | "jsonl"
+    turns: List[Turn]
+    meta: Dict[str, Any]  # e.g. {"experimento": {...}} from the experiment runner
+
+
+def _s(x: Any) -> str:
+    return x if isinstance(x, str) else ("" if x is None else str(x))
+
+def normalize_turn(raw: Dict[str, Any], index: int = 0) -> Turn:
+    """Maps one turn of either schema to a Turn."""
+    gpt = raw.get("gpt")
+    if isinstance(gpt, dict) or isinstance(raw.get("gemini"), dict):
+        gem = raw.get("gemini") or {}
+        gpt = gpt or {}
+        loop = raw.get("loop")
+        return Turn(
+            _s(raw.get("timestamp")),
+            loop if isinstance(loop, int) else index,
+            _s(raw.get("user_simulado") or raw.get("input")),
+            _s(gpt.get("msg")), _s(gpt.get("class")),
+            _s(gem.get("msg")), _s(gem.get("class")),
+            _s(raw.get("recebido")),
+            _s(gpt.get("inicio")), _s(gpt.get("fim")),
+            _s(gem.get("inicio")), _s(gem.get("fim")),
+        )
+    return Turn(
+        _s(raw.get("timestamp")),
+        index,
+        _s(raw.get("user_input")),
+        _s(raw.get("gpt_response")), _s(raw.get("gpt_classificacao")),
+        _s(raw.get("gemini_response")), _s(raw.get("gem_classificacao")),
+    )
+
+def _is_reset(raw: Dict[str, Any]) -> bool:
+    return _s(raw.get("user_input")).strip().lower() == "reset"
+
+def _segments(raw_turns: List[Dict[str, Any]], conv_id: str, source: str, meta: Dict[str, Any]) -> Iterator[Conversation]:
+    seg: List[Turn] = []
+    n = 0
+    for raw in raw_turns:
+        if not isinstance(raw, dict):
+            continue
+        if _is_reset(raw):
+            if seg:
+                yield Conversation(conv_id if n == 0 else f"{conv_id}#{n}", source, seg, meta)
+                n += 1
+            seg = []
+            continue
+        seg.append(normalize_turn(raw, len(seg)))
+    if seg or n == 0:
+        yield Conversation(conv_id if n == 0 else f"{conv_id}#{n}", source, seg, meta)
+
+def parse_conversations(data: Any, conv_id: str) -> Iterator[Conversation]:
+    """Conversations contained in one decoded JSON document."""
+    if not isinstance(data, dict):
+        raise ValueError(f"{conv_id}: expected a JSON object")
+    meta = {"experimento": data["experimento"]} if isinstance(data.get("experimento"), dict) else {}
+    if isinstance(data.get("historico"), list):
+        return _segments(data["historico"], conv_id, "ia_user", meta)
+    if isinstance(data.get("conversation"), list):
+        return _segments(data["conversation"], conv_id, "human_user", meta)
+    raise ValueError(f"{conv_id}: missing 'historico' or 'conversation' list")
+
+def _read_jsonl(path: Path) -> Iterator[Conversation]:
+    raw_turns: List[Dict[str, Any]] = []
+    meta: Dict[str, Any] = {}
+    with open(path, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = _loads(line)
+            except ValueError:
+                continue  # truncated last line of a log still being written
+            if isinstance(obj, dict) and "experimento" in obj and len(obj) == 1:
+                meta = {"experimento": obj["experimento"]}
+            else:
+                raw_turns.append(obj)
+    return _segments(raw_turns, path.name, "jsonl", meta)
+
+def _decompress(raw: bytes, suffix: str) -> bytes:
+    if suffix == ".gz":
+        return gzip.decompress(raw)
+    if zstandard is None:
+        raise ValueError("reading .zst shards needs the zstandard package")
+    return zstandard.ZstdDecompressor().decompress(raw)
+
+def _shard_lines(path: Path) -> Iterator[bytes]:
+    if path.suffix == ".gz":
+        with gzip.open(path, "rb") as f:
+            yield from f
+        return
+    if zstandard is None:
+        raise ValueError(f"{path.name}: reading .zst shards needs the zstandard package")
+    with open(path, "rb") as raw:
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+        yield from io.BufferedReader(reader)
+
+def _read_shard(path: Path) -> Iterator[Conversation]:
+    """Every record of a compressed shard; a truncated last record (interrupted write) ends it."""
+    lines = _shard_lines(path)
+    while True:
+        try:
+            line = next(lines)
+        except (StopIteration, EOFError):
+            return
+        if line.strip():
+            record = _loads(line)
+            yield from parse_conversations(record, str(record.get("id") or path.name))
+
+def read_index(path: str) -> List[Dict[str, Any]]:
+    """Lines of a shard index, with "arquivo" resolved to an absolute shard path."""
+    root = os.path.dirname(os.path.abspath(path))
+    entries = []
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                e = _loads(line)
+            except ValueError:
+                continue  # truncated last line
+            if not os.path.isabs(e["arquivo"]):
+                e["arquivo"] = os.path.join(root, *e["arquivo"].split("/"))
+            entries.append(e)
+    return entries
+
+def filter_index(entries: Iterable[Dict[str, Any]], where: Dict[str, str]) -> List[Dict[str, Any]]:
+    """
+    Entries whose fields match every `where` item. Scalar fields compare as
+    strings; "modelos" matches when it contains the value; "decisao" accepts
+    "<leg>:<class>" or just a class (any leg); "desde"/"ate" bound the timestamp
+    (ISO prefix comparison).
+    """
+    out = []
+    for e in entries:
+        ok = True
+        for k, v in where.items():
+            if k == "desde":
+                ok = e.get("timestamp", "") >= v
+            elif k == "ate":
+                ok = e.get("timestamp", "")[: len(v)] <= v
+            elif k == "modelos":
+                ok = v in (e.get("modelos") or [])
+            elif k == "decisao":
+                leg, _, cls = v.rpartition(":")
+                decisions = e.get("decisao") or {}
+                ok = decisions.get(leg) == cls if leg else cls in decisions.values()
+            else:
+                ok = str(e.get(k, "")) == v
+            if not ok:
+                break
+        if ok:
+            out.append(e)
+    return out
+
+def write_index(entries: Iterable[Dict[str, Any]], path: str) -> None:
+    """Writes a (filtered) index; shard paths stay absolute so it can live anywhere."""
+    with open(path, "w", encoding="utf-8") as f:
+        for e in entries:
+            f.write(json.dumps(e, ensure_ascii=False) + "\n")
+
+def split_index(
+    entries: List[Dict[str, Any]], root: str, out_dir: str, records_per_unit: int = INDEX_UNIT_RECORDS
+) -> List[Tuple[str, str]]:
+    """
+    Splits index entries into unit indexes under out_dir, one per shard (in
+    index order) with at most `records_per_unit` records each, so a large
+    index is spread over workers and cached per unit instead of as one file.
+    Returns (unit path, source id) pairs; the source id is the shard path
+    relative to `root` plus "#<chunk>".
+
+    Shards are append-only: a save only changes the unit holding the newest
+    records of its day. A unit file is rewritten only when its content
+    changes, so the others keep their size and mtime (and their cached results).
+    """
+    by_shard: Dict[str, List[Dict[str, Any]]] = {}
+    for e in entries:
+        by_shard.setdefault(e["arquivo"], []).append(e)
+    units = []
+    for shard, shard_entries in by_shard.items():
+        rel = os.path.relpath(shard, root).replace(os.sep, "/")
+        for chunk, start in enumerate(range(0, len(shard_entries), records_per_unit)):
+            path = os.path.join(out_dir, *rel.replace("..", "__").split("/")) + f".{chunk:04d}_{INDEX_NAME}"
+            content = "".join(
+                json.dumps(e, ensure_ascii=False) + "\n" for e in shard_entries[start:start + records_per_unit]
+            ).encode("utf-8")
+            try:
+                with open(path, "rb") as f:
+                    unchanged = f.read() == content
+            except FileNotFoundError:
+                unchanged = False
+            if not unchanged:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(content)
+            units.append((path, f"{rel}#{chunk}"))
+    return units
+
+def glob_root(pattern: str) -> str:
+    """Directory of a glob pattern before its first wildcard; source ids are relative to it."""
+    m = re.search(r"[*?\[]", pattern)
+    return os.path.dirname(pattern if m is None else pattern[: m.start()]) or "."
+
+def source_id(path: str, root: str) -> str:
+    return os.path.relpath(path, root).replace(os.sep, "/")
+
+def expand_inputs(
+    patterns: Iterable[str], units_dir: Optional[str] = None, where: Optional[Dict[str, str]] = None
+) -> List[Tuple[str, str]]:
+    """
+    (path, source id) of every input matched by the glob `patterns`. Shard
+    indexes come first, split into units under `units_dir` (split_index) or
+    kept whole without it; `where` (needs `units_dir`) filters their records
+    (filter_index) and then only indexed records are selected. Conversation files follow, sorted,
+    except a `conversa_*.json` already migrated into a matched index (its name
+    is a record id), so the index and the old files can be read together
+    without counting a conversation twice. Source ids are relative to the
+    root of the pattern that matched.
+    """
+    indexes: List[Tuple[str, str]] = []
+    files: List[Tuple[str, str]] = []
+    for pattern in patterns:
+        root = glob_root(pattern)
+        for path in sorted(glob.glob(pattern)):
+            name = os.path.basename(path)
+            (indexes if name == INDEX_NAME else files).append((path, root))
+    if where is not None and (not indexes or not units_dir):
+        raise ValueError(f"selecting records needs a matched {INDEX_NAME} and a units_dir")
+
+    units: List[Tuple[str, str]] = []
+    ids = set()
+    for path, root in indexes:
+        entries = read_index(path)
+        ids.update(e["id"] for e in entries)
+        if units_dir:
+            units.extend(split_index(entries if where is None else filter_index(entries, where), root, units_dir))
+        else:
+            units.append((path, source_id(path, root)))
+    if where is not None:
+        return units
+    return units + [
+        (path, source_id(path, root)) for path, root in files
+        if not (path.endswith(".json") and Path(path).stem in ids)
+    ]
+
+def _read_indexed(path: Path) -> Iterator[Conversation]:
+    """Records listed in an index, in index order; a shard stays open while consecutive entries use it."""
+    f = None
+    shard = None
+    try:
+        for e in read_index(str(path)):
+            if e["arquivo"] != shard:
+                if f is not None:
+                    f.close()
+                shard = e["arquivo"]
+                f = open(shard, "rb")
+            f.seek(e["offset"])
+            record = _loads(_decompress(f.read(e["tamanho"]), os.path.splitext(shard)[1]))
+            yield from parse_conversations(record, e["id"])
+    finally:
+        if f is not None:
+            f.close()
+
+def load_conversations(path: str) -> Iterator[Conversation]:
+    """All conversations in one file (JSON, JSONL, record shard or shard index)."""
+    p = Path(path)
+    if p.name == INDEX_NAME or p.name.endswith("_" + INDEX_NAME):
+        return _read_indexed(p)
+    if p.suffix in SHARD_SUFFIXES:
+        return _read_shard(p)
+    if p.suffix == ".jsonl":
+        return _read_jsonl(p)
+    with open(p, "rb") as f:
+        return parse_conversations(_loads(f.read()), p.name)
+
+def iter_conversations(paths: Iterable[str], skip_errors: bool = False) -> Iterator[Conversation]:
+    """Lazily yields conversations from `paths`, in order."""
+    for path in paths:
+        try:
+            yield from load_conversations(path)
+        except (OSError, ValueError) as e:
+            if not skip_errors:
+                raise
+            print(f"Skipping {path}: {e}")
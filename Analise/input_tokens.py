@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Input-token reconstruction for the IA user / Human user logs.
+
+The logs only keep the messages, but every turn the server sends the n8n
+workflow the whole recent context, and each leg answers under its system
+prompt. The payload of turn i for a leg is rebuilt as:
+
+  system prompt      prompts/promptGPT.md or prompts/promptGEM.md
+  entrada_completa   formatar_contexto_historico(history[:i]) + "\n" + entrada
+                     (just `entrada` on the first turn)
+
+with `entrada` = "Olá" on the first IA user turn, then
+gerar_entrada_ai_user(previous GPT msg, previous Gemini msg). When the client
+text is typed (Human user logs) or generated locally (experiment persona),
+`entrada` is that text itself. The two helpers below mirror the ones in
+IA user/app.py (the app imports the server stack, so it is not imported).
+Not reconstructed: the sub-agent checklists, the local classifier hint and
+the similar-case examples that n8n / the server may append, and per-message
+chat framing tokens; the counts are a lower bound of what is billed.
+
+Token counts are computed per distinct piece, not per payload: the system
+prompt once per leg, each history block once (it appears in up to four
+consecutive contexts), each `entrada` once. Pieces end on line breaks, so
+their counts add up to the count of the joined text (tiktoken does not merge
+across them in practice). With --tokenizer approx the exact character
+length of each payload is rebuilt from the piece lengths and divided by 4,
+the same estimate as the output side.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from conversations import Conversation, Turn
+from token_counts import TiktokenCounter, TokenCache, count_tokens
+
+DEFAULT_PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "prompts")
+PROMPT_FILES = {"gpt": "promptGPT.md", "gemini": "promptGEM.md"}
+
+# formatar_contexto_historico (IA user/app.py)
+CONTEXT_TURNS = 4
+CONTEXT_HEADER = "--- HISTÓRICO RECENTE ---\n"
+CONTEXT_RULE = "-------------------------\n"
+FIRST_INPUT = "Olá"
+
+
+@lru_cache(maxsize=None)
+def load_system_prompts(prompts_dir: str = DEFAULT_PROMPTS_DIR) -> Dict[str, str]:
+    prompts = {}
+    for model_key, name in PROMPT_FILES.items():
+        with open(os.path.join(prompts_dir, name), "r", encoding="utf-8") as f:
+            prompts[model_key] = f.read()
+    return prompts
+
+
+def prompts_digest(prompts: Dict[str, str]) -> str:
+    """Short hash of the system prompts (part of the analysis fingerprint)."""
+    h = hashlib.blake2b(digest_size=8)
+    for model_key in sorted(prompts):
+        h.update(model_key.encode("utf-8") + b"\0" + prompts[model_key].encode("utf-8") + b"\0")
+    return h.hexdigest()
+
+
+def gerar_entrada_ai_user(gpt_msg: str, gemini_msg: str) -> str:
+    return (
+        "Considere as respostas abaixo e aja como o cliente jurídico. Seja breve.\n\n"
+        f"GPT disse:\n{gpt_msg}\n\n"
+        f"Gemini disse:\n{gemini_msg}\n\n"
+        "Sua resposta:"
+    )
+
+
+def context_block(turn: Turn) -> str:
+    """One history item as formatar_contexto_historico writes it (empty client text prints as None there too)."""
+    block = f"Cliente: {turn.user or None}\n"
+    if turn.gpt_msg:
+        block += f"Advogado GPT: {turn.gpt_msg}\n"
+    if turn.gemini_msg:
+        block += f"Advogado Gemini: {turn.gemini_msg}\n"
+    return block + CONTEXT_RULE
+
+
+def client_text_is_input(conv: Conversation) -> bool:
+    """True when the client message itself was the server input (human, or a local persona)."""
+    return conv.source == "human_user" or bool((conv.meta.get("experimento") or {}).get("persona"))
+
+
+def entradas(turns: Sequence[Turn], typed: bool) -> List[str]:
+    """The `entrada` the server used on each turn (typed: see client_text_is_input)."""
+    if typed:
+        return [t.user for t in turns]
+    if not turns:
+        return []
+    return [FIRST_INPUT] + [gerar_entrada_ai_user(p.gpt_msg, p.gemini_msg) for p in turns[:-1]]
+
+
+def payload(turns: Sequence[Turn], typed: bool, i: int, context_turns: int = CONTEXT_TURNS) -> str:
+    """entrada_completa of turn i (without the system prompt); for checks and debugging."""
+    entrada = entradas(turns, typed)[i]
+    if i == 0 or context_turns <= 0:
+        return entrada
+    ctx = CONTEXT_HEADER + "".join(context_block(t) for t in turns[max(0, i - context_turns) : i])
+    return f"{ctx}\n{entrada}"
+
+
+def _window_sums(values: np.ndarray, k: int) -> np.ndarray:
+    """For each turn i, sum of values[i-k:i] (the blocks in its context)."""
+    cs = np.concatenate([[0], np.cumsum(values)])
+    i = np.arange(len(values))
+    return cs[i] - cs[np.maximum(0, i - k)]
+
+
+class PayloadPieces(NamedTuple):
+    """
+    Measured pieces of one conversation's payloads for one leg: token counts,
+    or character counts when `chars` (approx mode, divided by 4 at the end).
+    """
+    system: int
+    header: int
+    newline: int
+    blocks: np.ndarray    # per turn: its history block
+    entradas: np.ndarray  # per turn: its entrada
+    chars: bool
+
+    def input_tokens(self, context_turns: int = CONTEXT_TURNS) -> np.ndarray:
+        """Input tokens per turn with a context of the last `context_turns` turns (0 = no history)."""
+        has_ctx = np.arange(len(self.blocks)) > 0
+        if context_turns <= 0:
+            has_ctx[:] = False
+        ctx = np.where(has_ctx, self.header + _window_sums(self.blocks, max(context_turns, 0)) + self.newline, 0)
+        if self.chars:
+            return (self.system + 3) // 4 + (ctx + self.entradas + 3) // 4
+        return self.system + ctx + self.entradas
+
+
+def payload_pieces(
+    convs: Sequence[Tuple[Sequence[Turn], bool]],
+    system_prompt: str,
+    counter: Optional[TiktokenCounter] = None,
+    cache: Optional[TokenCache] = None,
+) -> List[PayloadPieces]:
+    """
+    Pieces of every (turns, typed) in `convs` for one leg. counter=None ->
+    character counts (approx); otherwise all distinct pieces of all
+    conversations go to the encoder in one batch.
+    """
+    if not convs:
+        return []
+    blocks = [[context_block(t) for t in turns] for turns, _ in convs]
+    ents = [entradas(turns, typed) for turns, typed in convs]
+
+    if counter is None:
+        return [
+            PayloadPieces(
+                len(system_prompt), len(CONTEXT_HEADER), 1,
+                np.fromiter(map(len, bl), dtype=np.int64, count=len(bl)),
+                np.fromiter(map(len, en), dtype=np.int64, count=len(en)),
+                True,
+            )
+            for bl, en in zip(blocks, ents)
+        ]
+
+    flat = [b for bl in blocks for b in bl] + [e for en in ents for e in en]
+    counts = count_tokens(flat + [system_prompt, CONTEXT_HEADER, "\n"], counter, cache)
+    sys_tokens, header, newline = (int(c) for c in counts[-3:])
+    n_blocks = sum(len(bl) for bl in blocks)
+    block_counts = np.split(counts[:n_blocks], np.cumsum([len(bl) for bl in blocks])[:-1])
+    ent_counts = np.split(counts[n_blocks:-3], np.cumsum([len(en) for en in ents])[:-1])
+    return [PayloadPieces(sys_tokens, header, newline, bc, ec, False) for bc, ec in zip(block_counts, ent_counts)]
+
+
+def input_token_counts(
+    convs: Sequence[Tuple[Sequence[Turn], bool]],
+    system_prompt: str,
+    counter: Optional[TiktokenCounter] = None,
+    cache: Optional[TokenCache] = None,
+) -> List[np.ndarray]:
+    """Input tokens per turn (int64) for one leg, as the server builds the payload today (last 4 turns)."""
+    return [p.input_tokens(CONTEXT_TURNS) for p in payload_pieces(convs, system_prompt, counter, cache)]
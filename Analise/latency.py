@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Wall-clock latency of IA user conversations, from the recorded timestamps.
+
+Per turn i (the turn "timestamp" is written when /processar finishes):
+- gap_s        timestamp[i] - timestamp[i-1]: full turn-to-turn time
+- pacing_s     recebido[i] - timestamp[i-1]: our own pacing between turns
+               (the 3 s sleep in continuar_loop plus the loop-back request)
+- server_s     timestamp[i] - recebido[i]: time inside /processar
+- upstream_s   fim - inicio of each leg's n8n call (the legs share one call,
+               so legs answered in the same turn have the same window)
+
+recebido / inicio / fim only exist in logs written by the current server;
+for older logs those columns are empty and only gap_s is available.
+
+Per conversation and model:
+- time_to_decision_s   from the start of the conversation (recebido of the
+                       first turn, or its timestamp) to the timestamp of the
+                       decision turn; empty if the leg never decided
+- upstream_total_s     sum of the leg's upstream windows until the decision
+
+Throughput is turns per minute in fixed wall-clock windows, per experiment
+(meta "experimento.nome"; "" for conversations outside the runner).
+Outliers are Tukey IQR flags computed per metric (and per model).
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from conversations import Conversation
+
+MODELS = ("gpt", "gemini")
+QUANTILES = (0.5, 0.9, 0.99)
+
+TURN_FIELDS = [
+    "conversation_id", "turn", "timestamp", "gap_s", "pacing_s", "server_s",
+    "gpt_upstream_s", "gemini_upstream_s", "gap_outlier", "gpt_upstream_outlier", "gemini_upstream_outlier",
+]
+CONVERSATION_FIELDS = [
+    "conversation_id", "model", "experiment", "turns", "duration_s", "decision_turn",
+    "time_to_decision_s", "upstream_total_s", "time_to_decision_outlier",
+]
+THROUGHPUT_FIELDS = ["experiment", "window_start", "window_s", "turns", "conversations", "turns_per_min"]
+SUMMARY_FIELDS = ["metric", "model", "n", "mean", "p50", "p90", "p99", "max", "outliers"]
+
+
+def parse_ts(s: str) -> Optional[float]:
+    """ISO timestamp -> POSIX seconds (naive times are local, as the servers write them)."""
+    if not s:
+        return None
+    try:
+        return datetime.fromisoformat(s).timestamp()
+    except ValueError:
+        return None
+
+
+def _diff(a: Optional[float], b: Optional[float]) -> Optional[float]:
+    return round(b - a, 3) if a is not None and b is not None else None
+
+
+def experiment_name(conv: Conversation) -> str:
+    return str((conv.meta.get("experimento") or {}).get("nome", ""))
+
+
+def conversation_latency(
+    conv: Conversation,
+    decision_turns: Dict[str, Optional[int]],
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """(per-turn rows, per-model rows) for one conversation; decision_turns: model -> index or None."""
+    turns: List[Dict[str, Any]] = []
+    stamps = [parse_ts(t.timestamp) for t in conv.turns]
+    received = [parse_ts(t.received) for t in conv.turns]
+    upstream = {m: [_diff(*map(parse_ts, t.window(m))) for t in conv.turns] for m in MODELS}
+    for i, t in enumerate(conv.turns):
+        prev = stamps[i - 1] if i else None
+        turns.append({
+            "conversation_id": conv.conversation_id,
+            "turn": i,
+            "timestamp": t.timestamp,
+            "gap_s": _diff(prev, stamps[i]),
+            "pacing_s": _diff(prev, received[i]),
+            "server_s": _diff(received[i], stamps[i]),
+            "gpt_upstream_s": upstream["gpt"][i],
+            "gemini_upstream_s": upstream["gemini"][i],
+        })
+
+    start = received[0] if received and received[0] is not None else (stamps[0] if stamps else None)
+    end = next((s for s in reversed(stamps) if s is not None), None)
+    per_model: List[Dict[str, Any]] = []
+    for m in MODELS:
+        d = decision_turns.get(m)
+        limit = len(conv.turns) if d is None else d + 1
+        ups = [u for u in upstream[m][:limit] if u is not None]
+        per_model.append({
+            "conversation_id": conv.conversation_id,
+            "model": m,
+            "experiment": experiment_name(conv),
+            "turns": len(conv.turns),
+            "duration_s": _diff(start, end),
+            "decision_turn": d,
+            "time_to_decision_s": _diff(start, stamps[d]) if d is not None and d < len(stamps) else None,
+            "upstream_total_s": sum(ups) if ups else None,
+        })
+    return turns, per_model
+
+
+def iqr_flags(values: Iterable[Optional[float]]) -> List[Optional[bool]]:
+    """Tukey IQR outliers (outside [Q1 - 1.5 IQR, Q3 + 1.5 IQR]); None where the value is missing."""
+    x = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    ok = ~np.isnan(x)
+    if ok.sum() < 4:
+        return [None if not k else False for k in ok]
+    q1, q3 = np.percentile(x[ok], [25, 75])
+    lo, hi = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+    return [bool(v < lo or v > hi) if k else None for v, k in zip(x, ok)]
+
+
+def flag_outliers(turn_rows: List[Dict[str, Any]], conv_rows: List[Dict[str, Any]]) -> None:
+    """Adds the *_outlier columns in place (over the whole corpus; per model for model metrics)."""
+    for metric in ("gap", "gpt_upstream", "gemini_upstream"):
+        for r, f in zip(turn_rows, iqr_flags(r[f"{metric}_s"] for r in turn_rows)):
+            r[f"{metric}_outlier"] = f
+    for m in MODELS:
+        rows = [r for r in conv_rows if r["model"] == m]
+        for r, f in zip(rows, iqr_flags(r["time_to_decision_s"] for r in rows)):
+            r["time_to_decision_outlier"] = f
+
+
+def throughput(
+    turn_rows: List[Dict[str, Any]],
+    experiments: Dict[str, str],
+    window_s: float = 600.0,
+) -> List[Dict[str, Any]]:
+    """Turns per minute per (experiment, wall-clock window); experiments: conversation_id -> name."""
+    buckets: Dict[Tuple[str, int], List[str]] = {}
+    for r in turn_rows:
+        ts = parse_ts(r["timestamp"])
+        if ts is None:
+            continue
+        key = (experiments.get(r["conversation_id"], ""), int(ts // window_s))
+        buckets.setdefault(key, []).append(r["conversation_id"])
+    out = []
+    for (exp, b), convs in sorted(buckets.items()):
+        out.append({
+            "experiment": exp,
+            "window_start": datetime.fromtimestamp(b * window_s).isoformat(),
+            "window_s": window_s,
+            "turns": len(convs),
+            "conversations": len(set(convs)),
+            "turns_per_min": len(convs) / (window_s / 60.0),
+        })
+    return out
+
+
+def latency_summary(turn_rows: List[Dict[str, Any]], conv_rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Distribution (n, mean, p50/p90/p99, max, IQR outliers) of every latency metric."""
+    series: List[Tuple[str, str, List[Optional[float]]]] = [
+        ("gap_s", "", [r["gap_s"] for r in turn_rows]),
+        ("pacing_s", "", [r["pacing_s"] for r in turn_rows]),
+        ("server_s", "", [r["server_s"] for r in turn_rows]),
+    ]
+    for m in MODELS:
+        series.append(("upstream_s", m, [r[f"{m}_upstream_s"] for r in turn_rows]))
+    for m in MODELS:
+        rows = [r for r in conv_rows if r["model"] == m]
+        series.append(("time_to_decision_s", m, [r["time_to_decision_s"] for r in rows]))
+    series.append(("duration_s", "", [r["duration_s"] for r in conv_rows if r["model"] == MODELS[0]]))
+
+    out = []
+    for metric, model, values in series:
+        x = np.array([v for v in values if v is not None], dtype=np.float64)
+        row: Dict[str, Any] = {"metric": metric, "model": model, "n": len(x)}
+        if len(x):
+            qs = np.quantile(x, QUANTILES)
+            row.update(mean=float(x.mean()), p50=float(qs[0]), p90=float(qs[1]), p99=float(qs[2]),
+                       max=float(x.max()), outliers=sum(1 for f in iqr_flags(x.tolist()) if f))
+        out.append(row)
+    return out
+
+
+def format_latency_summary(summary: List[Dict[str, Any]]) -> List[str]:
+    lines = []
+    for r in summary:
+        name = f"{r['metric']} ({r['model']})" if r["model"] else r["metric"]
+        if not r["n"]:
+            lines.append(f"{name}: no data")
+            continue
+        lines.append(
+            f"{name}: n={r['n']} mean={r['mean']:.2f}s p50/p90/p99={r['p50']:.2f}/{r['p90']:.2f}/{r['p99']:.2f}s "
+            f"max={r['max']:.2f}s outliers={r['outliers']}"
+        )
+    return lines
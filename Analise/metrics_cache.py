@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Per-file metrics cache for incremental analysis.
+
+Saved conversations never change, so the per-file results of the analysis
+(per-model rows + paired row for every conversation in the file) are kept in
+a SQLite file in the output directory, one row per (absolute path, SHA-256
+of the content) with size and mtime. On the next run only new or changed
+files are recomputed, and only their rows are written: a full cache hit
+writes nothing, and entries for files outside this run's selection (another
+glob, a --where filter) are kept for later runs. Shard indexes are cached
+per unit (conversations.split_index); keying by content too keeps one entry
+per --where selection of a unit, which all share the unit's path.
+
+Lookup order per file:
+  1. same size and mtime as the cached entry -> hit, no read at all;
+  2. same size, different mtime (copied/touched) -> hash the content, hit if equal;
+  3. anything else -> miss.
+
+The cache is tied to the analysis parameters (decision classes, prices,
+max_turns) and to CACHE_VERSION; if either changes, it starts empty.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Any, List, Optional
+
+MANIFEST_NAME = "metrics_cache.sqlite3"
+
+# Bump when the metric definitions change so old entries are not reused.
+CACHE_VERSION = 3
+
+
+def file_sha256(path: str, chunk: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            b = f.read(chunk)
+            if not b:
+                break
+            h.update(b)
+    return h.hexdigest()
+
+
+class MetricsManifest:
+    def __init__(self, output_dir: str, fingerprint: str):
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.fingerprint = f"v{CACHE_VERSION}:{fingerprint}"
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        os.makedirs(output_dir, exist_ok=True)
+        try:
+            self.con = self._open()
+        except sqlite3.DatabaseError:
+            os.remove(self.path)  # unreadable cache -> full rescan
+            self.con = self._open()
+
+    def _open(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.path)
+        con.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS files (path TEXT NOT NULL, sha256 TEXT NOT NULL, size INTEGER NOT NULL, "
+            "mtime_ns INTEGER NOT NULL, results TEXT NOT NULL, PRIMARY KEY (path, sha256))"
+        )
+        row = con.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        if row is None or row[0] != self.fingerprint:
+            with con:
+                con.execute("DELETE FROM files")
+                con.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (self.fingerprint,))
+        return con
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.abspath(path)
+
+    def lookup(self, path: str) -> Optional[List[Any]]:
+        """Cached results for `path`, or None if it must be recomputed."""
+        key = self._key(path)
+        st = os.stat(path)
+        rows = self.con.execute(
+            "SELECT sha256, mtime_ns FROM files WHERE path = ? AND size = ?", (key, st.st_size)
+        ).fetchall()
+        sha = next((h for h, mtime_ns in rows if mtime_ns == st.st_mtime_ns), None)
+        if sha is None and rows:
+            content = file_sha256(path)
+            if any(h == content for h, _ in rows):
+                sha = content
+                self.con.execute("UPDATE files SET mtime_ns = ? WHERE path = ? AND sha256 = ?",
+                                 (st.st_mtime_ns, key, sha))
+                self.dirty = True
+        if sha is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        (results,) = self.con.execute(
+            "SELECT results FROM files WHERE path = ? AND sha256 = ?", (key, sha)
+        ).fetchone()
+        return json.loads(results)
+
+    def store(self, path: str, results: List[Any]) -> None:
+        st = os.stat(path)
+        self.con.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+            (self._key(path), file_sha256(path), st.st_size, st.st_mtime_ns,
+             json.dumps(results, ensure_ascii=False)),
+        )
+        self.dirty = True
+
+    def save(self) -> None:
+        """Commits the entries written in this run (nothing to do on a full cache hit)."""
+        if self.dirty:
+            self.con.commit()
+            self.dirty = False
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Columnar store for the analysis metrics (NumPy, one .npy file per column).
+
+Layout under <output_dir>/metrics_store/:
+  schema.json                       column dtypes, categorical labels, row counts
+  conversations/<model>/<col>.npy   one row per conversation (same order for every model)
+  turns/<model>/<col>.npy           one row per assistant turn; conv_index points into conversations/
+
+Missing values: float columns use NaN, categorical columns use code -1.
+Files are plain .npy, so `MetricsStore.load(..., mmap=True)` maps them
+instead of reading them, and every summary is a vectorized reduction over a
+typed array instead of a scan over a list of dicts.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+MODELS = ("gpt", "gemini")
+STORE_DIRNAME = "metrics_store"
+
+# Per-conversation numeric columns (ModelMetrics fields).
+CONV_COLUMNS: Dict[str, str] = {
+    "decision_turn": "f8",  # NaN = no decision in the observed segment
+    "turns_total": "i4",
+    "turns_used": "i4",
+    "wasted_turns_post_decision": "i4",
+    "output_tokens_used": "i8",
+    "output_tokens_post_decision": "i8",
+    "avg_words_used": "f8",
+    "avg_questions_used": "f8",
+    "repetitiveness_used": "f8",
+    "cost_used_usd": "f8",  # NaN when no price was given
+    "cost_post_decision_usd": "f8",
+    # input side (--input_tokens); NaN when not reconstructed / no input price
+    "input_tokens_used": "f8",
+    "input_tokens_post_decision": "f8",
+    "input_cost_used_usd": "f8",
+    "total_cost_used_usd": "f8",
+}
+CATEGORICAL_COLUMNS = ("decision_class", "experiment_cell")
+
+# Per-turn columns.
+TURN_COLUMNS: Dict[str, str] = {
+    "conv_index": "i4",
+    "turn": "i4",
+    "output_tokens": "i4",
+    "words": "i4",
+    "questions": "i4",
+    "used": "?",  # turn is inside the used (pre/at decision) segment
+    "input_tokens": "i4",  # rebuilt input payload; -1 when not reconstructed
+}
+
+
+def _float_or_nan(v: Any) -> float:
+    return float("nan") if v is None else float(v)
+
+
+class MetricsStore:
+    def __init__(
+        self,
+        conversations: Dict[str, Dict[str, np.ndarray]],
+        turns: Dict[str, Dict[str, np.ndarray]],
+        labels: Dict[str, List[str]],
+    ):
+        self.conversations = conversations
+        self.turns = turns
+        self.labels = labels
+
+    # ---- building ----
+
+    @classmethod
+    def from_results(
+        cls,
+        rows: List[Dict[str, Any]],
+        turn_metrics: List[Dict[str, Dict[str, List[int]]]],
+    ) -> "MetricsStore":
+        """
+        rows: per (conversation, model) dicts as written to the CSV.
+        turn_metrics: one dict per conversation (same order), model -> column -> list.
+        """
+        labels: Dict[str, List[str]] = {c: [] for c in CATEGORICAL_COLUMNS}
+        codes: Dict[str, Dict[str, int]] = {c: {} for c in CATEGORICAL_COLUMNS}
+
+        def code(col: str, v: Any) -> int:
+            if v is None or v == "":
+                return -1
+            m = codes[col]
+            if v not in m:
+                m[v] = len(labels[col])
+                labels[col].append(v)
+            return m[v]
+
+        conversations: Dict[str, Dict[str, np.ndarray]] = {}
+        for model in MODELS:
+            mrows = [r for r in rows if r["model"] == model]
+            cols: Dict[str, np.ndarray] = {
+                "conversation_id": np.array([r["conversation_id"] for r in mrows], dtype=str),
+            }
+            for col, dt in CONV_COLUMNS.items():
+                vals = [r.get(col) for r in mrows]
+                if dt == "f8":
+                    cols[col] = np.array([_float_or_nan(v) for v in vals], dtype=dt)
+                else:
+                    cols[col] = np.array([0 if v is None else v for v in vals], dtype=dt)
+            for col in CATEGORICAL_COLUMNS:
+                cols[col] = np.array([code(col, r.get(col)) for r in mrows], dtype="i4")
+            conversations[model] = cols
+
+        turns: Dict[str, Dict[str, np.ndarray]] = {}
+        for model in MODELS:
+            acc: Dict[str, List[Any]] = {c: [] for c in TURN_COLUMNS}
+            for ci, tm in enumerate(turn_metrics):
+                t = tm.get(model) or {}
+                n = len(t.get("output_tokens", ()))
+                acc["conv_index"].extend([ci] * n)
+                acc["turn"].extend(range(n))
+                for c in ("output_tokens", "words", "questions", "used"):
+                    acc[c].extend(t.get(c, ()))
+                acc["input_tokens"].extend(t.get("input_tokens") or [-1] * n)
+            turns[model] = {c: np.array(acc[c], dtype=dt) for c, dt in TURN_COLUMNS.items()}
+        return cls(conversations, turns, labels)
+
+    # ---- persistence ----
+
+    def save(self, output_dir: str) -> str:
+        root = os.path.join(output_dir, STORE_DIRNAME)
+        for section, data in (("conversations", self.conversations), ("turns", self.turns)):
+            for model, cols in data.items():
+                d = os.path.join(root, section, model)
+                os.makedirs(d, exist_ok=True)
+                for col, arr in cols.items():
+                    np.save(os.path.join(d, f"{col}.npy"), arr)
+        schema = {
+            "models": list(self.conversations),
+            "conversation_columns": {c: str(a.dtype) for c, a in next(iter(self.conversations.values())).items()},
+            "turn_columns": {c: str(a.dtype) for c, a in next(iter(self.turns.values())).items()},
+            "labels": self.labels,
+            "n_conversations": {m: int(len(c["conversation_id"])) for m, c in self.conversations.items()},
+            "n_turns": {m: int(len(t["turn"])) for m, t in self.turns.items()},
+        }
+        with open(os.path.join(root, "schema.json"), "w", encoding="utf-8") as f:
+            json.dump(schema, f, ensure_ascii=False, indent=2)
+        return root
+
+    @classmethod
+    def load(cls, output_dir: str, mmap: bool = True) -> "MetricsStore":
+        root = os.path.join(output_dir, STORE_DIRNAME)
+        with open(os.path.join(root, "schema.json"), "r", encoding="utf-8") as f:
+            schema = json.load(f)
+        mode = "r" if mmap else None
+
+        def read(section: str, columns: Iterable[str]) -> Dict[str, Dict[str, np.ndarray]]:
+            return {
+                m: {c: np.load(os.path.join(root, section, m, f"{c}.npy"), mmap_mode=mode) for c in columns}
+                for m in schema["models"]
+            }
+
+        return cls(
+            read("conversations", schema["conversation_columns"]),
+            read("turns", schema["turn_columns"]),
+            schema["labels"],
+        )
+
+    # ---- queries ----
+
+    def column(self, model: str, col: str) -> np.ndarray:
+        return self.conversations[model][col]
+
+    def by_model(self, col: str) -> Dict[str, np.ndarray]:
+        """Column as float per model (NaN for missing), aligned by conversation."""
+        return {m: np.asarray(c[col], dtype="f8") for m, c in self.conversations.items()}
+
+    def decision_rate(self, model: str) -> float:
+        dt = self.conversations[model]["decision_turn"]
+        return float(np.count_nonzero(~np.isnan(dt)) / max(1, len(dt)))
+
+    def categorical(self, model: str, col: str) -> List[Optional[str]]:
+        labels = self.labels.get(col, [])
+        return [labels[i] if i >= 0 else None for i in self.conversations[model][col]]
+
+    def turn_column(self, model: str, col: str, used_only: bool = False) -> np.ndarray:
+        t = self.turns[model]
+        return np.asarray(t[col])[np.asarray(t["used"])] if used_only else np.asarray(t[col])
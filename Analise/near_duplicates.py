@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MinHash / LSH near-duplicate detection for assistant messages.
+
+`repetitiveness_used` only compares consecutive turns with exact token-set
+Jaccard. Here every message gets a MinHash signature over word 3-shingles,
+which estimates Jaccard similarity between any two messages:
+
+- within a conversation, all pairs of turns are compared (a model circling
+  back to a question from three turns ago shows up with lag >= 2);
+- across the corpus, LSH banding puts messages whose signatures agree on a
+  whole band in the same bucket; only bucket members are verified, and
+  verified links are merged with union-find into clusters. Cost is linear in
+  the number of messages per band (one sort), not quadratic.
+
+Clusters that recur in many conversations are prompt-driven boilerplate;
+their token totals say how much output would be saved by cutting them.
+
+Shingles are hashed with CRC32 and the permutations come from a seeded RNG,
+so signatures are stable across processes and runs and can be stored.
+"""
+
+from __future__ import annotations
+
+import re
+import zlib
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+_WORD_RE = re.compile(r"\b\w+\b", re.UNICODE)
+_MERSENNE = np.uint64((1 << 61) - 1)
+_EMPTY = np.uint32(0xFFFFFFFF)
+
+NUM_PERM = 128
+BANDS = 16          # 16 bands x 8 rows -> candidate threshold ~ (1/16)^(1/8) = 0.71
+SHINGLE = 3
+THRESHOLD = 0.7     # estimated Jaccard to count as near-duplicate
+
+
+def shingle_hashes(text: str, k: int = SHINGLE) -> np.ndarray:
+    """CRC32 of the distinct word k-shingles (the whole text if shorter than k words)."""
+    toks = _WORD_RE.findall((text or "").lower())
+    if not toks:
+        return np.empty(0, dtype=np.uint64)
+    if len(toks) <= k:
+        grams = {" ".join(toks)}
+    else:
+        grams = {" ".join(toks[i : i + k]) for i in range(len(toks) - k + 1)}
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = NUM_PERM, shingle: int = SHINGLE, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        # a, b < 2^32 and x < 2^32, so a*x + b fits in uint64 before the modulo
+        self.a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+        self.shingle = shingle
+
+    def signatures(self, texts: Sequence[str], chunk: int = 1 << 15) -> np.ndarray:
+        """(len(texts), num_perm) uint32; rows of empty messages are all 0xFFFFFFFF."""
+        out = np.full((len(texts), self.num_perm), _EMPTY, dtype=np.uint32)
+        hashes = [shingle_hashes(t, self.shingle) for t in texts]
+        # messages are processed in groups of ~`chunk` shingles to bound the (shingles x perms) matrix
+        start = 0
+        while start < len(texts):
+            stop, total = start, 0
+            while stop < len(texts) and (total == 0 or total + len(hashes[stop]) <= chunk):
+                total += len(hashes[stop])
+                stop += 1
+            idx = [i for i in range(start, stop) if len(hashes[i])]
+            if idx:
+                x = np.concatenate([hashes[i] for i in idx])
+                perm = ((x[:, None] * self.a + self.b) % _MERSENNE) & np.uint64(0xFFFFFFFF)
+                offsets = np.cumsum([0] + [len(hashes[i]) for i in idx[:-1]])
+                out[idx] = np.minimum.reduceat(perm, offsets, axis=0).astype(np.uint32)
+            start = stop
+        return out
+
+
+def is_empty(sigs: np.ndarray) -> np.ndarray:
+    return (sigs == _EMPTY).all(axis=1)
+
+
+def within_pairs(sigs: np.ndarray, threshold: float = THRESHOLD) -> List[Tuple[int, int, float]]:
+    """All (i, j, similarity) with i < j and estimated Jaccard >= threshold, for one conversation."""
+    n = len(sigs)
+    if n < 2:
+        return []
+    sim = (sigs[:, None, :] == sigs[None, :, :]).mean(axis=2)
+    empty = is_empty(sigs)
+    sim[empty, :] = 0.0
+    sim[:, empty] = 0.0
+    ii, jj = np.triu_indices(n, k=1)
+    keep = sim[ii, jj] >= threshold
+    return [(int(i), int(j), float(s)) for i, j, s in zip(ii[keep], jj[keep], sim[ii, jj][keep])]
+
+
+def lsh_clusters(sigs: np.ndarray, bands: int = BANDS, threshold: float = THRESHOLD) -> np.ndarray:
+    """
+    Cluster label per message (index of the cluster root; -1 for empty messages).
+    Each band links a message to the first message of its bucket when the two
+    signatures agree on >= threshold of the permutations.
+    """
+    n, num_perm = sigs.shape
+    rows = num_perm // bands
+    parent = np.arange(n)
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    valid = np.flatnonzero(~is_empty(sigs))
+    if len(valid) == 0:
+        return np.full(n, -1)
+    s = sigs[valid]
+    for b in range(bands):
+        band = np.ascontiguousarray(s[:, b * rows : (b + 1) * rows]).view(np.dtype((np.void, 4 * rows))).ravel()
+        _, first, inverse = np.unique(band, return_index=True, return_inverse=True)
+        rep = first[inverse]
+        cand = np.flatnonzero(rep != np.arange(len(s)))
+        if len(cand) == 0:
+            continue
+        ok = (s[cand] == s[rep[cand]]).mean(axis=1) >= threshold
+        for i, j in zip(valid[cand[ok]], valid[rep[cand[ok]]]):
+            ri, rj = find(int(i)), find(int(j))
+            if ri != rj:
+                parent[max(ri, rj)] = min(ri, rj)
+
+    labels = np.full(n, -1)
+    for i in valid:
+        labels[i] = find(int(i))
+    return labels
+
+
+class MessageRef(NamedTuple):
+    conversation_id: str
+    model: str
+    turn: int
+    used: bool
+    tokens: int
+    text: str
+
+
+def boilerplate_report(
+    refs: List[MessageRef],
+    sigs: np.ndarray,
+    bands: int = BANDS,
+    threshold: float = THRESHOLD,
+    min_conversations: int = 3,
+    example_chars: int = 300,
+) -> List[Dict[str, object]]:
+    """
+    Near-duplicate clusters per model that recur in >= min_conversations
+    conversations, largest token total first. `refs[i]` describes row i of `sigs`.
+    """
+    out: List[Dict[str, object]] = []
+    models = sorted({r.model for r in refs})
+    for model in models:
+        idx = np.array([i for i, r in enumerate(refs) if r.model == model], dtype=np.int64)
+        if len(idx) == 0:
+            continue
+        labels = lsh_clusters(sigs[idx], bands=bands, threshold=threshold)
+        groups: Dict[int, List[int]] = {}
+        for pos, lab in enumerate(labels):
+            if lab >= 0:
+                groups.setdefault(int(lab), []).append(int(idx[pos]))
+        for members in groups.values():
+            convs = {refs[i].conversation_id for i in members}
+            if len(convs) < min_conversations:
+                continue
+            rep = refs[members[0]]
+            tokens = sum(refs[i].tokens for i in members)
+            out.append({
+                "model": model,
+                "messages": len(members),
+                "conversations": len(convs),
+                "messages_used": sum(1 for i in members if refs[i].used),
+                "tokens_total": tokens,
+                "tokens_used": sum(refs[i].tokens for i in members if refs[i].used),
+                "avg_tokens": tokens / len(members),
+                "example_conversation_id": rep.conversation_id,
+                "example_turn": rep.turn,
+                "example_text": " ".join(rep.text.split())[:example_chars],
+            })
+    out.sort(key=lambda r: (r["model"], -r["tokens_total"]))
+    return out
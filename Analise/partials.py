@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Mergeable partial aggregates for sharded (map/reduce) analysis.
+
+Each node analyzes its own shard of conversation files and writes one
+partial file (.npz, no pickle):
+
+  meta        UTF-8 JSON:
+                fingerprint   analysis parameters; partials only merge if equal
+                node          tag of the node that wrote it (default: the
+                              partial's file name)
+                groups        per input unit: its source id (path relative to
+                              the glob root) and the per-conversation results
+                              (per-model rows, paired row = paired-difference
+                              buffer, per-turn columns), same shape as the
+                              metrics manifest entries
+                summary       per model: counts, sums and KLL quantile sketches
+                near_dups     within-conversation near-duplicate pairs and the
+                              message refs behind `signatures` (if computed)
+  signatures  uint32 MinHash signatures (messages x permutations)
+
+Reduce merges any number of partials: groups are keyed by (node, source) --
+file names alone collide, every node has an indice.jsonl and every day shard
+is a conversas.jsonl.gz -- and concatenated in source order (the order a
+single-node run processes the sorted glob); the same key in two partials is an
+error. Summaries are added and sketches merged, signatures are stacked. The result feeds the same
+CSV / store / tests / plots pipeline as a local run.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+import random
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+PARTIAL_FORMAT = 2
+
+# Per-model sums accumulated from the per-conversation rows.
+SUM_FIELDS = (
+    "turns_total",
+    "turns_used",
+    "wasted_turns_post_decision",
+    "output_tokens_used",
+    "output_tokens_post_decision",
+    "cost_used_usd",
+    "cost_post_decision_usd",
+    "input_tokens_used",
+    "input_cost_used_usd",
+    "total_cost_used_usd",
+)
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch (Karnin, Lang, Liberty 2016): a stack of compactors,
+    level h holds items of weight 2^h; a full level is sorted and every other
+    item (random offset) is promoted. Mergeable, ~1% rank error at k=200.
+    The RNG is seeded, so the same inputs in the same order give the same sketch.
+    """
+
+    def __init__(self, k: int = 200, seed: int = 0):
+        self.k = k
+        self.n = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.levels: List[List[float]] = [[]]
+        self._rng = random.Random(seed)
+
+    def _capacity(self, h: int) -> int:
+        depth = len(self.levels) - h - 1
+        return int(math.ceil(self.k * (2.0 / 3.0) ** depth)) + 1
+
+    def _size(self) -> int:
+        return sum(len(lv) for lv in self.levels)
+
+    def _max_size(self) -> int:
+        return sum(self._capacity(h) for h in range(len(self.levels)))
+
+    def _compress(self) -> None:
+        while self._size() >= self._max_size():
+            for h, level in enumerate(self.levels):
+                if len(level) >= self._capacity(h):
+                    if h + 1 == len(self.levels):
+                        self.levels.append([])
+                    level.sort()
+                    keep = [level.pop()] if len(level) % 2 else []
+                    offset = self._rng.randint(0, 1)
+                    self.levels[h + 1].extend(level[offset::2])
+                    self.levels[h] = keep
+                    break
+
+    def update_many(self, values: Iterable[float]) -> None:
+        vals = [float(v) for v in values if v is not None and not math.isnan(v)]
+        if not vals:
+            return
+        self.n += len(vals)
+        self.min = min(self.min, min(vals))
+        self.max = max(self.max, max(vals))
+        step = self.k
+        for i in range(0, len(vals), step):
+            self.levels[0].extend(vals[i : i + step])
+            self._compress()
+
+    def merge(self, other: "KLLSketch") -> None:
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for h, level in enumerate(other.levels):
+            self.levels[h].extend(level)
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+
+    def quantiles(self, qs: Iterable[float]) -> List[float]:
+        items = sorted((v, 1 << h) for h, level in enumerate(self.levels) for v in level)
+        if not items:
+            return [float("nan") for _ in qs]
+        values = np.array([v for v, _ in items])
+        cum = np.cumsum([w for _, w in items])
+        out = []
+        for q in qs:
+            if q <= 0:
+                out.append(self.min)
+            elif q >= 1:
+                out.append(self.max)
+            else:
+                out.append(float(values[np.searchsorted(cum, q * cum[-1])]))
+        return out
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"k": self.k, "n": self.n, "min": self.min, "max": self.max, "levels": self.levels}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "KLLSketch":
+        s = cls(k=d["k"])
+        s.n, s.min, s.max = d["n"], d["min"], d["max"]
+        s.levels = [list(lv) for lv in d["levels"]] or [[]]
+        return s
+
+
+# -----------------------------
+# Summaries (counts, sums, sketches per model)
+# -----------------------------
+
+def summarize(rows: List[Dict[str, Any]], turn_metrics: List[Dict[str, Dict[str, List[int]]]]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for model in ("gpt", "gemini"):
+        mrows = [r for r in rows if r["model"] == model]
+        classes: Dict[str, int] = {}
+        for r in mrows:
+            if r.get("decision_class"):
+                classes[r["decision_class"]] = classes.get(r["decision_class"], 0) + 1
+        conv_tokens = KLLSketch()
+        conv_tokens.update_many(r["output_tokens_used"] for r in mrows)
+        decision_turn = KLLSketch()
+        decision_turn.update_many(r["decision_turn"] for r in mrows)
+        turn_tokens = KLLSketch()
+        for tm in turn_metrics:
+            t = tm.get(model) or {}
+            turn_tokens.update_many(v for v, used in zip(t.get("output_tokens", ()), t.get("used", ())) if used)
+        out[model] = {
+            "conversations": len(mrows),
+            "decided": sum(1 for r in mrows if r.get("decision_turn") is not None),
+            "decision_classes": classes,
+            "sums": {f: sum(r.get(f) or 0 for r in mrows) for f in SUM_FIELDS},
+            "sketches": {
+                "output_tokens_used": conv_tokens.to_dict(),
+                "decision_turn": decision_turn.to_dict(),
+                "turn_output_tokens_used": turn_tokens.to_dict(),
+            },
+        }
+    return out
+
+def merge_summaries(summaries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    merged: Dict[str, Any] = {}
+    for summary in summaries:
+        for model, s in summary.items():
+            m = merged.get(model)
+            if m is None:
+                merged[model] = json.loads(json.dumps(s))  # deep copy
+                continue
+            m["conversations"] += s["conversations"]
+            m["decided"] += s["decided"]
+            for c, n in s["decision_classes"].items():
+                m["decision_classes"][c] = m["decision_classes"].get(c, 0) + n
+            for f in SUM_FIELDS:
+                m["sums"][f] += s["sums"][f]
+            for name, sk in s["sketches"].items():
+                acc = KLLSketch.from_dict(m["sketches"][name])
+                acc.merge(KLLSketch.from_dict(sk))
+                m["sketches"][name] = acc.to_dict()
+    return merged
+
+def format_summary(summary: Dict[str, Any]) -> List[str]:
+    lines = []
+    for model, s in summary.items():
+        n = s["conversations"]
+        tok = KLLSketch.from_dict(s["sketches"]["output_tokens_used"]).quantiles([0.5, 0.9, 0.99])
+        turn = KLLSketch.from_dict(s["sketches"]["turn_output_tokens_used"]).quantiles([0.5, 0.9, 0.99])
+        lines.append(
+            f"{model}: {n} conversations, {s['decided']} decided ({100.0 * s['decided'] / max(1, n):.1f}%), "
+            f"{s['sums']['output_tokens_used']} output tokens until decision; "
+            f"tokens/conversation p50/p90/p99 = {tok[0]:.0f}/{tok[1]:.0f}/{tok[2]:.0f}, "
+            f"tokens/turn p50/p90/p99 = {turn[0]:.0f}/{turn[1]:.0f}/{turn[2]:.0f}"
+        )
+    return lines
+
+
+# -----------------------------
+# Partial files
+# -----------------------------
+
+def default_node(path: str) -> str:
+    """Node tag of a partial written to `path`: its file name without extension."""
+    return os.path.splitext(os.path.basename(path))[0]
+
+def save_partial(
+    path: str,
+    fingerprint: str,
+    groups: List[Dict[str, Any]],
+    summary: Dict[str, Any],
+    near_dups: Optional[Dict[str, Any]] = None,
+    signatures: Optional[np.ndarray] = None,
+    node: Optional[str] = None,
+) -> None:
+    meta = {
+        "format": PARTIAL_FORMAT,
+        "fingerprint": fingerprint,
+        "node": node or default_node(path),
+        "groups": groups,
+        "summary": summary,
+        "near_dups": near_dups,
+    }
+    blob = np.frombuffer(json.dumps(meta, ensure_ascii=False).encode("utf-8"), dtype=np.uint8)
+    sigs = signatures if signatures is not None else np.empty((0, 0), dtype=np.uint32)
+    tmp = path + ".tmp.npz"
+    np.savez_compressed(tmp, meta=blob, signatures=sigs)
+    os.replace(tmp, path)
+
+def load_partial(path: str) -> Dict[str, Any]:
+    with np.load(path, allow_pickle=False) as z:
+        meta = json.loads(z["meta"].tobytes().decode("utf-8"))
+        meta["signatures"] = z["signatures"]
+    if meta.get("format") != PARTIAL_FORMAT:
+        raise ValueError(f"{path}: unsupported partial format {meta.get('format')}")
+    return meta
+
+def merge_partials(partials: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Merged partial (same keys as load_partial). Fingerprints must match."""
+    if not partials:
+        raise ValueError("no partials to merge")
+    fingerprints = {p["fingerprint"] for p in partials}
+    if len(fingerprints) > 1:
+        raise ValueError("partials were computed with different analysis parameters:\n  " + "\n  ".join(sorted(fingerprints)))
+
+    keyed: Dict[Tuple[str, str], Tuple[Dict[str, Any], int]] = {}
+    for n, p in enumerate(partials):
+        for g in p["groups"]:
+            key = (g["source"], p["node"])
+            if key in keyed:
+                raise ValueError(f"source {g['source']!r} of node {p['node']!r} appears in more than one partial "
+                                 "(give every node its own --node tag)")
+            keyed[key] = (g, n)
+    order = sorted(keyed)
+    # position of every conversation in the merged groups (ids are only unique within a partial)
+    rank: Dict[Tuple[int, str], int] = {}
+    for r, key in enumerate(order):
+        g, n = keyed[key]
+        for res in g["results"]:
+            rank.setdefault((n, res[1]["conversation_id"]), r)
+
+    near = [(n, p) for n, p in enumerate(partials) if p.get("near_dups")]
+    near_dups = None
+    signatures = np.empty((0, 0), dtype=np.uint32)
+    if near:
+        # same order as the groups (stable: a conversation's items keep their order)
+        within = [(rank[(n, w["conversation_id"])], w) for n, p in near for w in p["near_dups"]["within"]]
+        refs = [(rank[(n, r[0])], r) for n, p in near for r in p["near_dups"]["refs"]]
+        signatures = np.concatenate([p["signatures"] for _, p in near])
+        ref_order = sorted(range(len(refs)), key=lambda i: refs[i][0])
+        near_dups = {
+            "threshold": near[0][1]["near_dups"]["threshold"],
+            "within": [w for _, w in sorted(within, key=lambda x: x[0])],
+            "refs": [refs[i][1] for i in ref_order],
+        }
+        signatures = signatures[ref_order]
+
+    return {
+        "format": PARTIAL_FORMAT,
+        "fingerprint": partials[0]["fingerprint"],
+        "node": ",".join(sorted({p["node"] for p in partials})),
+        "groups": [keyed[k][0] for k in order],
+        "summary": merge_summaries([p["summary"] for p in partials]),
+        "near_dups": near_dups,
+        "signatures": signatures,
+    }
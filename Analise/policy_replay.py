@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+What-if replay of the recorded conversations under other server policies.
+
+A policy changes what IA user/app.py does around the same recorded messages:
+- context_turns   turns of history formatar_contexto_historico resends (today 4)
+- max_loops       MAX_AI_LOOPS: the loop stops after loop_count >= max_loops,
+                  so at most max_loops + 1 turns (today 12)
+- token_budget    stop after the turn where the conversation's input + output
+                  tokens (both legs) reach the budget (0 = no budget)
+- stop_rule       "all": loop until no leg is still conversando (today);
+                  "any": stop as soon as the first leg decides
+
+Per policy and model the replay reports projected input tokens (payload
+rebuilt as in input_tokens.py with the policy's window), output tokens, cost,
+turns saved against the recording, and decisions cut off (the leg decided on
+a turn the policy never reaches). A leg stops costing tokens after its own
+decision, as in the server.
+
+The replay keeps the recorded messages: it does not model how the answers
+would change with a shorter context; it prices the same conversation under
+each policy and says which decisions would not have happened in time.
+
+Every file is parsed and tokenized once; all policies are then evaluated on
+the same pieces, in a process pool over files (--workers). The baseline row
+(today's policy) is always included and deltas are relative to it.
+
+Usage:
+  python policy_replay.py --input_glob "../IA user/JSON_Conversas/indice.jsonl" --output_dir out
+  python policy_replay.py --context_turns 1,2,4,8 --max_loops 6,8,12 --budgets 0,40000 --stop_rules all,any --workers 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import itertools
+import json
+import os
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from conversations import INDEX_NAME, expand_inputs, load_conversations
+from input_tokens import DEFAULT_PROMPTS_DIR, CONTEXT_TURNS, PayloadPieces, client_text_is_input, load_system_prompts, payload_pieces
+from text_features import extract_batch
+from token_counts import DEFAULT_ENCODINGS, TOKEN_CACHE_NAME, count_tokens, get_cache, get_counter
+
+MODELS = ("gpt", "gemini")
+MAX_AI_LOOPS = 12  # IA user/app.py
+DECISION_CLASSES_DEFAULT = ("Qualificado", "Desqualificado")
+# USD per 1M tokens (IA user/nota.md)
+PRICES_DEFAULT = {"gpt": (0.40, 1.60), "gemini": (0.30, 2.50)}
+
+# Aggregated per (policy, model); all sums.
+FIELDS = (
+    "conversations", "turns_recorded", "turns", "leg_turns", "input_tokens", "output_tokens",
+    "decisions_recorded", "decisions_kept", "decisions_cut_off",
+)
+
+
+@dataclass(frozen=True)
+class Policy:
+    context_turns: int = CONTEXT_TURNS
+    max_loops: int = MAX_AI_LOOPS
+    token_budget: int = 0
+    stop_rule: str = "all"  # "all" | "any"
+
+    @property
+    def name(self) -> str:
+        budget = f"budget{self.token_budget}" if self.token_budget else "nobudget"
+        return f"ctx{self.context_turns}_loops{self.max_loops}_{budget}_stop-{self.stop_rule}"
+
+
+BASELINE = Policy()
+
+
+class ReplayConversation:
+    """Everything a policy needs from one recorded conversation, per leg."""
+
+    __slots__ = ("n_turns", "pieces", "output", "decision")
+
+    def __init__(self, n_turns: int, pieces: Dict[str, PayloadPieces], output: Dict[str, np.ndarray],
+                 decision: Dict[str, Optional[int]]):
+        self.n_turns = n_turns
+        self.pieces = pieces
+        self.output = output
+        self.decision = decision
+
+
+def prepare_file(path: str, cfg: Dict[str, Any]) -> List[ReplayConversation]:
+    convs = [c for c in load_conversations(path) if c.turns]
+    prompts = load_system_prompts(cfg["prompts_dir"])
+    approx = cfg["tokenizer"] == "approx"
+    cache = None if approx or not cfg["token_cache"] else get_cache(cfg["token_cache"])
+    items = [(c.turns, client_text_is_input(c)) for c in convs]
+    pieces: Dict[str, List[PayloadPieces]] = {}
+    output: Dict[str, List[np.ndarray]] = {}
+    for m in MODELS:
+        counter = None if approx else get_counter(cfg["encodings"][m])
+        pieces[m] = payload_pieces(items, prompts[m], counter, cache)
+        texts = [[t.msg(m) for t in c.turns] for c in convs]
+        if approx:
+            output[m] = [extract_batch(tx).approx_tokens for tx in texts]
+        else:
+            flat = count_tokens([x for tx in texts for x in tx], counter, cache)
+            output[m] = np.split(flat, np.cumsum([len(tx) for tx in texts])[:-1]) if texts else []
+    out = []
+    for i, c in enumerate(convs):
+        decision = {}
+        for m in MODELS:
+            decision[m] = next((j for j, t in enumerate(c.turns) if t.cls(m) in cfg["decision_classes"]), None)
+        out.append(ReplayConversation(len(c.turns), {m: pieces[m][i] for m in MODELS},
+                                      {m: output[m][i] for m in MODELS}, decision))
+    return out
+
+
+def replay(conv: ReplayConversation, policy: Policy) -> np.ndarray:
+    """(models, FIELDS) sums for one conversation under one policy."""
+    n = conv.n_turns
+    active = {m: n if conv.decision[m] is None else conv.decision[m] + 1 for m in MODELS}
+    stop = min(n, policy.max_loops + 1)
+    if policy.stop_rule == "any":
+        decided = [active[m] for m in MODELS if conv.decision[m] is not None]
+        if decided:
+            stop = min(stop, min(decided))
+
+    inputs = {m: conv.pieces[m].input_tokens(policy.context_turns) for m in MODELS}
+    if policy.token_budget:
+        per_turn = []
+        for m in MODELS:
+            tokens = inputs[m] + conv.output[m]
+            tokens[active[m]:] = 0  # a leg that decided is no longer called
+            per_turn.append(tokens)
+        cum = np.cumsum(sum(per_turn))
+        over = np.flatnonzero(cum >= policy.token_budget)
+        if len(over):
+            stop = min(stop, int(over[0]) + 1)
+
+    out = np.zeros((len(MODELS), len(FIELDS)), dtype=np.float64)
+    for k, m in enumerate(MODELS):
+        end = min(stop, active[m])
+        d = conv.decision[m]
+        out[k] = (
+            1, n, stop, end, inputs[m][:end].sum(), conv.output[m][:end].sum(),
+            d is not None, d is not None and d < stop, d is not None and d >= stop,
+        )
+    return out
+
+
+def replay_file(path: str, policies: Sequence[Policy], cfg: Dict[str, Any]) -> np.ndarray:
+    """(policies, models, FIELDS) sums over one file (unit of work for the pool)."""
+    acc = np.zeros((len(policies), len(MODELS), len(FIELDS)), dtype=np.float64)
+    for conv in prepare_file(path, cfg):
+        for p, policy in enumerate(policies):
+            acc[p] += replay(conv, policy)
+    return acc
+
+
+def replay_corpus(paths: List[str], policies: Sequence[Policy], cfg: Dict[str, Any], workers: int = 1) -> np.ndarray:
+    if workers > 1 and len(paths) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        from functools import partial
+
+        chunksize = max(1, len(paths) // (workers * 8))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(partial(replay_file, policies=policies, cfg=cfg), paths, chunksize=chunksize))
+    else:
+        parts = [replay_file(p, policies, cfg) for p in paths]
+    return np.sum(parts, axis=0) if parts else np.zeros((len(policies), len(MODELS), len(FIELDS)))
+
+
+def policy_rows(
+    policies: Sequence[Policy], totals: np.ndarray, prices: Dict[str, Tuple[float, float]]
+) -> List[Dict[str, Any]]:
+    rows = []
+    for p, policy in enumerate(policies):
+        for k, m in enumerate(MODELS):
+            v = dict(zip(FIELDS, totals[p, k].tolist()))
+            p_in, p_out = prices[m]
+            cost_in = v["input_tokens"] * p_in / 1_000_000.0
+            cost_out = v["output_tokens"] * p_out / 1_000_000.0
+            rows.append({
+                "policy": policy.name,
+                **asdict(policy),
+                "model": m,
+                **{f: int(x) for f, x in v.items()},
+                "turns_saved": int(v["turns_recorded"] - v["turns"]),
+                "input_cost_usd": cost_in,
+                "output_cost_usd": cost_out,
+                "total_cost_usd": cost_in + cost_out,
+            })
+    base = {r["model"]: r["total_cost_usd"] for r in rows if r["policy"] == BASELINE.name}
+    for r in rows:
+        base_cost = base.get(r["model"])
+        r["total_cost_vs_baseline_pct"] = (
+            100.0 * (r["total_cost_usd"] - base_cost) / base_cost if base_cost else float("nan")
+        )
+    return rows
+
+
+def parse_policies(args: argparse.Namespace) -> List[Policy]:
+    if args.policies:
+        with open(args.policies, "r", encoding="utf-8") as f:
+            policies = [Policy(**p) for p in json.load(f)]
+    else:
+        ints = lambda s: [int(x) for x in s.split(",") if x.strip()]
+        grid = itertools.product(
+            ints(args.context_turns), ints(args.max_loops), ints(args.budgets),
+            [x.strip() for x in args.stop_rules.split(",") if x.strip()],
+        )
+        policies = [Policy(*g) for g in grid]
+    for p in policies:
+        if p.stop_rule not in ("all", "any"):
+            raise SystemExit(f"Unknown stop rule {p.stop_rule!r} (all | any)")
+    # baseline first, no duplicates
+    return [BASELINE] + [p for p in dict.fromkeys(policies) if p != BASELINE]
+
+
+def main() -> None:
+    here = os.path.dirname(os.path.abspath(__file__))
+    ap = argparse.ArgumentParser(description="Replay recorded conversations under other context / loop / stop policies")
+    ap.add_argument("--input_glob", action="append", default=None,
+                    help="Glob of conversation files or a shard index (repeatable; default: indice.jsonl + the old "
+                         "conversa_*.json, each conversation once)")
+    ap.add_argument("--output_dir", default=os.path.join(here, "..", "IA user", "JSON_Conversas", "out"))
+    ap.add_argument("--workers", type=int, default=1, help="Processes over files (index: over per-shard units)")
+
+    ap.add_argument("--context_turns", default="1,2,4,6", help="Context windows to try (turns of history)")
+    ap.add_argument("--max_loops", default="6,8,10,12", help="MAX_AI_LOOPS values to try")
+    ap.add_argument("--budgets", default="0", help="Per-conversation token budgets to try (0 = none)")
+    ap.add_argument("--stop_rules", default="all,any", help="Stop rules to try: all (today), any")
+    ap.add_argument("--policies", default=None,
+                    help="JSON list of policies ({context_turns, max_loops, token_budget, stop_rule}) instead of the grid")
+
+    ap.add_argument("--decision_classes", default=",".join(DECISION_CLASSES_DEFAULT))
+    ap.add_argument("--tokenizer", choices=["approx", "tiktoken"], default="approx")
+    ap.add_argument("--gpt_encoding", default=DEFAULT_ENCODINGS["gpt"])
+    ap.add_argument("--gemini_encoding", default=DEFAULT_ENCODINGS["gemini"])
+    ap.add_argument("--token_cache", default=None, help=f"Default: <output_dir>/{TOKEN_CACHE_NAME}")
+    ap.add_argument("--prompts_dir", default=DEFAULT_PROMPTS_DIR)
+    ap.add_argument("--gpt_in_per_m", type=float, default=PRICES_DEFAULT["gpt"][0])
+    ap.add_argument("--gpt_out_per_m", type=float, default=PRICES_DEFAULT["gpt"][1])
+    ap.add_argument("--gemini_in_per_m", type=float, default=PRICES_DEFAULT["gemini"][0])
+    ap.add_argument("--gemini_out_per_m", type=float, default=PRICES_DEFAULT["gemini"][1])
+    args = ap.parse_args()
+
+    logs = os.path.join(here, "..", "IA user", "JSON_Conversas")
+    patterns = args.input_glob or [os.path.join(logs, INDEX_NAME), os.path.join(logs, "conversa_*.json")]
+    os.makedirs(args.output_dir, exist_ok=True)
+    # an index is replayed as per-shard units, so --workers has more than one file to spread
+    paths = [p for p, _ in expand_inputs(patterns, os.path.join(args.output_dir, "unidades_indice"))]
+    if not paths:
+        raise SystemExit(f"No files matched: {', '.join(patterns)}")
+    policies = parse_policies(args)
+    cfg = {
+        "prompts_dir": args.prompts_dir,
+        "tokenizer": args.tokenizer,
+        "encodings": {"gpt": args.gpt_encoding, "gemini": args.gemini_encoding},
+        "token_cache": args.token_cache or os.path.join(args.output_dir, TOKEN_CACHE_NAME),
+        "decision_classes": tuple(c.strip() for c in args.decision_classes.split(",") if c.strip()),
+    }
+    prices = {"gpt": (args.gpt_in_per_m, args.gpt_out_per_m), "gemini": (args.gemini_in_per_m, args.gemini_out_per_m)}
+
+    totals = replay_corpus(paths, policies, cfg, workers=args.workers)
+    rows = policy_rows(policies, totals, prices)
+
+    out_csv = os.path.join(args.output_dir, "policy_replay.csv")
+    with open(out_csv, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=list(rows[0]))
+        w.writeheader()
+        w.writerows(rows)
+
+    print(f"\n=== Policy replay: {len(paths)} files, {int(totals[0, 0, 0])} conversations, {len(policies)} policies ===")
+    print(f"{'policy':<42} {'turns':>6} {'saved':>6} {'input tok':>10} {'output tok':>10} {'cost USD':>9} {'vs base':>8} {'cut off':>8}")
+    by_policy: Dict[str, List[Dict[str, Any]]] = {}
+    for r in rows:
+        by_policy.setdefault(r["policy"], []).append(r)
+    base_total = sum(r["total_cost_usd"] for r in by_policy[BASELINE.name])
+    for name, rs in sorted(by_policy.items(), key=lambda kv: sum(r["total_cost_usd"] for r in kv[1])):
+        cost = sum(r["total_cost_usd"] for r in rs)
+        delta = 100.0 * (cost - base_total) / base_total if base_total else float("nan")
+        cut = "/".join(str(r["decisions_cut_off"]) for r in rs)
+        print(f"{name:<42} {rs[0]['turns']:>6} {rs[0]['turns_saved']:>6} {sum(r['input_tokens'] for r in rs):>10} "
+              f"{sum(r['output_tokens'] for r in rs):>10} {cost:>9.4f} {delta:>+7.1f}% {cut:>8}")
+    print("(cut off = decisions lost per leg, gpt/gemini)")
+    print(f"Wrote: {out_csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Seeded synthetic corpus of IA user `historico` files, for scaling tests.
+
+A CorpusProfile holds the statistics the generator samples from; by default
+it is fitted to the real logs (IA user/JSON_Conversas):
+- conversation length (turn counts, empirical),
+- words per message (lognormal per model and for the simulated user),
+- decision rate, decision-turn distribution (empirical) and decision classes per model,
+- repetition rate: share of used turns whose token set overlaps the previous
+  turn of the same model with Jaccard >= 0.5,
+- seconds between turns (lognormal, for the timestamps),
+- vocabulary (word frequencies of all messages).
+
+The generator mirrors the server: a leg that decided keeps repeating its
+final message/class on later turns, and the conversation stops when both
+legs decided or the turn budget ends. The same seed and profile always
+produce the same files. `write` uses the old per-file layout (conversa_*.json);
+`write_shards` saves the same conversations, with the same ids, through the
+server's storage (IA user/armazenamento.py: day shards + indice.jsonl).
+
+Usage:
+  python synthetic_corpus.py --n 10000 --out_dir /tmp/corpus --seed 1
+  python synthetic_corpus.py --n 1000 --out_dir /tmp/corpus --repeat_rate 0.3 --decision_rate 0.5
+  python synthetic_corpus.py --n 10000 --out_dir /tmp/corpus --layout index
+  python synthetic_corpus.py --fit_glob "../IA user/JSON_Conversas/indice.jsonl" --save_profile profile.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import re
+import sys
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from conversations import INDEX_NAME, expand_inputs, iter_conversations
+
+_WORD_RE = re.compile(r"\b\w+\b", re.UNICODE)
+_IA_USER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "IA user")
+_LOGS_DIR = os.path.join(_IA_USER_DIR, "JSON_Conversas")
+DEFAULT_FIT_GLOBS = (os.path.join(_LOGS_DIR, INDEX_NAME), os.path.join(_LOGS_DIR, "conversa_*.json"))
+DECISION_CLASSES = ("Qualificado", "Desqualificado")
+MAX_VOCAB = 5000
+
+
+@dataclass
+class ModelProfile:
+    words_mu: float = 4.3
+    words_sigma: float = 0.5
+    questions_per_msg: float = 0.8
+    decision_rate: float = 0.75
+    decision_turns: List[int] = field(default_factory=lambda: [1, 2, 3, 4, 5])
+    classes: Dict[str, float] = field(default_factory=lambda: {"Qualificado": 0.5, "Desqualificado": 0.5})
+    repeat_rate: float = 0.1
+
+
+@dataclass
+class CorpusProfile:
+    turns: List[int] = field(default_factory=lambda: [3, 5, 7, 9, 13])
+    user_words_mu: float = 3.5
+    user_words_sigma: float = 0.6
+    gap_mu: float = 2.5      # log-seconds between turns
+    gap_sigma: float = 0.5
+    vocabulary: List[str] = field(default_factory=lambda: ["caso", "valor", "direito", "cliente", "documento"])
+    weights: List[float] = field(default_factory=lambda: [1.0] * 5)
+    models: Dict[str, ModelProfile] = field(default_factory=lambda: {"gpt": ModelProfile(), "gemini": ModelProfile()})
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f, ensure_ascii=False, indent=1)
+
+    @classmethod
+    def load(cls, path: str) -> "CorpusProfile":
+        with open(path, "r", encoding="utf-8") as f:
+            d = json.load(f)
+        d["models"] = {k: ModelProfile(**v) for k, v in d["models"].items()}
+        return cls(**d)
+
+
+def _lognormal_fit(xs: List[float], default: tuple) -> tuple:
+    logs = [math.log(x) for x in xs if x > 0]
+    if len(logs) < 2:
+        return default
+    mu = sum(logs) / len(logs)
+    sd = math.sqrt(sum((v - mu) ** 2 for v in logs) / (len(logs) - 1))
+    return mu, max(sd, 0.05)
+
+
+def fit_profile(paths: List[str]) -> CorpusProfile:
+    """Profile fitted to real logs; fields without data keep the defaults."""
+    prof = CorpusProfile()
+    turns: List[int] = []
+    user_words: List[int] = []
+    gaps: List[float] = []
+    counts: Dict[str, int] = {}
+    per_model = {m: {"words": [], "questions": [], "decided": 0, "n": 0, "dturns": [], "classes": {}, "rep": [0, 0]}
+                 for m in prof.models}
+
+    for conv in iter_conversations(paths, skip_errors=True):
+        if not conv.turns:
+            continue
+        turns.append(len(conv.turns))
+        stamps = []
+        for t in conv.turns:
+            try:
+                stamps.append(datetime.fromisoformat(t.timestamp))
+            except ValueError:
+                pass
+            toks = _WORD_RE.findall(t.user.lower())
+            if toks:
+                user_words.append(len(toks))
+        gaps.extend((b - a).total_seconds() for a, b in zip(stamps, stamps[1:]))
+
+        for m, acc in per_model.items():
+            acc["n"] += 1
+            prev: Optional[set] = None
+            for i, t in enumerate(conv.turns):
+                toks = _WORD_RE.findall(t.msg(m).lower())
+                for w in toks:
+                    counts[w] = counts.get(w, 0) + 1
+                acc["words"].append(len(toks))
+                acc["questions"].append(t.msg(m).count("?"))
+                cur = set(toks)
+                if prev is not None and (cur or prev):
+                    acc["rep"][1] += 1
+                    acc["rep"][0] += len(cur & prev) / len(cur | prev) >= 0.5
+                prev = cur
+                if t.cls(m) in DECISION_CLASSES:
+                    acc["decided"] += 1
+                    acc["dturns"].append(i)
+                    acc["classes"][t.cls(m)] = acc["classes"].get(t.cls(m), 0) + 1
+                    break
+
+    if turns:
+        prof.turns = turns
+    prof.user_words_mu, prof.user_words_sigma = _lognormal_fit(user_words, (prof.user_words_mu, prof.user_words_sigma))
+    prof.gap_mu, prof.gap_sigma = _lognormal_fit(gaps, (prof.gap_mu, prof.gap_sigma))
+    if counts:
+        top = sorted(counts.items(), key=lambda kv: -kv[1])[:MAX_VOCAB]
+        prof.vocabulary = [w for w, _ in top]
+        prof.weights = [float(c) for _, c in top]
+    for m, acc in per_model.items():
+        mp = prof.models[m]
+        mp.words_mu, mp.words_sigma = _lognormal_fit(acc["words"], (mp.words_mu, mp.words_sigma))
+        if acc["questions"]:
+            mp.questions_per_msg = sum(acc["questions"]) / len(acc["questions"])
+        if acc["n"]:
+            mp.decision_rate = acc["decided"] / acc["n"]
+        if acc["dturns"]:
+            mp.decision_turns = acc["dturns"]
+            total = sum(acc["classes"].values())
+            mp.classes = {c: n / total for c, n in acc["classes"].items()}
+        if acc["rep"][1]:
+            mp.repeat_rate = acc["rep"][0] / acc["rep"][1]
+    return prof
+
+
+class CorpusGenerator:
+    def __init__(self, profile: CorpusProfile, seed: int = 0):
+        self.profile = profile
+        self.rng = np.random.default_rng(seed)
+        w = np.asarray(profile.weights, dtype=np.float64)
+        self.cdf = np.cumsum(w / w.sum())
+        self.vocab = np.asarray(profile.vocabulary, dtype=object)
+
+    def _text(self, mu: float, sigma: float, questions: float = 0.0) -> str:
+        n = max(1, int(self.rng.lognormal(mu, sigma)))
+        idx = np.minimum(np.searchsorted(self.cdf, self.rng.random(n)), len(self.vocab) - 1)
+        words = self.vocab[idx].tolist()
+        words[0] = words[0].capitalize()
+        text = " ".join(words)
+        n_q = self.rng.poisson(questions)
+        if n_q:
+            cuts = sorted(self.rng.choice(len(words), size=min(n_q, len(words)), replace=False).tolist())
+            parts = [" ".join(words[a:b]) for a, b in zip([0] + cuts, cuts + [len(words)]) if b > a]
+            return "? ".join(parts) + "?"
+        return text + "."
+
+    def _near_repeat(self, text: str) -> str:
+        """Previous message with ~10% of its words replaced (a near-duplicate)."""
+        words = text.split()
+        k = max(1, len(words) // 10)
+        for i in self.rng.choice(len(words), size=min(k, len(words)), replace=False):
+            words[i] = str(self.vocab[min(np.searchsorted(self.cdf, self.rng.random()), len(self.vocab) - 1)])
+        return " ".join(words)
+
+    def conversation(self, start: datetime) -> List[Dict]:
+        p = self.profile
+        budget = int(self.rng.choice(p.turns))
+        decision: Dict[str, Optional[int]] = {}
+        for m, mp in p.models.items():
+            if self.rng.random() < mp.decision_rate:
+                d = int(self.rng.choice(mp.decision_turns)) + int(self.rng.integers(-1, 2))
+                decision[m] = max(0, d)
+            else:
+                decision[m] = None
+        ends = [d for d in decision.values() if d is not None]
+        n_turns = max(ends) + 1 if len(ends) == len(decision) else max(budget, max(ends, default=0) + 1)
+
+        hist: List[Dict] = []
+        last: Dict[str, Dict[str, str]] = {}
+        ts = start
+        for i in range(n_turns):
+            turn = {
+                "timestamp": ts.isoformat(),
+                "loop": i,
+                "user_simulado": self._text(p.user_words_mu, p.user_words_sigma),
+            }
+            for m, mp in p.models.items():
+                d = decision[m]
+                if d is not None and i > d:
+                    turn[m] = dict(last[m])  # leg already finished: server repeats its final answer
+                    continue
+                if m in last and self.rng.random() < mp.repeat_rate:
+                    msg = self._near_repeat(last[m]["msg"])
+                else:
+                    msg = self._text(mp.words_mu, mp.words_sigma, mp.questions_per_msg)
+                if d == i:
+                    classes = list(mp.classes)
+                    cls = classes[int(self.rng.choice(len(classes), p=np.asarray(list(mp.classes.values())) / sum(mp.classes.values())))]
+                else:
+                    cls = "Conversando"
+                turn[m] = last[m] = {"msg": msg, "class": cls}
+            hist.append(turn)
+            ts += timedelta(seconds=float(self.rng.lognormal(p.gap_mu, p.gap_sigma)))
+        return hist
+
+    def _conversations(self, n: int, start: Optional[datetime]) -> Iterator[Tuple[datetime, str, List[Dict]]]:
+        """(start time, conversa_* name, historico) of n conversations, chronological."""
+        ts = start or datetime(2026, 1, 1, 8, 0, 0)
+        width = len(str(max(n - 1, 0)))
+        for i in range(n):
+            hist = self.conversation(ts)
+            yield ts, f"conversa_{ts.strftime('%Y-%m-%d_%H-%M-%S')}_syn{i:0{width}d}", hist
+            ts += timedelta(seconds=float(self.rng.integers(60, 600)))
+
+    def write(self, out_dir: str, n: int, start: Optional[datetime] = None) -> List[str]:
+        """Writes n conversation files; returns their paths (sorted = chronological)."""
+        os.makedirs(out_dir, exist_ok=True)
+        paths = []
+        for _, name, hist in self._conversations(n, start):
+            path = os.path.join(out_dir, name + ".json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"historico": hist}, f, ensure_ascii=False)
+            paths.append(path)
+        return paths
+
+    def write_shards(self, out_dir: str, n: int, start: Optional[datetime] = None, compression: str = "gzip") -> List[str]:
+        """
+        Saves n conversations into day shards + indice.jsonl under out_dir, as
+        the server does (the file name `write` would use becomes the record id);
+        returns [index path].
+        """
+        if _IA_USER_DIR not in sys.path:
+            sys.path.insert(0, _IA_USER_DIR)
+        from armazenamento import Armazenamento
+
+        store = Armazenamento(out_dir, compression)
+        os.makedirs(out_dir, exist_ok=True)
+        for ts, name, hist in self._conversations(n, start):
+            store.salvar(hist, instante=ts, id_registro=name)
+        return [store.caminho_indice]
+
+
+def build_profile(args: argparse.Namespace) -> CorpusProfile:
+    if args.profile:
+        prof = CorpusProfile.load(args.profile)
+    else:
+        paths = [p for p, _ in expand_inputs(args.fit_glob or DEFAULT_FIT_GLOBS)]
+        prof = fit_profile(paths) if paths else CorpusProfile()
+        print(f"Profile fitted to {len(paths)} files/indexes" if paths else "No logs to fit; using the default profile")
+    for mp in prof.models.values():
+        if args.decision_rate is not None:
+            mp.decision_rate = args.decision_rate
+        if args.repeat_rate is not None:
+            mp.repeat_rate = args.repeat_rate
+        mp.words_mu += math.log(args.length_scale)
+    if args.max_turns is not None:
+        prof.turns = [min(t, args.max_turns) for t in prof.turns]
+        for mp in prof.models.values():
+            mp.decision_turns = [min(t, args.max_turns - 1) for t in mp.decision_turns]
+    return prof
+
+
+def add_profile_args(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument("--fit_glob", action="append", default=None,
+                    help="Real logs the profile is fitted to (repeatable; default: indice.jsonl + the old conversa_*.json)")
+    ap.add_argument("--profile", default=None, help="Load a saved profile JSON instead of fitting")
+    ap.add_argument("--decision_rate", type=float, default=None, help="Override the decision rate of both models")
+    ap.add_argument("--repeat_rate", type=float, default=None, help="Override the near-repeat rate of both models")
+    ap.add_argument("--length_scale", type=float, default=1.0, help="Multiply message lengths")
+    ap.add_argument("--max_turns", type=int, default=None, help="Cap conversation length")
+    ap.add_argument("--seed", type=int, default=0)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Seeded synthetic historico corpus")
+    ap.add_argument("--n", type=int, default=1000, help="Number of conversations")
+    ap.add_argument("--out_dir", default=None, help="Where to write the corpus")
+    ap.add_argument("--layout", choices=("files", "index"), default="files",
+                    help="files: one conversa_*.json each; index: day shards + indice.jsonl")
+    ap.add_argument("--save_profile", default=None, help="Write the (fitted + overridden) profile as JSON")
+    add_profile_args(ap)
+    args = ap.parse_args()
+
+    prof = build_profile(args)
+    if args.save_profile:
+        prof.save(args.save_profile)
+        print(f"Wrote profile: {args.save_profile}")
+    if args.out_dir:
+        gen = CorpusGenerator(prof, seed=args.seed)
+        if args.layout == "index":
+            gen.write_shards(args.out_dir, args.n)
+        else:
+            gen.write(args.out_dir, args.n)
+        print(f"Wrote {args.n} conversations to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
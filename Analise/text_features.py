@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Single-pass text features for assistant messages.
+
+Each message is lowercased and tokenized exactly once (one regex scan); the
+tokens give the word count and a hashed token-set signature used for Jaccard
+similarity. Character counts (-> approx tokens) and question marks
+come from C-level str operations. Features of a batch of messages live in flat
+NumPy arrays, so per-segment sums/means and all consecutive-pair Jaccard
+scores of a batch are computed with array operations.
+
+Signatures use Python's built-in str hash (64-bit, salted per process). They
+are only compared within one process, which is where a conversation is
+analyzed; do not persist them.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import List, NamedTuple, Sequence
+
+import numpy as np
+
+_WORD_RE = re.compile(r"\b\w+\b", re.UNICODE)
+
+
+class FeatureBatch(NamedTuple):
+    chars: np.ndarray           # int64, len(text)
+    words: np.ndarray           # int64, number of \b\w+\b tokens
+    questions: np.ndarray       # int64, count of "?"
+    sig_offsets: np.ndarray     # int64, len n+1; signature of message i is sig_values[o[i]:o[i+1]]
+    sig_values: np.ndarray      # int64, unique token hashes per message
+
+    def __len__(self) -> int:
+        return len(self.chars)
+
+    @property
+    def approx_tokens(self) -> np.ndarray:
+        """~1 token per 4 chars, rounded up (same rule as approx_tokens())."""
+        return (self.chars + 3) // 4
+
+
+def extract_batch(texts: Sequence[str]) -> FeatureBatch:
+    n = len(texts)
+    chars = np.empty(n, dtype=np.int64)
+    words = np.empty(n, dtype=np.int64)
+    questions = np.empty(n, dtype=np.int64)
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    values: List[int] = []
+    findall = _WORD_RE.findall
+    for i, text in enumerate(texts):
+        text = text or ""
+        toks = findall(text.lower())
+        chars[i] = len(text)
+        words[i] = len(toks)
+        questions[i] = text.count("?")
+        values.extend(set(map(hash, toks)))
+        offsets[i + 1] = len(values)
+    return FeatureBatch(chars, words, questions, offsets, np.array(values, dtype=np.int64))
+
+
+def jaccard_pairs(batch: FeatureBatch, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """
+    Jaccard similarity of the token sets of messages left[k] and right[k], for all k
+    at once. Both empty -> 1.0; one empty -> 0.0 (same convention as jaccard()).
+    """
+    left = np.asarray(left, dtype=np.int64)
+    right = np.asarray(right, dtype=np.int64)
+    n_pairs = len(left)
+    if n_pairs == 0:
+        return np.empty(0, dtype=np.float64)
+
+    off = batch.sig_offsets
+    len_l = off[left + 1] - off[left]
+    len_r = off[right + 1] - off[right]
+
+    # Gather every (pair id, hash) of both sides; within a pair each side is
+    # already unique, so a repeated (pair id, hash) means the hash is shared.
+    def gather(idx: np.ndarray, lens: np.ndarray) -> np.ndarray:
+        total = int(lens.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        starts = np.repeat(off[idx], lens)
+        within = np.arange(total) - np.repeat(np.cumsum(lens) - lens, lens)
+        return batch.sig_values[starts + within]
+
+    pair_ids = np.concatenate([np.repeat(np.arange(n_pairs), len_l), np.repeat(np.arange(n_pairs), len_r)])
+    hashes = np.concatenate([gather(left, len_l), gather(right, len_r)])
+    order = np.lexsort((hashes, pair_ids))
+    p_sorted, h_sorted = pair_ids[order], hashes[order]
+    dup = (p_sorted[1:] == p_sorted[:-1]) & (h_sorted[1:] == h_sorted[:-1])
+    inter = np.bincount(p_sorted[1:][dup], minlength=n_pairs)
+
+    union = len_l + len_r - inter
+    out = np.zeros(n_pairs, dtype=np.float64)
+    both_empty = union == 0
+    out[both_empty] = 1.0
+    nz = ~both_empty
+    out[nz] = inter[nz] / union[nz]
+    return out
+
+
+def consecutive_jaccard(batch: FeatureBatch, start: int = 0, stop: int = -1) -> np.ndarray:
+    """Jaccard between messages i and i+1 for start <= i < stop-1 (stop=-1: end of batch)."""
+    stop = len(batch) if stop < 0 else stop
+    if stop - start < 2:
+        return np.empty(0, dtype=np.float64)
+    left = np.arange(start, stop - 1)
+    return jaccard_pairs(batch, left, left + 1)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Exact token counts for the analysis (tiktoken), with a persistent cache.
+
+The servers count output tokens with tiktoken (`contar_tokens` in both apps,
+encoding of "gpt-4o-mini" for both legs), so the default encoder per model
+mirrors that. Counts are stored in a SQLite file keyed by
+(tokenizer id, BLAKE2b-128 of the message), so a message is tokenized once
+across all runs, files and worker processes; only cache misses reach the
+encoder, in one batch call per file and model.
+
+tiktoken is only imported when a counter is built, so the default
+approximate mode (len/4) does not need it.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+TOKEN_CACHE_NAME = "token_cache.sqlite"
+
+# Same encoder the servers use for both legs (see contar_tokens in the apps).
+DEFAULT_ENCODINGS = {"gpt": "gpt-4o-mini", "gemini": "gpt-4o-mini"}
+
+# SQLite limit on bound parameters per statement (conservative).
+_SQL_CHUNK = 900
+
+
+def message_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class TiktokenCounter:
+    """One tiktoken encoder; `name` is a model name or an encoding name."""
+
+    def __init__(self, name: str):
+        import tiktoken
+
+        try:
+            self.enc = tiktoken.encoding_for_model(name)
+        except KeyError:
+            self.enc = tiktoken.get_encoding(name)
+        self.id = f"tiktoken:{self.enc.name}"
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        return [len(ids) for ids in self.enc.encode_ordinary_batch(texts)]
+
+
+class TokenCache:
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")  # concurrent readers + one writer (worker pool)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS tokens ("
+            "tokenizer TEXT NOT NULL, key BLOB NOT NULL, n INTEGER NOT NULL, "
+            "PRIMARY KEY (tokenizer, key)) WITHOUT ROWID"
+        )
+        self.conn.commit()
+
+    def get_many(self, tokenizer: str, keys: Sequence[bytes]) -> Dict[bytes, int]:
+        found: Dict[bytes, int] = {}
+        for i in range(0, len(keys), _SQL_CHUNK):
+            chunk = keys[i : i + _SQL_CHUNK]
+            q = f"SELECT key, n FROM tokens WHERE tokenizer = ? AND key IN ({','.join('?' * len(chunk))})"
+            found.update(self.conn.execute(q, (tokenizer, *chunk)).fetchall())
+        return found
+
+    def put_many(self, tokenizer: str, items: Dict[bytes, int]) -> None:
+        if not items:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO tokens (tokenizer, key, n) VALUES (?, ?, ?)",
+                [(tokenizer, k, n) for k, n in items.items()],
+            )
+
+
+@lru_cache(maxsize=None)
+def get_counter(name: str) -> TiktokenCounter:
+    """One encoder per name per process."""
+    return TiktokenCounter(name)
+
+
+@lru_cache(maxsize=None)
+def get_cache(path: str) -> TokenCache:
+    """One connection per cache file per process."""
+    return TokenCache(path)
+
+
+def count_tokens(texts: Sequence[str], counter: TiktokenCounter, cache: Optional[TokenCache] = None) -> np.ndarray:
+    """Token count of every text (int64), encoding only the distinct texts missing from the cache."""
+    texts = [t or "" for t in texts]
+    keys = [message_key(t) for t in texts]
+    known: Dict[bytes, int] = cache.get_many(counter.id, list(set(keys))) if cache else {}
+
+    missing: Dict[bytes, str] = {}
+    for k, t in zip(keys, texts):
+        if k not in known and k not in missing:
+            missing[k] = t
+    if missing:
+        fresh = dict(zip(missing, counter.count_batch(list(missing.values()))))
+        if cache:
+            cache.put_many(counter.id, fresh)
+        known.update(fresh)
+    return np.fromiter((known[k] for k in keys), dtype=np.int64, count=len(keys))
@@ -1,9 +1,11 @@
 from flask import Flask, render_template, request, jsonify
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, join_room
 import requests
 import tiktoken
 import os
 import json
+import threading
+import zlib
 from datetime import datetime
 
 # ==========================
@@ -16,6 +18,10 @@ socketio = SocketIO(app, cors_allowed_origins="*")
 # URL do seu Webhook
 N8N_WEBHOOK_URL = "https://n8ndev.intelibox.com.br/webhook/tcc_multi"
 
+# Socket.IO: emite só para a sala da sessão, e "resposta" leva só os campos que mudaram (com número de sequência)
+SALA = "sessao:padrao"
+SOCKET_COMPRIMIR_ACIMA = 8192  # bytes do JSON do delta; acima disso vai comprimido (deflate, binário). None desliga
+
 # ==========================
 # 💰 CONFIGURAÇÃO DE PREÇOS (Por 1 Milhão de Tokens)
 # ==========================
@@ -28,6 +34,8 @@ session_costs = {
     "gemini_total": 0.0
 }
 conversation_history = []
+envio = {"seq": 0, "ultimo": {}}  # último estado enviado ao front (base dos deltas)
+envio_lock = threading.Lock()
 
 # ==========================
 # 🔢 UTILITÁRIOS
@@ -45,6 +53,20 @@ def normalizar_quebras(texto: str) -> str:
     if not texto: return ""
     return texto.replace("\r\n", "\n").replace("\r", "\n")
 
+def codificar_delta(seq: int, delta: dict) -> dict:
+    bruto = json.dumps(delta, ensure_ascii=False).encode("utf-8")
+    if SOCKET_COMPRIMIR_ACIMA is not None and len(bruto) > SOCKET_COMPRIMIR_ACIMA:
+        return {"seq": seq, "deflate": zlib.compress(bruto, 6)}  # o front descomprime com DecompressionStream
+    return {"seq": seq, **delta}
+
+def emitir_delta(evento: str, campos: dict):
+    """Emite na sala só os campos que mudaram desde o último envio (o front acumula o estado)."""
+    with envio_lock:
+        delta = {k: v for k, v in campos.items() if k not in envio["ultimo"] or envio["ultimo"][k] != v}
+        envio["ultimo"].update(delta)
+        envio["seq"] += 1
+        socketio.emit(evento, codificar_delta(envio["seq"], delta), to=SALA)
+
 # ==========================
 # 🌐 ROTAS
 # ==========================
@@ -74,6 +96,9 @@ def processar():
         conversation_history = []
         session_costs["gpt_total"] = 0.0
         session_costs["gemini_total"] = 0.0
+        with envio_lock:
+            envio["seq"] = 0
+            envio["ultimo"] = {}
         
         try:
             requests.post(N8N_WEBHOOK_URL, json={"entrada": "reset"}, timeout=5)
@@ -81,9 +106,10 @@ def processar():
 
         socketio.emit("resposta", {
             "status": "reset",
+            "seq": 0,
             "gpt_msg": "Memória Limpa.",
             "gemini_msg": "Memória Limpa."
-        })
+        }, to=SALA)
         return jsonify({"status": "reset"})
 
     # ==========================
@@ -160,9 +186,9 @@ def processar():
     })
 
     # ==========================
-    # 🚀 ENVIA AO FRONT
+    # 🚀 ENVIA AO FRONT (só o que mudou)
     # ==========================
-    socketio.emit("resposta", {
+    emitir_delta("resposta", {
         "gpt_msg": gpt_msg,
         "gemini_msg": gemini_msg,
         "gpt_classificacao": gpt_class,
@@ -179,6 +205,13 @@ def processar():
 
     return jsonify({"status": "ok"})
 
+@socketio.on("entrar")
+def entrar(dados=None):
+    # O ack traz o estado completo para quem chega ou perdeu um delta
+    join_room(SALA)
+    with envio_lock:
+        return {"seq": envio["seq"], "estado": dict(envio["ultimo"])}
+
 # ==========================
 # 💾 SALVAR JSON
 # ==========================
@@ -15,6 +15,11 @@ let totalGem = 0;
 let runCount = 0;
 let conversation = [];
 
+// O servidor manda só os campos que mudaram (delta com "seq"); `estado` acumula a resposta completa
+let estado = {};
+let ultimoSeq = 0;
+let fila = Promise.resolve();
+
 /* -----------------------------
    Helpers
 ----------------------------- */
@@ -150,11 +155,37 @@ sendButton.addEventListener("click", enviarMensagem);
    Receber resposta (Socket)
 ----------------------------- */
 
-socket.on("resposta", (data) => {
-  console.log("📩 Recebido:", data);
+// Entra na sala (também a cada reconexão); o ack traz o estado completo
+function sincronizar() {
+  socket.emit("entrar", {}, (snap) => {
+    if (!snap) return;
+    if (snap.seq >= ultimoSeq) {
+      estado = snap.estado || {};
+      ultimoSeq = snap.seq;
+    } else {
+      estado = { ...(snap.estado || {}), ...estado };
+    }
+  });
+}
+
+// Deltas grandes chegam comprimidos: {"seq", "deflate": <binário>}
+async function decodificar(data) {
+  if (!data.deflate) return data;
+  const fluxo = new Blob([data.deflate]).stream().pipeThrough(new DecompressionStream("deflate"));
+  return { seq: data.seq, ...JSON.parse(await new Response(fluxo).text()) };
+}
+
+// Fila: a descompressão é assíncrona e os deltas precisam ser aplicados na ordem
+socket.on("resposta", (bruto) => {
+  fila = fila.then(() => decodificar(bruto)).then(aplicarResposta).catch(console.error);
+});
+
+function aplicarResposta(delta) {
+  console.log("📩 Recebido:", delta);
 
   // 1. Verifica Reset
-  if (data.status === "reset") {
+  if (delta.status === "reset") {
+      estado = {}; ultimoSeq = 0;
       totalGPT = 0; totalGem = 0; runCount = 0;
       if(runsBody) runsBody.innerHTML = "";
       
@@ -170,6 +201,11 @@ socket.on("resposta", (data) => {
       return;
   }
 
+  // Perdeu um delta: pede o estado completo
+  if (ultimoSeq && delta.seq !== ultimoSeq + 1) sincronizar();
+  ultimoSeq = delta.seq;
+  const data = estado = { ...estado, ...delta };
+
   // 2. Extrai dados
   const gptMsg = data.gpt_msg || "";
   const gemMsg = data.gemini_msg || "";
@@ -238,10 +274,11 @@ socket.on("resposta", (data) => {
 
   toggleTyping(false);
   sendButton.disabled = false;
-});
+}
 
 socket.on("connect", () => {
   console.log("✅ Conectado ao Flask via Socket.IO");
+  sincronizar();
 });
 
 /* -----------------------------
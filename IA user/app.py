@@ -1,14 +1,26 @@
 import eventlet
 eventlet.monkey_patch() 
+from eventlet import tpool
 
 from flask import Flask, render_template, request, jsonify
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, join_room
 import requests
 import tiktoken
-import os
 import json
+import threading
+import time
+import zlib
 from datetime import datetime
 
+from roteador_agentes import RoteadorAgentes
+from personas import PERSONAS, ClienteSimulado
+from classificador_decisao import ClassificadorDecisao, MODELO_PADRAO, acumular_ngramas, acumular_turno
+from metricas_ao_vivo import AgregadorAoVivo
+from casos_similares import IndiceCasos, INDICE_CASOS_PADRAO, caso_de_historico, formatar_exemplos
+from armazenamento import Armazenamento
+from turnos import Turno, HistoricoLimitado
+import busca
+
 # ==========================
 # 🔧 CONFIGURAÇÃO
 # ==========================
@@ -21,13 +33,75 @@ MAX_AI_LOOPS = 12
 PRICE_GPT_OUTPUT_1M = 1.60 
 PRICE_GEMINI_OUTPUT_1M = 2.50 
 
-# Variáveis Globais
-session_costs = { "gpt_total": 0.0, "gemini_total": 0.0 }
-conversation_history = [] 
+# Classificador local: "dica" injeta o sinal no prompt, "desligado" ignora
+CLASSIFICADOR_MODO = "dica"
+# Casos parecidos: "exemplos" injeta os k casos já decididos mais parecidos, "desligado" ignora
+CASOS_MODO = "exemplos"
+# Turnos de cada sessão mantidos em memória; os mais antigos vão para JSON_Conversas/sessoes_ativas/<sessao>.jsonl
+HISTORICO_TURNOS_MEMORIA = 16
+
+# Socket.IO: cada sessão emite só para a sua sala ("sessao:<nome>"); o canal "metricas" só para a sala "metricas".
+# "resposta" leva só os campos que mudaram desde o envio anterior da sessão, com número de sequência.
+SOCKET_COMPRIMIR_ACIMA = 8192  # bytes do JSON do delta; acima disso vai comprimido (deflate, binário). None desliga
+SALA_METRICAS = "metricas"
+
+# Variáveis Globais (estado por sessão; o front usa a sessão "padrao")
+sessoes = {}  # sessao -> {"historico": HistoricoLimitado de Turno, "custos": {...}}
+roteador = RoteadorAgentes()
+contagens_sessao = {}  # sessao -> n-gramas acumulados do histórico (classificador local)
+consulta_sessao = {}  # sessao -> n-gramas do que o cliente disse (consulta dos casos parecidos)
+clientes_simulados = {}  # sessao -> ClienteSimulado (persona roteirizada no lugar do LLM do cliente)
+metricas = AgregadorAoVivo()  # estatísticas em streaming de todas as sessões (GET /metricas, canal "metricas")
+armazenamento = Armazenamento()  # /salvar_conversa: shards comprimidos por data + índice (JSON_Conversas/indice.jsonl)
+busca_estado = {"rodando": False, "pendente": False}  # indexação do FTS (indexar_busca), uma rodada por vez
+envio_lock = threading.Lock()  # sequência e estado enviado de todas as sessões
+
+classificador = None
+if CLASSIFICADOR_MODO != "desligado":
+    try: classificador = ClassificadorDecisao.carregar(MODELO_PADRAO)
+    except FileNotFoundError: print("⚠️ Classificador local sem modelo treinado (rode classificador_decisao.py treinar)")
+
+indice_casos = None
+if CASOS_MODO != "desligado":
+    try: indice_casos = IndiceCasos.carregar(INDICE_CASOS_PADRAO)
+    except FileNotFoundError: print("⚠️ Casos parecidos sem índice (rode casos_similares.py construir)")
 
 # ==========================
 # 🛠️ UTILITÁRIOS
 # ==========================
+def obter_sessao(sessao):
+    if sessao not in sessoes:
+        sessoes[sessao] = {"historico": HistoricoLimitado(sessao, HISTORICO_TURNOS_MEMORIA), "custos": {"gpt_total": 0.0, "gemini_total": 0.0},
+                            "envio": {"seq": 0, "ultimo": {}}}
+    return sessoes[sessao]
+
+def limpar_sessao(sessao):
+    estado = sessoes.pop(sessao, None)
+    if estado: estado["historico"].descartar()
+    roteador.resetar(sessao)
+    contagens_sessao.pop(sessao, None)
+    consulta_sessao.pop(sessao, None)
+    clientes_simulados.pop(sessao, None)
+    metricas.encerrar_sessao(sessao)
+
+def sala(sessao):
+    return f"sessao:{sessao}"
+
+def codificar_delta(seq, delta):
+    bruto = json.dumps(delta, ensure_ascii=False).encode("utf-8")
+    if SOCKET_COMPRIMIR_ACIMA is not None and len(bruto) > SOCKET_COMPRIMIR_ACIMA:
+        return {"seq": seq, "deflate": zlib.compress(bruto, 6)}  # o front descomprime com DecompressionStream
+    return {"seq": seq, **delta}
+
+def emitir_delta(sessao, evento, campos):
+    """Emite na sala da sessão só os campos que mudaram desde o último envio (o front acumula o estado)."""
+    with envio_lock:
+        envio = obter_sessao(sessao)["envio"]
+        delta = {k: v for k, v in campos.items() if k not in envio["ultimo"] or envio["ultimo"][k] != v}
+        envio["ultimo"].update(delta)
+        envio["seq"] += 1
+        socketio.emit(evento, codificar_delta(envio["seq"], delta), to=sala(sessao))
+
 def contar_tokens(texto, modelo="gpt-4o-mini"):
     try:
         if not texto: return 0
@@ -92,12 +166,20 @@ def index():
 
 @app.route("/processar", methods=["POST"])
 def processar():
-    global conversation_history, session_costs
-    
+    recebido_em = datetime.now()
     dados = request.get_json(silent=True) or {}
     loop_count = int(dados.get("loop_count", 0))
     user_type = dados.get("user_type", "human")
     user_input = dados.get("entrada", "")
+    sessao = dados.get("sessao", "padrao")
+    persona = dados.get("persona")
+    if persona and persona not in PERSONAS:
+        return jsonify({"status": "erro", "mensagem": f"Persona desconhecida: {persona}"}), 400
+
+    # Usados pelo runner de experimentos: pernas ativas, versão do prompt e loop controlado por fora
+    modelos = dados.get("modelos") or ["gpt", "gemini"]
+    prompt_versao = dados.get("prompt_versao")
+    auto_loop = dados.get("auto_loop", True)
 
     print(f"\n📨 [LOOP {loop_count}] Processando...")
 
@@ -105,23 +187,24 @@ def processar():
     if user_input.strip().lower() == "reset":
         print("🗑️ Resetando memória...")
         
-        # Usa .clear() para garantir que a lista GLOBAL seja esvaziada
-        conversation_history.clear() 
-        
-        # Reseta custos
-        session_costs["gpt_total"] = 0.0
-        session_costs["gemini_total"] = 0.0
+        # Histórico, custos e estado dos ajudantes da sessão
+        limpar_sessao(sessao)
         
         # Avisa n8n (opcional, já que tiramos a memória de lá)
         try: requests.post(N8N_WEBHOOK_URL, json={"entrada": "reset"}, timeout=5)
         except: pass
         
-        socketio.emit("resposta", {"status": "reset"})
+        socketio.emit("resposta", {"status": "reset", "seq": 0}, to=sala(sessao))
         return jsonify({"status": "reset"})
 
+    estado = obter_sessao(sessao)
+    conversation_history = estado["historico"]
+    session_costs = estado["custos"]
+
     # --- TRAVA DE SEGURANÇA (Quem já acabou?) ---
-    gpt_ja_acabou = False
-    gem_ja_acabou = False
+    # Perna fora de `modelos` conta como encerrada desde o início
+    gpt_ja_acabou = "gpt" not in modelos
+    gem_ja_acabou = "gemini" not in modelos
     gpt_msg_final = ""
     gpt_class_final = ""
     gem_msg_final = ""
@@ -144,26 +227,71 @@ def processar():
             gem_msg_final = ultimo['gemini']['msg']
             gem_class_final = ultimo['gemini']['class']
 
+    # --- PERSONA (cliente simulado local, sem chamada ao LLM do cliente) ---
+    cliente = None
+    if persona and user_type == "ai_user":
+        cliente = clientes_simulados.get(sessao)
+        if cliente is None or cliente.persona.nome != persona:
+            cliente = clientes_simulados[sessao] = ClienteSimulado(persona, dados.get("seed", 0))
+        ultimo = conversation_history[-1] if conversation_history else {}
+        user_input = cliente.responder(ultimo.get("gpt", {}).get("msg"), ultimo.get("gemini", {}).get("msg"))
+
     # --- INJEÇÃO DE CONTEXTO ---
     contexto = formatar_contexto_historico(conversation_history)
     entrada_completa = f"{contexto}\n{user_input}" if contexto else user_input
 
+    # --- CLASSIFICADOR LOCAL (decisão antecipada) ---
+    decisao_local = None
+    if classificador:
+        # Mesmas features das amostras de treino (amostras_de_conversa): só os turnos 0..t-1 como
+        # foram salvos, sem a entrada atual (no ai_user sem persona a fala do cliente nem existe ainda)
+        contagens = contagens_sessao.get(sessao, {})
+        decisao_local = classificador.decisao_antecipada(contagens, len(conversation_history))
+        if decisao_local:
+            classe_local, conf_local = decisao_local
+            print(f"🔮 Classificador local: {classe_local} ({conf_local:.0%})")
+            entrada_completa += (
+                f"\n\n[Sinal interno: o caso tende a ser {classe_local} (confiança {conf_local:.0%}). "
+                "Se fatos, pedido e material já estiverem completos, finalize com a classificação.]"
+            )
+
+    # --- CASOS PARECIDOS (exemplos de casos já decididos) ---
+    casos = []
+    # Só o que o cliente disse: a entrada do ai_user sem persona é o prompt do LLM do cliente
+    fala_cliente = user_input if (user_type == "human" or cliente) else ""
+    if indice_casos:
+        casos = indice_casos.buscar(acumular_ngramas(fala_cliente, dict(consulta_sessao.get(sessao, {}))))
+        if casos:
+            print(f"📚 Casos parecidos: {', '.join(c['classe'] + ' ' + format(c['score'], '.2f') for c in casos)}")
+            entrada_completa += "\n\n" + formatar_exemplos(casos)
+
     # Variáveis da Rodada Atual
     final_gpt_msg = gpt_msg_final
     final_gpt_class = gpt_class_final
     final_gem_msg = gem_msg_final
     final_gem_class = gem_class_final
-    final_user_msg = ""
+    final_user_msg = user_input if cliente else ""
     resumo_encontrado = ""
+    # Janela da chamada ao n8n (latência do upstream, separada do nosso ritmo de 3 s entre turnos)
+    inicio_n8n = fim_n8n = None
+    erro_n8n = ""
 
     # Só chama n8n se alguém ainda estiver vivo
     if not (gpt_ja_acabou and gem_ja_acabou):
+        # Só aciona os sub-agentes com checklist em aberto
+        agentes = roteador.rotear(sessao)
+        inicio_n8n = datetime.now()
         try:
             resposta = requests.post(
                 N8N_WEBHOOK_URL, 
-                json={"entrada": entrada_completa, "user_type": user_type}, 
+                # Com persona o cliente já foi gerado aqui: o n8n trata a entrada como humana
+                json={
+                    "entrada": entrada_completa, "user_type": "human" if cliente else user_type,
+                    "agentes": agentes, "modelos": modelos, "prompt_versao": prompt_versao,
+                }, 
                 timeout=90
             )
+            fim_n8n = datetime.now()
             resposta.raise_for_status()
             data = resposta.json()
 
@@ -176,6 +304,7 @@ def processar():
 
             for item in items_to_process:
                 out = item.get("output", item.get("json", item))
+                roteador.registrar_saida(sessao, out)
                 
                 # Só atualiza quem NÃO acabou
                 if not gpt_ja_acabou:
@@ -189,13 +318,15 @@ def processar():
                     if gm_class: final_gem_class = gm_class
 
                 u_msg, _ = limpar_dado_json(out.get("IA_user"))
-                if u_msg: final_user_msg = u_msg
+                if u_msg and not cliente: final_user_msg = u_msg
 
                 if "resumo" in out:
                     resumo_encontrado = out["resumo"]
 
         except Exception as e:
+            fim_n8n = fim_n8n or datetime.now()
             print("❌ Erro n8n:", e)
+            erro_n8n = str(e) or type(e).__name__
             if not gpt_ja_acabou: final_gpt_msg = "Erro ao conectar"
 
     # --- INJEÇÃO DE RESUMO ---
@@ -224,16 +355,36 @@ def processar():
     session_costs["gemini_total"] += custo_gem
 
     # Salva
-    conversation_history.append({
+    turno = {
         "timestamp": datetime.now().isoformat(),
+        "recebido": recebido_em.isoformat(),
         "loop": loop_count,
         "user_simulado": final_user_msg,
         "gpt": {"msg": final_gpt_msg, "class": final_gpt_class},
         "gemini": {"msg": final_gem_msg, "class": final_gem_class}
-    })
-
-    # Envia
-    socketio.emit("resposta", {
+    }
+    # Início/fim da chamada só nas pernas que responderam neste turno
+    latencia_n8n = (fim_n8n - inicio_n8n).total_seconds() if inicio_n8n else None
+    for perna, acabou in (("gpt", gpt_ja_acabou), ("gemini", gem_ja_acabou)):
+        if inicio_n8n and not acabou:
+            turno[perna].update(inicio=inicio_n8n.isoformat(), fim=fim_n8n.isoformat())
+    if decisao_local:
+        turno["classificador_local"] = {"class": decisao_local[0], "confianca": round(decisao_local[1], 4)}
+    if casos:
+        turno["casos_similares"] = [{"id": c["id"], "class": c["classe"], "score": c["score"]} for c in casos]
+    conversation_history.append(Turno.de_json(turno))  # compacto na memória; `turno` segue em dict para a resposta
+    contagens = acumular_turno(turno, contagens_sessao.setdefault(sessao, {}))
+    # Consulta dos próximos turnos: a mesma fala usada agora; no ai_user sem persona, a que o n8n gerou
+    acumular_ngramas(fala_cliente or final_user_msg, consulta_sessao.setdefault(sessao, {}))
+
+    # Métricas ao vivo: só as pernas que responderam neste turno
+    pernas = {}
+    if not gpt_ja_acabou: pernas["gpt"] = (final_gpt_class, gpt_tokens, custo_gpt, latencia_n8n)
+    if not gem_ja_acabou: pernas["gemini"] = (final_gem_class, gem_tokens, custo_gem, latencia_n8n)
+    metricas.registrar_turno(sessao, len(conversation_history) - 1, pernas)
+
+    # Envia (só o que mudou: a perna encerrada não reenvia a mensagem final a cada turno)
+    emitir_delta(sessao, "resposta", {
         "user_type": user_type,
         "ai_user_msg": final_user_msg,
         "loop_count": loop_count,
@@ -243,6 +394,7 @@ def processar():
         "custo_run_gpt": custo_gpt, "custo_run_gem": custo_gem,
         "custo_total_gpt": session_costs["gpt_total"], "custo_total_gem": session_costs["gemini_total"]
     })
+    socketio.emit("metricas", metricas.resumo(), to=SALA_METRICAS)
     
     socketio.sleep(0.2)
 
@@ -257,41 +409,108 @@ def processar():
     if not alguem_vivo: stop_loop = True
     if loop_count >= MAX_AI_LOOPS: stop_loop = True
 
-    if user_type == "ai_user" and not stop_loop:
+    if user_type == "ai_user" and not stop_loop and auto_loop:
+        extras = {"sessao": sessao, "modelos": modelos, "prompt_versao": prompt_versao}
+        if cliente: extras.update(persona=cliente.persona.nome, seed=cliente.seed)
         if final_user_msg:
             nova_entrada = gerar_entrada_ai_user(final_gpt_msg, final_gem_msg)
-            socketio.start_background_task(continuar_loop, nova_entrada, loop_count + 1)
+            socketio.start_background_task(continuar_loop, nova_entrada, loop_count + 1, extras)
         else:
             # Fallback se não vier msg do user
-            socketio.start_background_task(continuar_loop, "Continue a análise, por favor.", loop_count + 1)
+            socketio.start_background_task(continuar_loop, "Continue a análise, por favor.", loop_count + 1, extras)
     
     elif stop_loop:
-        socketio.emit("aviso_sistema", {"msg": "🛑 Ciclo Encerrado."})
+        socketio.emit("aviso_sistema", {"msg": "🛑 Ciclo Encerrado."}, to=sala(sessao))
 
-    return jsonify({"status": "ok"})
+    if erro_n8n:
+        # O turno fica no histórico, mas quem chama (experimentos.py) precisa saber que ele não vale
+        return jsonify({"status": "erro", "erro": True, "mensagem": f"n8n: {erro_n8n}",
+                        "turno": turno, "encerrado": stop_loop}), 502
+    return jsonify({"status": "ok", "turno": turno, "encerrado": stop_loop})
 
-def continuar_loop(nova_entrada, loop_count):
+def continuar_loop(nova_entrada, loop_count, extras=None):
     socketio.sleep(3)
-    try: requests.post("http://127.0.0.1:5000/processar", json={"entrada": nova_entrada, "user_type": "ai_user", "loop_count": loop_count})
+    try: requests.post("http://127.0.0.1:5000/processar", json={"entrada": nova_entrada, "user_type": "ai_user", "loop_count": loop_count, **(extras or {})})
     except: pass
 
+@socketio.on("entrar")
+def entrar(dados=None):
+    # {"sessao": "padrao", "metricas": true}; o ack traz o estado completo para quem chega ou perdeu um delta
+    dados = dados or {}
+    sessao = dados.get("sessao", "padrao")
+    join_room(sala(sessao))
+    if dados.get("metricas"): join_room(SALA_METRICAS)
+    with envio_lock:
+        envio = sessoes[sessao]["envio"] if sessao in sessoes else {"seq": 0, "ultimo": {}}
+        return {"seq": envio["seq"], "estado": dict(envio["ultimo"])}
+
+@app.route("/metricas")
+def obter_metricas():
+    return jsonify(metricas.resumo())
+
+def _atualizar_busca():
+    con = busca.conectar()
+    try: return busca.atualizar(con)
+    finally: con.close()
+
+def indexar_busca():
+    """Indexa no FTS o que foi salvo (na partida e depois de cada /salvar_conversa); /buscar só consulta."""
+    # Green threads só trocam em I/O: checar e marcar a flag sem lock é seguro
+    if busca_estado["rodando"]:
+        busca_estado["pendente"] = True  # a rodada atual pega o que chegou: mais uma no fim
+        return
+    busca_estado["rodando"] = True
+    try:
+        while True:
+            busca_estado["pendente"] = False
+            # sqlite3 bloqueia: roda numa thread do SO (tpool) para não parar o Socket.IO e o /processar
+            try: novos = tpool.execute(_atualizar_busca)
+            except Exception as e: print("⚠️ Erro ao indexar a busca:", e)
+            else:
+                if novos: print(f"🗂️ Busca: {novos} conversas indexadas")
+            if not busca_estado["pendente"]: break
+    finally: busca_estado["rodando"] = False
+
+@app.route("/buscar")
+def buscar_conversas():
+    # GET /buscar?q=produto não entregue&papel=gpt&classe=Qualificado&decisao=gpt:Qualificado&conversas=1&limite=20
+    a = request.args
+    try:
+        con = busca.conectar()
+        try:
+            resultados = busca.buscar(
+                con, a.get("q", ""), a.get("papel"), a.get("classe"), a.get("loop", type=int),
+                a.get("desde"), a.get("ate"), a.get("experimento"), busca.decisoes_de_texto(a.getlist("decisao")),
+                a.get("conversas") in ("1", "true"), min(a.get("limite", busca.LIMITE_PADRAO, type=int), 200),
+                a.get("fts") in ("1", "true"))
+        finally: con.close()
+        return jsonify({"status": "ok", "resultados": resultados})
+    except Exception as e: return jsonify({"status": "erro", "mensagem": str(e)}), 400
+
 @app.route("/salvar_conversa", methods=["POST"])
 def salvar_conversa():
     try:
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        pasta = os.path.join(base_dir, "JSON_Conversas")
-        os.makedirs(pasta, exist_ok=True)
-        nome = f"conversa_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.json"
-        with open(os.path.join(pasta, nome), "w", encoding="utf-8") as f:
-            json.dump({"historico": conversation_history}, f, ensure_ascii=False, indent=2)
-        return jsonify({"status": "ok", "arquivo": nome})
+        # Opcional: {"sessao": ..., "experimento": {...}, "encerrar": true} (runner de experimentos)
+        dados = request.get_json(silent=True) or {}
+        sessao = dados.get("sessao", "padrao")
+        historico = obter_sessao(sessao)["historico"].para_json()  # inclui os turnos já despejados em disco
+        entrada = armazenamento.salvar(historico, sessao, dados.get("experimento"))
+        caso = caso_de_historico(entrada["id"], historico) if indice_casos else None
+        if caso: indice_casos.adicionar(caso)  # já serve de exemplo para as próximas conversas
+        if dados.get("encerrar"): limpar_sessao(sessao)
+        socketio.start_background_task(indexar_busca)
+        return jsonify({"status": "ok", "arquivo": entrada["id"], "shard": entrada["arquivo"]})
     except Exception as e: return jsonify({"status": "erro", "mensagem": str(e)})
 
 @app.route("/start_ai_conversation", methods=["POST"])
 def start_ai_conversation():
-    socketio.start_background_task(requests.post, "http://127.0.0.1:5000/processar", json={"entrada": "Olá", "user_type": "ai_user", "loop_count": 0})
+    # Opcional: {"persona": "compra_nao_entregue", "seed": 1} troca o LLM do cliente por uma persona local
+    dados = request.get_json(silent=True) or {}
+    extras = {k: dados[k] for k in ("sessao", "persona", "seed") if k in dados}
+    socketio.start_background_task(requests.post, "http://127.0.0.1:5000/processar", json={"entrada": "Olá", "user_type": "ai_user", "loop_count": 0, **extras})
     return jsonify({"status": "started"})
 
 if __name__ == "__main__":
     print("🚀 Servidor ON (Porta 5000)")
+    socketio.start_background_task(indexar_busca)  # o que foi salvo com o servidor parado
     socketio.run(app, debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,263 @@
+"""
+Armazenamento das conversas salvas: registros comprimidos em shards por data + índice.
+
+Cada `/salvar_conversa` vira um registro (uma linha JSON compacta, comprimida
+sozinha como um membro gzip ou um frame zstd) anexado ao shard do dia:
+
+  JSON_Conversas/AAAA/MM/DD/conversas.jsonl.gz   (ou .jsonl.zst)
+  JSON_Conversas/indice.jsonl
+
+Membros gzip / frames zstd concatenados continuam sendo um arquivo válido, então
+o shard inteiro descomprime como JSONL (um registro por linha). O índice tem uma
+linha por registro com id, instante, sessão, experimento, pernas, decisão de cada
+perna e a posição do registro no shard (offset, tamanho em bytes comprimidos):
+a análise filtra pelo índice e lê só os registros escolhidos com um seek, sem
+varrer a pasta nem descomprimir o resto do shard.
+
+O id é `conversa_<data>_<hora>-<microssegundos>[_<sessao>]_<8 hex aleatórios>`,
+sem colisão mesmo com vários salvamentos no mesmo segundo. O registro é
+{"id", "historico", "sessao"?, "experimento"?}: o JSON dos arquivos antigos mais id e sessão.
+
+Os arquivos antigos (`conversa_*.json` soltos na pasta) continuam legíveis pela
+análise; `python armazenamento.py migrar` os move para o formato novo e
+`python armazenamento.py reindexar` reconstrói o índice a partir dos shards
+(por exemplo, se o servidor caiu entre gravar o registro e a linha do índice).
+"""
+
+import argparse
+import glob
+import gzip
+import json
+import os
+import secrets
+import threading
+import zlib
+from datetime import datetime
+
+from metricas_ao_vivo import MODELOS, classe_decisao
+
+try:  # opcional: zstd comprime melhor e mais rápido que gzip
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# ==========================
+# 🔧 CONFIGURAÇÃO
+# ==========================
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PASTA_PADRAO = os.path.join(BASE_DIR, "JSON_Conversas")
+NOME_INDICE = "indice.jsonl"
+NOME_SHARD = "conversas.jsonl"
+COMPRESSAO_PADRAO = "zstd" if zstandard is not None else "gzip"
+EXTENSOES = {"gzip": ".gz", "zstd": ".zst"}
+NIVEL = {"gzip": 6, "zstd": 10}
+
+# ==========================
+# 🗜️ COMPRESSÃO
+# ==========================
+def comprimir(dados, compressao):
+    if compressao == "zstd":
+        return zstandard.ZstdCompressor(level=NIVEL["zstd"]).compress(dados)
+    return gzip.compress(dados, compresslevel=NIVEL["gzip"], mtime=0)
+
+def descomprimir(dados, compressao):
+    if compressao == "zstd":
+        return zstandard.ZstdDecompressor().decompress(dados)
+    return gzip.decompress(dados)
+
+def compressao_do_arquivo(caminho):
+    for nome, ext in EXTENSOES.items():
+        if caminho.endswith(ext): return nome
+    raise ValueError(f"{caminho}: extensão de shard desconhecida")
+
+def _membros(caminho):
+    """(offset, tamanho, bytes descomprimidos) de cada membro gzip / frame zstd do shard."""
+    compressao = compressao_do_arquivo(caminho)
+    with open(caminho, "rb") as f:
+        dados = f.read()
+    pos = 0
+    while pos < len(dados):
+        if compressao == "zstd":
+            tamanho = _tamanho_frame_zstd(dados, pos)
+            bruto = zstandard.ZstdDecompressor().decompress(dados[pos:pos + tamanho])
+        else:
+            d = zlib.decompressobj(wbits=31)
+            bruto = d.decompress(dados[pos:])
+            if not d.eof: break  # membro cortado por uma gravação interrompida
+            tamanho = len(dados) - pos - len(d.unused_data)
+        yield pos, tamanho, bruto
+        pos += tamanho
+
+def _tamanho_frame_zstd(dados, pos):
+    d = zstandard.ZstdDecompressor().decompressobj()
+    d.decompress(dados[pos:])
+    return len(dados) - pos - len(d.unused_data)
+
+# ==========================
+# 🗂️ REGISTROS E ÍNDICE
+# ==========================
+def novo_id(instante, sessao="padrao"):
+    nome = f"conversa_{instante.strftime('%Y-%m-%d_%H-%M-%S-%f')}"
+    if sessao and sessao != "padrao": nome += f"_{sessao}"
+    return f"{nome}_{secrets.token_hex(4)}"
+
+def resumo_historico(historico):
+    """Pernas que responderam e a primeira decisão (Qualificado/Desqualificado) de cada uma."""
+    pernas, decisoes = [], {}
+    for turno in historico:
+        for m in MODELOS:
+            perna = turno.get(m) if isinstance(turno, dict) else None
+            if not isinstance(perna, dict) or not perna.get("msg"): continue
+            if m not in pernas: pernas.append(m)
+            if decisoes.get(m) is None: decisoes[m] = classe_decisao(perna.get("class"))
+    return pernas, {m: decisoes.get(m) for m in pernas}
+
+def entrada_indice(registro, instante, sessao, arquivo, offset, tamanho):
+    experimento = registro.get("experimento") or {}
+    historico = registro.get("historico") or []
+    pernas, decisoes = resumo_historico(historico)
+    return {
+        "id": registro["id"],
+        "timestamp": instante.isoformat(),
+        "sessao": sessao,
+        "experimento": experimento.get("nome", ""),
+        "celula": experimento.get("celula", ""),
+        "modelos": pernas,
+        "decisao": decisoes,
+        "turnos": len(historico),
+        "arquivo": arquivo,
+        "offset": offset,
+        "tamanho": tamanho,
+    }
+
+
+class Armazenamento:
+    """Grava registros nos shards do dia e mantém o índice (uma instância por pasta, thread-safe)."""
+
+    def __init__(self, pasta=PASTA_PADRAO, compressao=COMPRESSAO_PADRAO):
+        if compressao == "zstd" and zstandard is None:
+            compressao = "gzip"
+        self.pasta = pasta
+        self.compressao = compressao
+        self.caminho_indice = os.path.join(pasta, NOME_INDICE)
+        self.lock = threading.Lock()
+
+    def caminho_shard(self, instante):
+        """Caminho relativo à pasta (com "/", o mesmo em Windows e Linux)."""
+        return "/".join((instante.strftime("%Y"), instante.strftime("%m"), instante.strftime("%d"),
+                         NOME_SHARD + EXTENSOES[self.compressao]))
+
+    def salvar(self, historico, sessao="padrao", experimento=None, instante=None, id_registro=None):
+        """Anexa a conversa ao shard do dia e ao índice. Devolve a linha do índice."""
+        instante = instante or datetime.now()
+        registro = {"id": id_registro or novo_id(instante, sessao), "historico": historico}
+        if sessao and sessao != "padrao": registro["sessao"] = sessao
+        if experimento: registro["experimento"] = experimento
+        bloco = comprimir((json.dumps(registro, ensure_ascii=False) + "\n").encode("utf-8"), self.compressao)
+        relativo = self.caminho_shard(instante)
+        caminho = os.path.join(self.pasta, *relativo.split("/"))
+        with self.lock:
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            with open(caminho, "ab") as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(bloco)
+                f.flush()
+                os.fsync(f.fileno())
+            entrada = entrada_indice(registro, instante, sessao, relativo, offset, len(bloco))
+            with open(self.caminho_indice, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+        return entrada
+
+    def reindexar(self):
+        """Reescreve o índice varrendo todos os shards (ordem de data e de gravação)."""
+        entradas = []
+        for ext in EXTENSOES.values():
+            for caminho in glob.glob(os.path.join(self.pasta, "*", "*", "*", NOME_SHARD + ext)):
+                relativo = os.path.relpath(caminho, self.pasta).replace(os.sep, "/")
+                for offset, tamanho, bruto in _membros(caminho):
+                    registro = json.loads(bruto)
+                    instante = _instante_do_id(registro["id"]) or datetime.fromtimestamp(os.path.getmtime(caminho))
+                    sessao = registro.get("sessao", "padrao")
+                    entradas.append(entrada_indice(registro, instante, sessao, relativo, offset, tamanho))
+        entradas.sort(key=lambda e: (e["timestamp"], e["arquivo"], e["offset"]))
+        with self.lock:
+            tmp = self.caminho_indice + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for e in entradas:
+                    f.write(json.dumps(e, ensure_ascii=False) + "\n")
+            os.replace(tmp, self.caminho_indice)
+        return len(entradas)
+
+    def migrar(self, padrao="conversa_*.json", apagar=False):
+        """Converte os `conversa_*.json` soltos na pasta; o nome antigo vira o id do registro."""
+        migrados = 0
+        for caminho in sorted(glob.glob(os.path.join(self.pasta, padrao))):
+            with open(caminho, "r", encoding="utf-8") as f:
+                dados = json.load(f)
+            if not isinstance(dados.get("historico"), list): continue
+            nome = os.path.splitext(os.path.basename(caminho))[0]
+            instante = _instante_do_id(nome) or datetime.fromtimestamp(os.path.getmtime(caminho))
+            self.salvar(dados["historico"], _sessao_do_nome(nome), dados.get("experimento"), instante, nome)
+            migrados += 1
+            if apagar: os.remove(caminho)
+        return migrados
+
+
+def _instante_do_id(nome):
+    partes = nome.split("_")
+    if len(partes) < 3: return None
+    data, hora = partes[1], partes[2]
+    for fmt in ("%Y-%m-%d_%H-%M-%S-%f", "%Y-%m-%d_%H-%M-%S"):
+        try: return datetime.strptime(f"{data}_{hora}", fmt)
+        except ValueError: pass
+    return None
+
+def _sessao_do_nome(nome):
+    partes = nome.split("_", 3)
+    return partes[3] if len(partes) > 3 else "padrao"
+
+# ==========================
+# 📖 LEITURA
+# ==========================
+def ler_indice(pasta=PASTA_PADRAO):
+    caminho = os.path.join(pasta, NOME_INDICE)
+    if not os.path.exists(caminho): return []
+    entradas = []
+    with open(caminho, "r", encoding="utf-8") as f:
+        for linha in f:
+            try: entradas.append(json.loads(linha))
+            except ValueError: pass  # linha cortada por interrupção
+    return entradas
+
+def ler_registro(pasta, entrada):
+    """Lê um registro pelo offset do índice (só os bytes dele)."""
+    with open(os.path.join(pasta, *entrada["arquivo"].split("/")), "rb") as f:
+        f.seek(entrada["offset"])
+        bloco = f.read(entrada["tamanho"])
+    return json.loads(descomprimir(bloco, compressao_do_arquivo(entrada["arquivo"])))
+
+def iterar_registros(pasta=PASTA_PADRAO, **filtros):
+    """Registros do índice cujos campos batem com os filtros (ex.: experimento="noite01")."""
+    for entrada in ler_indice(pasta):
+        if all(entrada.get(k) == v for k, v in filtros.items()):
+            yield ler_registro(pasta, entrada)
+
+# ==========================
+# 🚀 CLI
+# ==========================
+def main():
+    ap = argparse.ArgumentParser(description="Shards comprimidos + índice das conversas salvas")
+    ap.add_argument("acao", choices=["migrar", "reindexar"])
+    ap.add_argument("--pasta", default=PASTA_PADRAO)
+    ap.add_argument("--compressao", choices=sorted(EXTENSOES), default=COMPRESSAO_PADRAO)
+    ap.add_argument("--apagar", action="store_true", help="migrar: remove os .json antigos depois de gravados")
+    args = ap.parse_args()
+
+    arm = Armazenamento(args.pasta, args.compressao)
+    if args.acao == "migrar":
+        print(f"📦 {arm.migrar(apagar=args.apagar)} conversas migradas para {arm.pasta}")
+    else:
+        print(f"🗂️ {arm.reindexar()} registros no índice {arm.caminho_indice}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+"""
+Busca nas conversas salvas: SQLite com índice FTS5 sobre as mensagens.
+
+Cada mensagem (cliente, GPT ou Gemini) de cada turno vira uma linha da tabela
+`mensagens`, com colunas tipadas (conversa, turno, loop, papel, classe,
+timestamp), e o texto vai para o índice FTS5 `mensagens_fts` (tokenizador
+unicode61 sem acentos: "nao entregue" acha "não entregue"). A tabela `conversas`
+guarda uma linha por conversa, com experimento, turnos e a primeira decisão
+(Qualificado/Desqualificado) de cada perna, para filtrar por padrão de
+classificação.
+
+Fontes, atualizadas de forma incremental:
+- os registros dos shards (armazenamento.py): o índice `indice.jsonl` é lido a
+  partir do último byte já processado, então só entram os registros novos;
+- os `conversa_*.json` soltos (arquivos antigos e os do Human user): entram ou
+  são reindexados quando o tamanho ou o mtime mudam. O id é o nome sem ".json",
+  o mesmo do registro criado por `armazenamento.py migrar`: um arquivo já
+  migrado (sem --apagar) não entra de novo.
+
+  python busca.py indexar
+  python busca.py indexar --pasta "../Human user/JSON_Conversas"
+  python busca.py consultar "produto não entregue" --papel gpt --classe Qualificado
+  python busca.py consultar --decisao gpt:Qualificado --decisao gemini:Desqualificado --conversas
+
+O servidor expõe a mesma consulta em GET /buscar (ver app.py).
+"""
+
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import time
+
+from armazenamento import NOME_INDICE, PASTA_PADRAO, ler_registro
+from metricas_ao_vivo import MODELOS, classe_decisao
+
+# ==========================
+# 🔧 CONFIGURAÇÃO
+# ==========================
+BANCO_PADRAO = os.path.join(PASTA_PADRAO, "busca.sqlite3")
+PADRAO_SOLTOS = "conversa_*.json"
+LIMITE_PADRAO = 20
+PAPEIS = ("cliente",) + MODELOS
+VERSAO_ESQUEMA = 1  # PRAGMA user_version
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS fontes (
+    caminho TEXT PRIMARY KEY,
+    tamanho INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    posicao INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS conversas (
+    id TEXT PRIMARY KEY,
+    fonte TEXT NOT NULL,
+    origem TEXT NOT NULL,
+    experimento TEXT NOT NULL DEFAULT '',
+    inicio TEXT NOT NULL DEFAULT '',
+    turnos INTEGER NOT NULL,
+    decisao_gpt TEXT,
+    decisao_gemini TEXT
+);
+CREATE INDEX IF NOT EXISTS conversas_fonte ON conversas(fonte);
+CREATE INDEX IF NOT EXISTS conversas_inicio ON conversas(inicio);
+CREATE INDEX IF NOT EXISTS conversas_decisao ON conversas(decisao_gpt, decisao_gemini);
+CREATE TABLE IF NOT EXISTS mensagens (
+    id INTEGER PRIMARY KEY,
+    conversa TEXT NOT NULL,
+    turno INTEGER NOT NULL,
+    loop INTEGER,
+    papel TEXT NOT NULL,
+    classe TEXT NOT NULL DEFAULT '',
+    timestamp TEXT NOT NULL DEFAULT '',
+    texto TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS mensagens_conversa ON mensagens(conversa, turno);
+CREATE INDEX IF NOT EXISTS mensagens_papel_classe ON mensagens(papel, classe);
+CREATE INDEX IF NOT EXISTS mensagens_timestamp ON mensagens(timestamp);
+CREATE VIRTUAL TABLE IF NOT EXISTS mensagens_fts USING fts5(
+    texto, content='mensagens', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+"""
+
+def conectar(banco=BANCO_PADRAO):
+    os.makedirs(os.path.dirname(os.path.abspath(banco)), exist_ok=True)
+    con = sqlite3.connect(banco, timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")  # leituras do /buscar não esperam a indexação
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.executescript(ESQUEMA)
+    if con.execute("PRAGMA user_version").fetchone()[0] < VERSAO_ESQUEMA:
+        # v1: ids dos soltos sem ".json" (o mesmo do registro migrado) e prefixo também nos registros:
+        # o que foi indexado antes entra de novo na próxima atualização
+        with con:
+            for (fonte,) in con.execute("SELECT caminho FROM fontes").fetchall():
+                _remover_fonte(con, fonte)
+            con.execute("DELETE FROM fontes")
+            con.execute(f"PRAGMA user_version = {VERSAO_ESQUEMA}")
+    return con
+
+# ==========================
+# 📥 INDEXAÇÃO
+# ==========================
+def _turnos_normalizados(dados):
+    """(origem, [(loop, timestamp, [(papel, classe, texto), ...]), ...]) dos dois formatos de log."""
+    if isinstance(dados.get("historico"), list):
+        turnos = []
+        for t in dados["historico"]:
+            if not isinstance(t, dict): continue
+            msgs = [("cliente", "", t.get("user_simulado") or "")]
+            for m in MODELOS:
+                perna = t.get(m) if isinstance(t.get(m), dict) else {}
+                msgs.append((m, perna.get("class") or "", perna.get("msg") or ""))
+            turnos.append((t.get("loop"), t.get("timestamp") or "", msgs))
+        return "ia_user", turnos
+    turnos = []
+    for t in dados.get("conversation") or []:
+        if not isinstance(t, dict) or str(t.get("user_input", "")).strip().lower() == "reset": continue
+        turnos.append((None, t.get("timestamp") or "", [
+            ("cliente", "", t.get("user_input") or ""),
+            ("gpt", t.get("gpt_classificacao") or "", t.get("gpt_response") or ""),
+            ("gemini", t.get("gem_classificacao") or "", t.get("gemini_response") or ""),
+        ]))
+    return "human_user", turnos
+
+def _decisoes(turnos):
+    decisoes = {}
+    for _, _, msgs in turnos:
+        for papel, classe, texto in msgs:
+            if papel != "cliente" and texto and decisoes.get(papel) is None:
+                decisoes[papel] = classe_decisao(classe)
+    return decisoes
+
+def _inserir(con, conversa, fonte, dados):
+    origem, turnos = _turnos_normalizados(dados)
+    decisoes = _decisoes(turnos)
+    con.execute(
+        "INSERT OR REPLACE INTO conversas VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (conversa, fonte, origem, (dados.get("experimento") or {}).get("nome", ""),
+         turnos[0][1] if turnos else "", len(turnos), decisoes.get("gpt"), decisoes.get("gemini")),
+    )
+    linhas = [(conversa, i, loop, papel, classe, ts, texto)
+              for i, (loop, ts, msgs) in enumerate(turnos) for papel, classe, texto in msgs if texto]
+    # Sem AUTOINCREMENT o rowid novo é sempre max(id) + 1, inclusive reaproveitando ids de uma fonte
+    # que acabou de ser removida: as mensagens desta chamada são exatamente as com id > antes
+    antes = con.execute("SELECT coalesce(max(id), 0) FROM mensagens").fetchone()[0]
+    con.executemany(
+        "INSERT INTO mensagens (conversa, turno, loop, papel, classe, timestamp, texto) VALUES (?, ?, ?, ?, ?, ?, ?)", linhas)
+    con.execute("INSERT INTO mensagens_fts (rowid, texto) SELECT id, texto FROM mensagens WHERE id > ?", (antes,))
+    return len(linhas)
+
+def _remover_conversa(con, conversa):
+    # tabela FTS com conteúdo externo: a remoção repete o texto indexado
+    con.execute("INSERT INTO mensagens_fts (mensagens_fts, rowid, texto) "
+                "SELECT 'delete', id, texto FROM mensagens WHERE conversa = ?", (conversa,))
+    con.execute("DELETE FROM mensagens WHERE conversa = ?", (conversa,))
+    con.execute("DELETE FROM conversas WHERE id = ?", (conversa,))
+
+def _remover_fonte(con, fonte):
+    for (conversa,) in con.execute("SELECT id FROM conversas WHERE fonte = ?", (fonte,)).fetchall():
+        _remover_conversa(con, conversa)
+
+def _prefixo(pasta):
+    # ids fora da pasta do IA user ganham o nome do app na frente ("Human user/conversa_...")
+    return "" if os.path.abspath(pasta) == os.path.abspath(PASTA_PADRAO) else \
+        os.path.basename(os.path.dirname(os.path.abspath(pasta))) + "/"
+
+def _atualizar_soltos(con, pasta):
+    # id = nome do arquivo sem ".json", o mesmo que `armazenamento.py migrar` dá ao registro
+    prefixo = _prefixo(pasta)
+    novos = 0
+    caminhos = sorted(glob.glob(os.path.join(pasta, PADRAO_SOLTOS)))
+    presentes = {os.path.abspath(c) for c in caminhos}
+    pasta_abs = os.path.abspath(pasta)
+    for (fonte,) in con.execute("SELECT caminho FROM fontes").fetchall():
+        # arquivo apagado (ex.: migrado para os shards com --apagar): sai do banco
+        if os.path.dirname(fonte) == pasta_abs and fonte.endswith(".json") and fonte not in presentes:
+            _remover_fonte(con, fonte)
+            con.execute("DELETE FROM fontes WHERE caminho = ?", (fonte,))
+    for caminho in caminhos:
+        st = os.stat(caminho)
+        fonte = os.path.abspath(caminho)
+        antigo = con.execute("SELECT tamanho, mtime FROM fontes WHERE caminho = ?", (fonte,)).fetchone()
+        if antigo == (st.st_size, st.st_mtime): continue
+        with open(caminho, "r", encoding="utf-8") as f:
+            try: dados = json.load(f)
+            except ValueError: continue  # arquivo ainda sendo escrito; entra na próxima rodada
+        _remover_fonte(con, fonte)
+        conversa = prefixo + os.path.splitext(os.path.basename(caminho))[0]
+        # já migrado para os shards (migrar sem --apagar): o registro do índice é que vale
+        migrado = con.execute("SELECT 1 FROM conversas WHERE id = ?", (conversa,)).fetchone()
+        if isinstance(dados, dict) and not migrado:
+            _inserir(con, conversa, fonte, dados)
+            novos += 1
+        con.execute("INSERT OR REPLACE INTO fontes VALUES (?, ?, ?, 0)", (fonte, st.st_size, st.st_mtime))
+    return novos
+
+def _atualizar_shards(con, pasta):
+    """Registros do índice dos shards a partir do último byte lido."""
+    indice = os.path.abspath(os.path.join(pasta, NOME_INDICE))
+    if not os.path.exists(indice): return 0
+    st = os.stat(indice)
+    antigo = con.execute("SELECT posicao FROM fontes WHERE caminho = ?", (indice,)).fetchone()
+    posicao = antigo[0] if antigo and antigo[0] <= st.st_size else 0  # índice reescrito por reindexar: relê
+    prefixo = _prefixo(pasta)
+    novos = 0
+    with open(indice, "rb") as f:
+        f.seek(posicao)
+        for linha in f:
+            if not linha.endswith(b"\n"): break  # linha sendo escrita agora
+            posicao += len(linha)
+            try: entrada = json.loads(linha)
+            except ValueError: continue
+            conversa = prefixo + entrada["id"]
+            existente = con.execute("SELECT fonte FROM conversas WHERE id = ?", (conversa,)).fetchone()
+            if existente and existente[0] == indice: continue
+            # indexada antes a partir do conversa_*.json que foi migrado: passa a valer o registro
+            if existente: _remover_conversa(con, conversa)
+            _inserir(con, conversa, indice, ler_registro(pasta, entrada))
+            novos += 1
+    con.execute("INSERT OR REPLACE INTO fontes VALUES (?, ?, ?, ?)", (indice, st.st_size, st.st_mtime, posicao))
+    return novos
+
+def atualizar(con, pastas=(PASTA_PADRAO,)):
+    """Indexa o que chegou desde a última rodada. Devolve o número de conversas novas/reindexadas."""
+    novos = 0
+    with con:
+        for pasta in pastas:
+            novos += _atualizar_shards(con, pasta) + _atualizar_soltos(con, pasta)
+    if novos:
+        # estatísticas para o planejador (amostradas: rápido mesmo com milhões de mensagens)
+        con.execute("PRAGMA analysis_limit=1000")
+        con.execute("ANALYZE")
+    return novos
+
+# ==========================
+# 🔎 CONSULTA
+# ==========================
+def expressao_fts(texto):
+    """Texto livre -> termos entre aspas (todos obrigatórios); '"..."' no texto vira frase exata."""
+    termos = []
+    for i, parte in enumerate(texto.split('"')):
+        if i % 2 == 0: termos.extend(f'"{p}"' for p in parte.split())
+        elif parte.strip(): termos.append(f'"{parte}"')
+    return " ".join(termos)
+
+def buscar(con, texto="", papel=None, classe=None, loop=None, desde=None, ate=None,
+           experimento=None, decisoes=(), conversas=False, limite=LIMITE_PADRAO, fts=False):
+    """
+    Mensagens (ou conversas, com conversas=True) que batem com os filtros,
+    as mais relevantes primeiro quando há texto (bm25). decisoes: pares
+    (perna, classe) da primeira decisão de cada perna, ex. [("gpt", "Qualificado")].
+    fts=True passa o texto direto para o MATCH (OR, NEAR, prefixo*).
+    """
+    where, args = [], []  # filtros de mensagem
+    for coluna, valor in (("m.papel", papel), ("m.classe", classe), ("m.loop", loop)):
+        if valor is not None and valor != "":
+            where.append(f"{coluna} = ?")
+            args.append(valor)
+    if desde:
+        where.append("m.timestamp >= ?")
+        args.append(desde)
+    if ate:
+        where.append("substr(m.timestamp, 1, ?) <= ?")
+        args.extend([len(ate), ate])
+    where_c, args_c = [], []  # filtros de conversa
+    if experimento:
+        where_c.append("c.experimento = ?")
+        args_c.append(experimento)
+    for perna, decisao in decisoes:
+        if perna not in MODELOS: raise ValueError(f"perna desconhecida: {perna}")
+        where_c.append(f"c.decisao_{perna} = ?")
+        args_c.append(decisao)
+    colunas_c = "c.id, c.origem, c.experimento, c.inicio, c.turnos, c.decisao_gpt, c.decisao_gemini"
+    campos_c = ("conversa", "origem", "experimento", "inicio", "turnos", "decisao_gpt", "decisao_gemini")
+
+    if conversas and not texto:
+        # sem ranking: percorre as conversas em ordem de início e para no limite
+        if where:
+            existe = f"SELECT {{}} FROM mensagens m WHERE m.conversa = c.id AND {' AND '.join(where)}"
+            sql = (f"SELECT {colunas_c}, ({existe.format('count(*)')}) FROM conversas c"
+                   f"{_where(where_c + [f'EXISTS ({existe.format(1)})'])} ORDER BY c.inicio LIMIT ?")
+            linhas = con.execute(sql, args + args_c + args + [int(limite)])
+            return [dict(zip(campos_c + ("mensagens",), linha)) for linha in linhas]
+        sql = f"SELECT {colunas_c} FROM conversas c{_where(where_c)} ORDER BY c.inicio LIMIT ?"
+        return [dict(zip(campos_c, linha)) for linha in con.execute(sql, args_c + [int(limite)])]
+
+    filtro = _where((["mensagens_fts MATCH ?"] if texto else []) + where + where_c)
+    args = ([texto if fts else expressao_fts(texto)] if texto else []) + args + args_c
+    origem = "mensagens_fts JOIN mensagens m ON m.id = mensagens_fts.rowid" if texto else "mensagens m"
+    origem += " JOIN conversas c ON c.id = m.conversa"
+    ordem = "mensagens_fts.rank" if texto else "m.id"  # rank = bm25: menor é mais relevante
+    if conversas:
+        # funções do FTS5 não valem dentro de agregação: o rank sai numa subconsulta
+        sql = (f"SELECT {colunas_c}, count(*), min(h.r) AS melhor FROM (SELECT m.conversa, {ordem} AS r "
+               f"FROM {origem}{filtro}) h JOIN conversas c ON c.id = h.conversa "
+               f"GROUP BY h.conversa ORDER BY melhor LIMIT ?")
+        campos = campos_c + ("mensagens",)
+    else:
+        trecho = "snippet(mensagens_fts, 0, '[', ']', '…', 16)" if texto else "substr(m.texto, 1, 160)"
+        sql = (f"SELECT m.conversa, m.turno, m.loop, m.papel, m.classe, m.timestamp, {trecho} "
+               f"FROM {origem}{filtro} ORDER BY {ordem} LIMIT ?")
+        campos = ("conversa", "turno", "loop", "papel", "classe", "timestamp", "trecho")
+    return [dict(zip(campos, linha)) for linha in con.execute(sql, args + [int(limite)])]
+
+def _where(condicoes):
+    return (" WHERE " + " AND ".join(condicoes)) if condicoes else ""
+
+def decisoes_de_texto(valores):
+    """["gpt:Qualificado", ...] -> [("gpt", "Qualificado"), ...]"""
+    pares = []
+    for v in valores or ():
+        perna, sep, classe = v.partition(":")
+        if not sep: raise ValueError(f"decisão no formato perna:classe, recebido {v!r}")
+        pares.append((perna, classe))
+    return pares
+
+# ==========================
+# 🚀 CLI
+# ==========================
+def main():
+    ap = argparse.ArgumentParser(description="Índice SQLite/FTS5 das conversas salvas")
+    ap.add_argument("--banco", default=BANCO_PADRAO)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("indexar", help="Atualiza o índice com as conversas novas")
+    p.add_argument("--pasta", action="append", help="Pasta JSON_Conversas (repetível; padrão: a do IA user)")
+    p = sub.add_parser("consultar")
+    p.add_argument("texto", nargs="?", default="")
+    p.add_argument("--papel", choices=PAPEIS)
+    p.add_argument("--classe")
+    p.add_argument("--loop", type=int)
+    p.add_argument("--desde")
+    p.add_argument("--ate")
+    p.add_argument("--experimento")
+    p.add_argument("--decisao", action="append", help="perna:classe da primeira decisão (repetível)")
+    p.add_argument("--conversas", action="store_true", help="Uma linha por conversa em vez de por mensagem")
+    p.add_argument("--limite", type=int, default=LIMITE_PADRAO)
+    p.add_argument("--fts", action="store_true", help="Texto já na sintaxe do FTS5 (OR, NEAR, prefixo*)")
+    args = ap.parse_args()
+
+    con = conectar(args.banco)
+    if args.cmd == "indexar":
+        inicio = time.perf_counter()
+        novos = atualizar(con, args.pasta or [PASTA_PADRAO])
+        total = con.execute("SELECT count(*) FROM conversas").fetchone()[0]
+        print(f"🗂️ {novos} conversas indexadas em {time.perf_counter() - inicio:.2f}s ({total} no banco {args.banco})")
+        return
+    inicio = time.perf_counter()
+    try:
+        linhas = buscar(con, args.texto, args.papel, args.classe, args.loop, args.desde, args.ate,
+                        args.experimento, decisoes_de_texto(args.decisao), args.conversas, args.limite, args.fts)
+    except (ValueError, sqlite3.OperationalError) as e:
+        raise SystemExit(f"❌ {e}")
+    for linha in linhas:
+        print(json.dumps(linha, ensure_ascii=False))
+    print(f"🔎 {len(linhas)} resultados em {1000 * (time.perf_counter() - inicio):.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""
+Casos parecidos: exemplos de conversas passadas já decididas para o contexto do turno.
+
+Cada conversa salva em que as pernas decidiram (Qualificado/Desqualificado, sem
+discordar) vira um caso: o resumo final (a "ANÁLISE FINAL" da perna que decidiu
+primeiro, ou a última mensagem dela) e as falas do cliente até a decisão. O
+texto passa pelos mesmos n-gramas com hashing do classificador local
+(classificador_decisao.acumular_ngramas), com peso TF-IDF (1 + log tf) · idf
+normalizado em L2.
+
+A busca é por índice invertido com poda estática: cada caso entra só com
+seus MAX_TERMOS_CASO termos de maior peso, cada bucket guarda só os
+MAX_POSTINGS casos de maior peso (em ordem) e a consulta usa só os MAX_TERMOS
+termos de maior peso. O custo por consulta fica limitado (MAX_TERMOS ×
+MAX_POSTINGS somas) e não cresce com o número de casos, ao preço de um
+cosseno aproximado nos termos muito comuns, que pesam pouco de qualquer forma.
+
+No servidor (app.py) a consulta é o texto do cliente na sessão até agora; os k
+casos mais parecidos acima de MIN_SCORE entram no fim da entrada como exemplos
+compactos (classe + resumo curto). Conversas salvas com decisão entram no
+índice em memória na hora; `construir` recalcula o idf do zero.
+
+  python casos_similares.py construir
+  python casos_similares.py avaliar --teste 0.25
+"""
+
+import argparse
+import bisect
+import heapq
+import json
+import math
+import os
+import threading
+import time
+from array import array
+
+from classificador_decisao import (GLOB_PADRAO, INDICE_PADRAO, N_BUCKETS, _dividir,
+                                   acumular_ngramas, carregar_historicos)
+from metricas_ao_vivo import MODELOS, classe_decisao
+
+# ==========================
+# 🔧 CONFIGURAÇÃO
+# ==========================
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+INDICE_CASOS_PADRAO = os.path.join(BASE_DIR, "modelos", "casos_similares.json")
+K_PADRAO = 3
+MIN_SCORE = 0.05
+MAX_TERMOS = 16        # termos da consulta
+MAX_TERMOS_CASO = 64   # termos de cada caso no índice
+MAX_POSTINGS = 512     # casos por bucket
+TAMANHO_RESUMO = 280  # caracteres de cada exemplo injetado
+PREFIXO_RESUMO = "✅ **ANÁLISE FINAL DO CASO:**"
+
+# ==========================
+# 📂 CASOS
+# ==========================
+def _compactar(texto, limite=TAMANHO_RESUMO):
+    texto = " ".join((texto or "").replace(PREFIXO_RESUMO, "").replace("*", "").split())
+    return texto if len(texto) <= limite else texto[:limite - 1].rsplit(" ", 1)[0] + "…"
+
+def caso_de_historico(id_conversa, historico):
+    """Caso (dict) de um histórico do IA user, ou None sem decisão / com pernas discordando."""
+    decisoes = {}
+    for i, turno in enumerate(historico):
+        for m in MODELOS:
+            perna = turno.get(m) or {}
+            c = classe_decisao(perna.get("class"))
+            if c and m not in decisoes: decisoes[m] = (i, c, perna.get("msg") or "")
+    if not decisoes or len({c for _, c, _ in decisoes.values()}) != 1: return None
+    turno_decisao, classe, msg = min(decisoes.values(), key=lambda d: d[0])
+    cliente = " ".join(t.get("user_simulado") or t.get("input") or "" for t in historico[:turno_decisao + 1])
+    return {
+        "id": id_conversa,
+        "classe": classe,
+        "turno": turno_decisao,
+        "resumo": _compactar(msg),
+        "contagens": acumular_ngramas(cliente, acumular_ngramas(msg)),
+    }
+
+def consulta_de_historico(historico, entrada_cliente=""):
+    """N-gramas do que o cliente disse na sessão até agora (a consulta do turno)."""
+    contagens = {}
+    for t in historico:
+        acumular_ngramas(t.get("user_simulado") or t.get("input"), contagens)
+    return acumular_ngramas(entrada_cliente, contagens)
+
+def formatar_exemplos(casos):
+    linhas = [f"- {c['classe']}: {c['resumo']}" for c in casos]
+    return ("[Casos anteriores parecidos, só como referência (não cite ao cliente):\n"
+            + "\n".join(linhas) + "]")
+
+# ==========================
+# 🗂️ ÍNDICE
+# ==========================
+def _pesos_tf(contagens):
+    return {b: 1.0 + math.log(c) for b, c in contagens.items() if c > 0}
+
+class IndiceCasos:
+    """
+    Postings por bucket em dois array (pesos negativos em ordem crescente,
+    i.e. maior peso primeiro, float32; índices dos casos, int32): ~8 bytes por
+    posting, contra ~100 de uma tupla Python. Salvo como JSON (casos, idf,
+    posição de cada bucket) + um .bin com os arrays concatenados.
+    """
+
+    def __init__(self, casos=None, idf=None, postings=None, n_documentos=0):
+        self.casos = casos or []          # [{"id", "classe", "turno", "resumo"}]
+        self.idf = idf or {}              # bucket -> idf
+        self.postings = postings or {}    # bucket -> (array("f") -peso crescente, array("i") caso)
+        self.n_documentos = n_documentos  # documentos usados no idf
+        self.lock = threading.Lock()
+
+    @classmethod
+    def construir(cls, casos):
+        """
+        casos: lista, ou função que devolve um iterável novo a cada chamada (duas
+        passadas, idf e postings, sem guardar os n-gramas de todos os casos).
+        Cada bucket guarda só os MAX_POSTINGS maiores pesos (heap limitado).
+        """
+        fonte = casos if callable(casos) else (lambda: casos)
+        df, n = {}, 0
+        for c in fonte():
+            n += 1
+            for b in c["contagens"]: df[b] = df.get(b, 0) + 1
+        idf = {b: math.log((1 + n) / (1 + d)) + 1.0 for b, d in df.items()}
+        indice = cls([], idf, {}, n)
+        heaps = {}
+        for c in fonte():
+            i = len(indice.casos)
+            indice.casos.append({k: c[k] for k in ("id", "classe", "turno", "resumo")})
+            for b, w in indice._vetor(c["contagens"], MAX_TERMOS_CASO):
+                h = heaps.setdefault(b, [])
+                if len(h) < MAX_POSTINGS: heapq.heappush(h, (w, i))
+                elif w > h[0][0]: heapq.heappushpop(h, (w, i))
+        for b, h in heaps.items():
+            h.sort(reverse=True)
+            indice.postings[b] = (array("f", [-w for w, _ in h]), array("i", [i for _, i in h]))
+        return indice
+
+    def _vetor(self, contagens, max_termos=None, so_conhecidos=False):
+        """
+        TF-IDF normalizado em L2, só com os max_termos termos de maior peso (e,
+        na consulta, só os que existem no índice). A norma é a do vetor inteiro:
+        os termos cortados só tiram a parte do cosseno que explicariam.
+        """
+        idf_novo = math.log(1 + self.n_documentos) + 1.0  # termo nunca visto: idf máximo
+        itens = [(b, tf * self.idf.get(b, idf_novo)) for b, tf in _pesos_tf(contagens).items()]
+        norma = math.sqrt(sum(w * w for _, w in itens)) or 1.0
+        if so_conhecidos:
+            itens = [x for x in itens if x[0] in self.postings]
+        if max_termos and len(itens) > max_termos:
+            itens = heapq.nlargest(max_termos, itens, key=lambda x: x[1])
+        return [(b, w / norma) for b, w in itens]
+
+    def adicionar(self, caso):
+        """Inclui um caso novo com o idf atual (sem recalcular o dos outros)."""
+        with self.lock:
+            i = len(self.casos)
+            self.casos.append({k: caso[k] for k in ("id", "classe", "turno", "resumo")})
+            for b, w in self._vetor(caso["contagens"], MAX_TERMOS_CASO):
+                negs, ids = self.postings.setdefault(b, (array("f"), array("i")))
+                pos = bisect.bisect_left(negs, -w)
+                if pos >= MAX_POSTINGS: continue
+                negs.insert(pos, -w)
+                ids.insert(pos, i)
+                if len(negs) > MAX_POSTINGS:
+                    negs.pop()
+                    ids.pop()
+
+    def buscar(self, contagens, k=K_PADRAO, min_score=MIN_SCORE, excluir=()):
+        """Os k casos de maior cosseno (aproximado) com a consulta: [{..., "score"}]."""
+        scores = {}
+        get = scores.get
+        with self.lock:
+            for b, qw in self._vetor(contagens, MAX_TERMOS, so_conhecidos=True):
+                negs, ids = self.postings[b]
+                for w, i in zip(negs, ids):
+                    scores[i] = get(i, 0.0) - qw * w
+            melhores = heapq.nlargest(k + len(excluir), scores.items(), key=lambda x: x[1])
+            saida = []
+            for i, s in melhores:
+                caso = self.casos[i]
+                if s < min_score or caso["id"] in excluir: continue
+                saida.append({**caso, "score": round(s, 4)})
+                if len(saida) == k: break
+        return saida
+
+    def salvar(self, caminho=INDICE_CASOS_PADRAO):
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        buckets, pos = {}, 0
+        negs_todos, ids_todos = array("f"), array("i")
+        for b, (negs, ids) in self.postings.items():
+            buckets[str(b)] = [pos, len(negs)]
+            negs_todos.extend(negs)
+            ids_todos.extend(ids)
+            pos += len(negs)
+        with open(_caminho_bin(caminho), "wb") as f:
+            ids_todos.tofile(f)
+            negs_todos.tofile(f)
+        with open(caminho, "w", encoding="utf-8") as f:
+            json.dump({
+                "n_buckets": N_BUCKETS, "max_postings": MAX_POSTINGS, "n_documentos": self.n_documentos,
+                "n_postings": pos, "casos": self.casos,
+                "idf": {str(b): round(v, 6) for b, v in self.idf.items()},
+                "buckets": buckets,
+            }, f, ensure_ascii=False)
+
+    @classmethod
+    def carregar(cls, caminho=INDICE_CASOS_PADRAO):
+        with open(caminho, "r", encoding="utf-8") as f:
+            dados = json.load(f)
+        if dados.get("n_buckets") != N_BUCKETS:
+            raise ValueError(f"Índice {caminho} usa n_buckets={dados.get('n_buckets')}, esperado {N_BUCKETS}")
+        n = dados["n_postings"]
+        ids_todos, negs_todos = array("i"), array("f")
+        with open(_caminho_bin(caminho), "rb") as f:
+            ids_todos.fromfile(f, n)
+            negs_todos.fromfile(f, n)
+        postings = {int(b): (negs_todos[p:p + t], ids_todos[p:p + t]) for b, (p, t) in dados["buckets"].items()}
+        return cls(dados["casos"], {int(b): v for b, v in dados["idf"].items()}, postings,
+                   dados.get("n_documentos", len(dados["casos"])))
+
+def _caminho_bin(caminho):
+    return os.path.splitext(caminho)[0] + ".bin"
+
+# ==========================
+# 📊 AVALIAÇÃO
+# ==========================
+def avaliar(indice, historicos, k=K_PADRAO):
+    """
+    Para cada conversa de teste, consulta a cada turno antes da decisão com o
+    texto do cliente até ali: acerto da classe do caso mais parecido, acerto
+    da maioria dos k, cobertura (consultas com algum caso acima de MIN_SCORE)
+    e latência por consulta.
+    """
+    consultas = acertos_top1 = acertos_maioria = cobertas = 0
+    tempos = []
+    for cid, hist in historicos:
+        caso = caso_de_historico(cid, hist)
+        if caso is None: continue
+        for t in range(1, caso["turno"] + 1):
+            contagens = consulta_de_historico(hist[:t])
+            inicio = time.perf_counter()
+            achados = indice.buscar(contagens, k, excluir=(cid,))
+            tempos.append(time.perf_counter() - inicio)
+            consultas += 1
+            if not achados: continue
+            cobertas += 1
+            acertos_top1 += achados[0]["classe"] == caso["classe"]
+            votos = sum(1 if a["classe"] == caso["classe"] else -1 for a in achados)
+            acertos_maioria += votos > 0
+    tempos.sort()
+    return {
+        "consultas": consultas,
+        "cobertura": cobertas / consultas if consultas else float("nan"),
+        "acuracia_top1": acertos_top1 / cobertas if cobertas else float("nan"),
+        "acuracia_maioria": acertos_maioria / cobertas if cobertas else float("nan"),
+        "ms_p50": 1000 * tempos[len(tempos) // 2] if tempos else float("nan"),
+        "ms_p99": 1000 * tempos[min(len(tempos) - 1, int(len(tempos) * 0.99))] if tempos else float("nan"),
+    }
+
+# ==========================
+# 🚀 CLI
+# ==========================
+def main():
+    ap = argparse.ArgumentParser(description="Índice de casos parecidos (TF-IDF com hashing)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    for nome in ("construir", "avaliar"):
+        p = sub.add_parser(nome)
+        p.add_argument("--glob", default=GLOB_PADRAO)
+        p.add_argument("--indice", default=INDICE_PADRAO, help='Índice dos shards ("" para ignorar)')
+        p.add_argument("--saida", default=INDICE_CASOS_PADRAO)
+        p.add_argument("--k", type=int, default=K_PADRAO)
+    sub.choices["avaliar"].add_argument("--teste", type=float, default=0.25)
+    sub.choices["avaliar"].add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    if args.cmd == "construir":
+        inicio = time.perf_counter()
+
+        def casos():  # relê os históricos a cada passada em vez de guardar todos
+            for cid, h in carregar_historicos(args.glob, args.indice):
+                caso = caso_de_historico(cid, h)
+                if caso: yield caso
+
+        indice = IndiceCasos.construir(casos)
+        indice.salvar(args.saida)
+        print(f"💾 {len(indice.casos)} casos em {args.saida} ({time.perf_counter() - inicio:.1f}s)")
+        return
+    historicos = dict(carregar_historicos(args.glob, args.indice))
+    ids_base, ids_teste = _dividir(historicos, args.teste, args.seed)
+    casos = [c for c in (caso_de_historico(cid, historicos[cid]) for cid in ids_base) if c]
+    indice = IndiceCasos.construir(casos)
+    r = avaliar(indice, [(cid, historicos[cid]) for cid in ids_teste], args.k)
+    print(f"📊 {len(casos)} casos na base, {r['consultas']} consultas: cobertura {r['cobertura']:.1%}, "
+          f"top-1 {r['acuracia_top1']:.1%}, maioria dos {args.k} {r['acuracia_maioria']:.1%}, "
+          f"latência p50 {r['ms_p50']:.2f} ms / p99 {r['ms_p99']:.2f} ms")
+
+if __name__ == "__main__":
+    main()
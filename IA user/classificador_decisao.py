@@ -0,0 +1,265 @@
+"""
+Classificador local de decisão antecipada (Qualificado / Desqualificado).
+
+N-gramas (palavras e bigramas) com hashing + regressão logística, em Python
+puro, treinado a partir dos históricos salvos em JSON_Conversas. No servidor
+ele roda a cada turno em `processar` sobre o histórico da sessão e, quando a
+confiança passa do limiar, vira uma dica no prompt. Lê os `conversa_*.json`
+antigos e os registros do índice dos shards (armazenamento.py).
+
+Treino e avaliação pela linha de comando:
+  python classificador_decisao.py treinar --glob "JSON_Conversas/conversa_*.json"
+  python classificador_decisao.py avaliar --glob "JSON_Conversas/conversa_*.json"
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import random
+import re
+import time
+import zlib
+
+from armazenamento import NOME_INDICE, ler_indice, ler_registro
+
+# ==========================
+# 🔧 CONFIGURAÇÃO
+# ==========================
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELO_PADRAO = os.path.join(BASE_DIR, "modelos", "classificador_decisao.json")
+GLOB_PADRAO = os.path.join(BASE_DIR, "JSON_Conversas", "conversa_*.json")
+INDICE_PADRAO = os.path.join(BASE_DIR, "JSON_Conversas", NOME_INDICE)
+
+N_BUCKETS = 1 << 18
+CLASSES = ("Desqualificado", "Qualificado")  # rótulo 0 / 1
+LIMIAR_PADRAO = 0.90
+MIN_TURNOS_PADRAO = 2
+
+_PALAVRA_RE = re.compile(r"\w+", re.UNICODE)
+
+# ==========================
+# 🔢 FEATURES
+# ==========================
+def _bucket(token: str) -> int:
+    # crc32 é estável entre processos (hash() do Python não é)
+    return zlib.crc32(token.encode("utf-8")) & (N_BUCKETS - 1)
+
+def acumular_ngramas(texto, contagens=None):
+    """Soma unigramas + bigramas de `texto` em `contagens` (bucket -> contagem)."""
+    if contagens is None: contagens = {}
+    if not texto: return contagens
+    palavras = _PALAVRA_RE.findall(texto.lower())
+    anterior = None
+    for p in palavras:
+        b = _bucket(p)
+        contagens[b] = contagens.get(b, 0) + 1
+        if anterior is not None:
+            b = _bucket(anterior + " " + p)
+            contagens[b] = contagens.get(b, 0) + 1
+        anterior = p
+    return contagens
+
+def acumular_turno(turno, contagens=None):
+    """Texto de um turno do histórico: cliente + as duas respostas."""
+    if contagens is None: contagens = {}
+    acumular_ngramas(turno.get("user_simulado") or turno.get("input") or turno.get("user_input"), contagens)
+    acumular_ngramas((turno.get("gpt") or {}).get("msg") or turno.get("gpt_response"), contagens)
+    acumular_ngramas((turno.get("gemini") or {}).get("msg") or turno.get("gemini_response"), contagens)
+    return contagens
+
+def vetorizar(contagens):
+    """log(1 + tf) normalizado em L2 -> lista de (bucket, valor)."""
+    if not contagens: return []
+    itens = [(b, math.log1p(c)) for b, c in contagens.items()]
+    norma = math.sqrt(sum(v * v for _, v in itens)) or 1.0
+    return [(b, v / norma) for b, v in itens]
+
+# ==========================
+# 🧠 MODELO
+# ==========================
+class ClassificadorDecisao:
+    def __init__(self, pesos=None, vies=0.0, limiar=LIMIAR_PADRAO, min_turnos=MIN_TURNOS_PADRAO):
+        self.pesos = pesos or {}
+        self.vies = vies
+        self.limiar = limiar
+        self.min_turnos = min_turnos
+
+    def prob_qualificado(self, contagens) -> float:
+        z = self.vies
+        pesos = self.pesos
+        for b, v in vetorizar(contagens):
+            w = pesos.get(b)
+            if w is not None: z += w * v
+        if z < -35: return 0.0
+        return 1.0 / (1.0 + math.exp(-z))
+
+    def prever(self, contagens):
+        """(classe, confiança) para o estado atual da conversa."""
+        p = self.prob_qualificado(contagens)
+        return (CLASSES[1], p) if p >= 0.5 else (CLASSES[0], 1.0 - p)
+
+    def decisao_antecipada(self, contagens, n_turnos):
+        """(classe, confiança) se a confiança passar do limiar, senão None."""
+        if n_turnos < self.min_turnos: return None
+        classe, conf = self.prever(contagens)
+        return (classe, conf) if conf >= self.limiar else None
+
+    def salvar(self, caminho=MODELO_PADRAO):
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        with open(caminho, "w", encoding="utf-8") as f:
+            json.dump({
+                "n_buckets": N_BUCKETS, "classes": CLASSES,
+                "vies": self.vies, "limiar": self.limiar, "min_turnos": self.min_turnos,
+                "pesos": {str(b): round(w, 6) for b, w in self.pesos.items() if abs(w) > 1e-6},
+            }, f)
+
+    @classmethod
+    def carregar(cls, caminho=MODELO_PADRAO):
+        with open(caminho, "r", encoding="utf-8") as f:
+            dados = json.load(f)
+        if dados.get("n_buckets") != N_BUCKETS:
+            raise ValueError(f"Modelo {caminho} usa n_buckets={dados.get('n_buckets')}, esperado {N_BUCKETS}")
+        return cls(
+            pesos={int(b): w for b, w in dados["pesos"].items()},
+            vies=dados.get("vies", 0.0),
+            limiar=dados.get("limiar", LIMIAR_PADRAO),
+            min_turnos=dados.get("min_turnos", MIN_TURNOS_PADRAO),
+        )
+
+def treinar(amostras, epocas=30, taxa=0.5, l2=1e-4, seed=0, **kwargs):
+    """Regressão logística por SGD sobre amostras (contagens, rótulo 0/1)."""
+    rng = random.Random(seed)
+    vetores = [(vetorizar(c), y) for c, y in amostras]
+    pesos, vies = {}, 0.0
+    for epoca in range(epocas):
+        rng.shuffle(vetores)
+        lr = taxa / (1.0 + epoca)
+        for x, y in vetores:
+            z = vies + sum(pesos.get(b, 0.0) * v for b, v in x)
+            p = 1.0 / (1.0 + math.exp(-max(-35.0, min(35.0, z))))
+            g = p - y
+            vies -= lr * g
+            for b, v in x:
+                w = pesos.get(b, 0.0)
+                pesos[b] = w - lr * (g * v + l2 * w)
+    return ClassificadorDecisao(pesos, vies, **kwargs)
+
+# ==========================
+# 📂 DADOS
+# ==========================
+def _classe_final(turno, chave):
+    cls = ((turno.get(chave) or {}).get("class") or "").strip().lower()
+    for i, c in enumerate(CLASSES):
+        if cls == c.lower(): return i
+    return None
+
+def amostras_de_conversa(historico):
+    """
+    Uma amostra por prefixo antes da primeira decisão: o texto dos turnos
+    0..t-1 (o que o servidor já tem ao chamar o n8n no turno t) com o rótulo
+    da decisão final. Conversas sem decisão ou com GPT e Gemini discordando
+    ficam de fora.
+    """
+    decisoes = {}
+    for i, turno in enumerate(historico):
+        for chave in ("gpt", "gemini"):
+            r = _classe_final(turno, chave)
+            if r is not None and chave not in decisoes: decisoes[chave] = (i, r)
+    rotulos = {r for _, r in decisoes.values()}
+    if len(rotulos) != 1: return []
+    rotulo = rotulos.pop()
+    dturn = min(i for i, _ in decisoes.values())
+
+    amostras, contagens = [], {}
+    for t in range(1, dturn + 1):
+        acumular_turno(historico[t - 1], contagens)
+        amostras.append((dict(contagens), rotulo, t, dturn))
+    return amostras
+
+def carregar_historicos(padrao, indice=None):
+    for caminho in sorted(glob.glob(padrao)):
+        with open(caminho, "r", encoding="utf-8") as f:
+            hist = json.load(f).get("historico")
+        if isinstance(hist, list): yield os.path.basename(caminho), hist
+    if indice and os.path.exists(indice):
+        pasta = os.path.dirname(indice)
+        for entrada in ler_indice(pasta):
+            hist = ler_registro(pasta, entrada).get("historico")
+            if isinstance(hist, list): yield entrada["id"], hist
+
+def _dividir(conversas, fracao_teste, seed):
+    ids = sorted(conversas)
+    random.Random(seed).shuffle(ids)
+    n_teste = int(round(len(ids) * fracao_teste))
+    return ids[n_teste:], ids[:n_teste]
+
+def avaliar(modelo, conversas):
+    """Acurácia por amostra, cobertura no limiar e turnos antecipados."""
+    acertos = total = sinalizados = acertos_sinal = antecipados = 0
+    tempo = 0.0
+    for amostras in conversas.values():
+        primeiro = None
+        for contagens, rotulo, t, dturn in amostras:
+            t0 = time.perf_counter()
+            classe, conf = modelo.prever(contagens)
+            tempo += time.perf_counter() - t0
+            total += 1
+            acertos += int(CLASSES.index(classe) == rotulo)
+            if t >= modelo.min_turnos and conf >= modelo.limiar:
+                sinalizados += 1
+                acertos_sinal += int(CLASSES.index(classe) == rotulo)
+                if primeiro is None: primeiro = dturn - t
+        antecipados += primeiro or 0
+    return {
+        "amostras": total,
+        "acuracia": acertos / total if total else float("nan"),
+        "sinalizados": sinalizados,
+        "precisao_sinalizados": acertos_sinal / sinalizados if sinalizados else float("nan"),
+        "turnos_antecipados": antecipados,
+        "us_por_turno": 1e6 * tempo / total if total else float("nan"),
+    }
+
+# ==========================
+# 🚀 CLI
+# ==========================
+def main():
+    ap = argparse.ArgumentParser(description="Classificador local de decisão antecipada")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    for nome in ("treinar", "avaliar"):
+        p = sub.add_parser(nome)
+        p.add_argument("--glob", default=GLOB_PADRAO)
+        p.add_argument("--indice", default=INDICE_PADRAO, help='Índice dos shards ("" para ignorar)')
+        p.add_argument("--modelo", default=MODELO_PADRAO)
+        p.add_argument("--teste", type=float, default=0.25, help="Fração de conversas separada para avaliação")
+        p.add_argument("--seed", type=int, default=0)
+        p.add_argument("--limiar", type=float, default=LIMIAR_PADRAO)
+        p.add_argument("--min_turnos", type=int, default=MIN_TURNOS_PADRAO)
+    sub.choices["treinar"].add_argument("--epocas", type=int, default=30)
+    args = ap.parse_args()
+
+    conversas = {cid: amostras_de_conversa(h) for cid, h in carregar_historicos(args.glob, args.indice)}
+    conversas = {cid: a for cid, a in conversas.items() if a}
+    if not conversas:
+        raise SystemExit(f"Nenhuma conversa com decisão em: {args.glob}")
+    ids_treino, ids_teste = _dividir(conversas, args.teste, args.seed)
+
+    if args.cmd == "treinar":
+        amostras = [(c, y) for cid in ids_treino for c, y, _, _ in conversas[cid]]
+        modelo = treinar(amostras, epocas=args.epocas, seed=args.seed,
+                         limiar=args.limiar, min_turnos=args.min_turnos)
+        modelo.salvar(args.modelo)
+        print(f"💾 Modelo salvo em {args.modelo} ({len(amostras)} amostras, {len(ids_treino)} conversas)")
+    else:
+        modelo = ClassificadorDecisao.carregar(args.modelo)
+        modelo.limiar, modelo.min_turnos = args.limiar, args.min_turnos
+
+    if ids_teste:
+        res = avaliar(modelo, {cid: conversas[cid] for cid in ids_teste})
+        print(f"📊 Avaliação em {len(ids_teste)} conversas:")
+        for k, v in res.items():
+            print(f"   {k}: {v:.3f}" if isinstance(v, float) else f"   {k}: {v}")
+
+if __name__ == "__main__":
+    main()
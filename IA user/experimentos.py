@@ -0,0 +1,208 @@
+"""
+Runner de experimentos: matriz versões de prompt × pernas de modelo × personas × repetições.
+
+Cada célula da matriz é uma conversa completa rodada contra o servidor
+(`app.py`) numa sessão própria, com uma persona local no papel do cliente.
+As células rodam em paralelo até o limite de `--concorrencia`; cada célula
+concluída vai para um checkpoint JSONL, então rodar de novo o mesmo comando
+retoma de onde parou. As conversas são salvas pelo `/salvar_conversa` com a
+célula no campo "experimento" e, no fim, a análise (Analise/compare_gpt_vs_gemini_v4_ptbr.py)
+roda sobre os registros do experimento, escolhidos pelo índice dos shards.
+
+  python experimentos.py --nome noite01 --prompts v1,v2 --modelos gpt,gemini,gpt+gemini \\
+      --personas todas --repeticoes 20 --concorrencia 8
+
+Ou com a matriz num JSON ({"prompts": [...], "modelos": [...], "personas": [...], "repeticoes": N}):
+  python experimentos.py --nome noite01 --matriz matriz.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from armazenamento import NOME_INDICE
+from personas import PERSONAS
+
+# ==========================
+# 🔧 CONFIGURAÇÃO
+# ==========================
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVIDOR_PADRAO = "http://127.0.0.1:5000"
+PASTA_CONVERSAS = os.path.join(BASE_DIR, "JSON_Conversas")
+SCRIPT_ANALISE = os.path.join(BASE_DIR, "..", "Analise", "compare_gpt_vs_gemini_v4_ptbr.py")
+MAX_TURNOS = 12  # mesmo teto do MAX_AI_LOOPS do servidor
+
+# ==========================
+# 🧮 MATRIZ
+# ==========================
+def _lista(valor):
+    if isinstance(valor, str): return [v.strip() for v in valor.split(",") if v.strip()]
+    return list(valor)
+
+def montar_celulas(prompts, modelos, personas, repeticoes):
+    """Produto cartesiano da matriz; `modelos` usa "+" para pernas juntas (gpt+gemini)."""
+    if personas == ["todas"]: personas = list(PERSONAS)
+    desconhecidas = [p for p in personas if p not in PERSONAS]
+    if desconhecidas:
+        raise SystemExit(f"Personas desconhecidas: {', '.join(desconhecidas)}")
+    celulas = []
+    for prompt, perna, persona, rep in itertools.product(prompts, modelos, personas, range(repeticoes)):
+        celulas.append({
+            "id": f"{prompt}|{perna}|{persona}|r{rep}",
+            "prompt_versao": prompt,
+            "modelos": perna.split("+"),
+            "persona": persona,
+            "repeticao": rep,
+        })
+    return celulas
+
+# ==========================
+# 💾 CHECKPOINT
+# ==========================
+class Checkpoint:
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.lock = threading.Lock()
+        self.concluidas = set()
+        if os.path.exists(caminho):
+            with open(caminho, "r", encoding="utf-8") as f:
+                for linha in f:
+                    try: self.concluidas.add(json.loads(linha)["celula"])
+                    except (ValueError, KeyError): pass  # linha cortada por interrupção
+
+    def registrar(self, registro):
+        with self.lock:
+            with open(self.caminho, "a", encoding="utf-8") as f:
+                f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.concluidas.add(registro["celula"])
+
+# ==========================
+# ▶️ EXECUÇÃO
+# ==========================
+def rodar_celula(servidor, experimento, celula, tentativa=1, pausa=0.0, timeout=120):
+    """Roda uma conversa inteira da célula e salva no servidor. Devolve o registro do checkpoint."""
+    # Sessão nova a cada tentativa, para não herdar turnos de uma tentativa que caiu no meio
+    sessao = f"{experimento}-{zlib.crc32(celula['id'].encode('utf-8')):08x}-t{tentativa}"
+    http = requests.Session()
+    inicio = time.time()
+    turnos = 0
+    salvo = None
+    try:
+        for loop_count in range(MAX_TURNOS + 1):
+            r = http.post(f"{servidor}/processar", json={
+                "entrada": "Olá", "user_type": "ai_user", "loop_count": loop_count,
+                "sessao": sessao, "persona": celula["persona"], "seed": celula["repeticao"],
+                "modelos": celula["modelos"], "prompt_versao": celula["prompt_versao"],
+                "auto_loop": False,
+            }, timeout=timeout)
+            if r.status_code == 502:  # n8n falhou: o turno saiu com "Erro ao conectar", não dá para salvar
+                raise RuntimeError(f"turno {loop_count}: {r.json().get('mensagem', 'falha no n8n')}")
+            r.raise_for_status()
+            turnos += 1
+            if r.json().get("encerrado"): break
+            if pausa: time.sleep(pausa)
+
+        r = http.post(f"{servidor}/salvar_conversa", json={
+            "sessao": sessao, "encerrar": True,
+            "experimento": {"nome": experimento, "celula": celula["id"], **{k: celula[k] for k in
+                            ("prompt_versao", "modelos", "persona", "repeticao")}},
+        }, timeout=timeout)
+        r.raise_for_status()
+        salvo = r.json()
+        if salvo.get("status") != "ok":
+            raise RuntimeError(salvo.get("mensagem", "falha ao salvar"))
+    finally:
+        # Tentativa que caiu: limpa a sessão no servidor (histórico, arquivo de despejo, métricas)
+        if salvo is None or salvo.get("status") != "ok":
+            try: http.post(f"{servidor}/processar", json={"entrada": "reset", "sessao": sessao}, timeout=timeout)
+            except requests.RequestException: pass
+    return {"celula": celula["id"], "arquivo": salvo["arquivo"], "turnos": turnos,
+            "segundos": round(time.time() - inicio, 2)}
+
+def rodar_matriz(celulas, servidor, experimento, checkpoint, concorrencia, tentativas, pausa):
+    pendentes = [c for c in celulas if c["id"] not in checkpoint.concluidas]
+    print(f"🧪 {experimento}: {len(celulas)} células, {len(celulas) - len(pendentes)} já concluídas, "
+          f"{len(pendentes)} pendentes (concorrência {concorrencia})")
+
+    def tarefa(celula):
+        for tentativa in range(1, tentativas + 1):
+            try: return rodar_celula(servidor, experimento, celula, tentativa, pausa)
+            except Exception as e:
+                print(f"⚠️ {celula['id']} tentativa {tentativa}/{tentativas}: {e}")
+                time.sleep(min(60, 2 ** tentativa))
+        return None
+
+    falhas = 0
+    with ThreadPoolExecutor(max_workers=concorrencia) as pool:
+        futuros = {pool.submit(tarefa, c): c for c in pendentes}
+        for i, fut in enumerate(as_completed(futuros), 1):
+            registro = fut.result()
+            if registro:
+                checkpoint.registrar(registro)
+                print(f"✅ [{i}/{len(pendentes)}] {registro['celula']} ({registro['turnos']} turnos, {registro['segundos']}s)")
+            else:
+                falhas += 1
+                print(f"❌ [{i}/{len(pendentes)}] {futuros[fut]['id']} falhou; roda de novo para retomar")
+    return falhas
+
+def analisar(experimento, saida, precos):
+    cmd = [sys.executable, SCRIPT_ANALISE, "--input_glob", os.path.join(PASTA_CONVERSAS, NOME_INDICE),
+           "--where", f"experimento={experimento}",
+           "--output_dir", os.path.join(saida, "analise"),
+           "--gpt_out_per_m", str(precos[0]), "--gemini_out_per_m", str(precos[1])]
+    print("📊 " + " ".join(cmd))
+    subprocess.run(cmd, check=True)
+
+# ==========================
+# 🚀 CLI
+# ==========================
+def main():
+    ap = argparse.ArgumentParser(description="Runner de experimentos (prompts × modelos × personas × repetições)")
+    ap.add_argument("--nome", required=True, help="Nome do experimento (prefixo das sessões e arquivos)")
+    ap.add_argument("--matriz", help="JSON com prompts, modelos, personas e repeticoes")
+    ap.add_argument("--prompts", default="atual")
+    ap.add_argument("--modelos", default="gpt+gemini", help='Pernas separadas por vírgula, ex.: "gpt,gemini,gpt+gemini"')
+    ap.add_argument("--personas", default="todas")
+    ap.add_argument("--repeticoes", type=int, default=1)
+    ap.add_argument("--concorrencia", type=int, default=4)
+    ap.add_argument("--tentativas", type=int, default=3)
+    ap.add_argument("--pausa", type=float, default=0.0, help="Pausa entre turnos de uma mesma conversa (s)")
+    ap.add_argument("--servidor", default=SERVIDOR_PADRAO)
+    ap.add_argument("--saida", default=None, help="Pasta do checkpoint e da análise (padrão: experimentos/<nome>)")
+    ap.add_argument("--sem_analise", action="store_true")
+    ap.add_argument("--gpt_out_per_m", type=float, default=1.60)
+    ap.add_argument("--gemini_out_per_m", type=float, default=2.50)
+    args = ap.parse_args()
+
+    matriz = {"prompts": args.prompts, "modelos": args.modelos, "personas": args.personas, "repeticoes": args.repeticoes}
+    if args.matriz:
+        with open(args.matriz, "r", encoding="utf-8") as f:
+            matriz.update(json.load(f))
+    celulas = montar_celulas(_lista(matriz["prompts"]), _lista(matriz["modelos"]),
+                             _lista(matriz["personas"]), int(matriz["repeticoes"]))
+
+    saida = args.saida or os.path.join(BASE_DIR, "experimentos", args.nome)
+    os.makedirs(saida, exist_ok=True)
+    checkpoint = Checkpoint(os.path.join(saida, "checkpoint.jsonl"))
+
+    falhas = rodar_matriz(celulas, args.servidor, args.nome, checkpoint,
+                          args.concorrencia, args.tentativas, args.pausa)
+    if falhas:
+        print(f"⚠️ {falhas} células falharam; a análise fica para a próxima rodada.")
+        sys.exit(1)
+    if not args.sem_analise:
+        analisar(args.nome, saida, (args.gpt_out_per_m, args.gemini_out_per_m))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Métricas ao vivo do servidor (sem reler os JSON salvos).
+
+Cada turno processado alimenta, por modelo, estatísticas em streaming com
+memória constante:
+- média/desvio de tokens e custo por turno (Welford, numericamente estável);
+- quantis p50/p90/p99 de tokens por turno e da latência do n8n (segundos da
+  chamada ao upstream, sem o ritmo de 3 s entre turnos) e a mediana do turno de decisão
+  (algoritmo P² de Jain & Chlamtac: 5 marcadores por quantil, sem guardar amostras);
+- taxa de decisão por modelo (conversas que chegaram a Qualificado/Desqualificado)
+  e contagem por classe.
+
+Uma conversa é uma sessão do servidor: começa no primeiro turno e termina quando
+a sessão é limpa (reset ou /salvar_conversa com encerrar). O app expõe o
+`resumo()` em GET /metricas e no canal Socket.IO "metricas" (para quem entra na
+sala "metricas": `socket.emit("entrar", {"metricas": true})`).
+"""
+
+import math
+import threading
+
+# ==========================
+# 🔧 CONFIGURAÇÃO
+# ==========================
+MODELOS = ("gpt", "gemini")
+QUANTIS = (0.5, 0.9, 0.99)
+
+
+def classe_decisao(classe):
+    """Rótulo da decisão (Qualificado/Desqualificado) ou None; mesmo teste por substring do app."""
+    c = (classe or "").lower()
+    if "desqualificado" in c: return "Desqualificado"
+    if "qualificado" in c: return "Qualificado"
+    return None
+
+
+class Welford:
+    def __init__(self):
+        self.n = 0
+        self.media = 0.0
+        self.m2 = 0.0
+
+    def atualizar(self, x):
+        self.n += 1
+        delta = x - self.media
+        self.media += delta / self.n
+        self.m2 += delta * (x - self.media)
+
+    @property
+    def desvio(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+    def resumo(self):
+        return {"n": self.n, "media": self.media if self.n else None, "desvio": self.desvio if self.n else None}
+
+
+class P2Quantil:
+    """Estimador P² de um quantil p (Jain & Chlamtac, 1985)."""
+
+    def __init__(self, p):
+        self.p = p
+        self.q = []                                   # alturas dos 5 marcadores
+        self.pos = [0, 1, 2, 3, 4]                    # posições reais
+        self.desejada = [0, 2 * p, 4 * p, 2 + 2 * p, 4]
+        self.incremento = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def atualizar(self, x):
+        q = self.q
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            return
+
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = max(i for i in range(4) if q[i] <= x)
+        for i in range(k + 1, 5):
+            self.pos[i] += 1
+        for i in range(5):
+            self.desejada[i] += self.incremento[i]
+
+        n = self.pos
+        for i in (1, 2, 3):
+            d = self.desejada[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                # parabólica; se sair do intervalo dos vizinhos, linear
+                qp = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if not q[i - 1] < qp < q[i + 1]:
+                    qp = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = qp
+                n[i] += d
+
+    def valor(self):
+        if not self.q:
+            return None
+        if len(self.q) < 5:
+            return self.q[min(len(self.q) - 1, int(round(self.p * (len(self.q) - 1))))]
+        return self.q[2]
+
+
+class EstatModelo:
+    def __init__(self):
+        self.turnos = 0
+        self.tokens = Welford()
+        self.custo = Welford()
+        self.tokens_q = {p: P2Quantil(p) for p in QUANTIS}
+        self.latencia = Welford()
+        self.latencia_q = {p: P2Quantil(p) for p in QUANTIS}
+        self.turno_decisao = Welford()
+        self.turno_decisao_mediana = P2Quantil(0.5)
+        self.conversas = 0
+        self.decididas = 0
+        self.por_classe = {}
+
+    def resumo(self):
+        return {
+            "turnos": self.turnos,
+            "tokens_por_turno": {**self.tokens.resumo(), **{f"p{int(p * 100)}": q.valor() for p, q in self.tokens_q.items()}},
+            "custo_por_turno": self.custo.resumo(),
+            "latencia_n8n_s": {**self.latencia.resumo(), **{f"p{int(p * 100)}": q.valor() for p, q in self.latencia_q.items()}},
+            "conversas": self.conversas,
+            "decididas": self.decididas,
+            "taxa_decisao": self.decididas / self.conversas if self.conversas else None,
+            "por_classe": dict(self.por_classe),
+            "turno_decisao": {**self.turno_decisao.resumo(), "p50": self.turno_decisao_mediana.valor()},
+        }
+
+
+class AgregadorAoVivo:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.modelos = {m: EstatModelo() for m in MODELOS}
+        self.ativas = {}  # sessao -> {modelo: já decidiu?}
+
+    def registrar_turno(self, sessao, indice_turno, pernas):
+        """
+        pernas: modelo -> (classe, tokens, custo, segundos do n8n ou None) só das
+        pernas que responderam neste turno (perna já encerrada não entra).
+        """
+        with self.lock:
+            conversa = self.ativas.get(sessao)
+            if conversa is None:
+                conversa = self.ativas[sessao] = {}
+            for modelo, (classe, tokens, custo, latencia) in pernas.items():
+                est = self.modelos.setdefault(modelo, EstatModelo())
+                if modelo not in conversa:
+                    conversa[modelo] = False
+                    est.conversas += 1
+                est.turnos += 1
+                est.tokens.atualizar(tokens)
+                est.custo.atualizar(custo)
+                for q in est.tokens_q.values():
+                    q.atualizar(tokens)
+                if latencia is not None:
+                    est.latencia.atualizar(latencia)
+                    for q in est.latencia_q.values():
+                        q.atualizar(latencia)
+                decisao = classe_decisao(classe)
+                if decisao and not conversa[modelo]:
+                    conversa[modelo] = True
+                    est.decididas += 1
+                    est.por_classe[decisao] = est.por_classe.get(decisao, 0) + 1
+                    est.turno_decisao.atualizar(indice_turno)
+                    est.turno_decisao_mediana.atualizar(indice_turno)
+
+    def encerrar_sessao(self, sessao):
+        with self.lock:
+            self.ativas.pop(sessao, None)
+
+    def resumo(self):
+        with self.lock:
+            return {
+                "sessoes_ativas": len(self.ativas),
+                "modelos": {m: est.resumo() for m, est in self.modelos.items()},
+            }
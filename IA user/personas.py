@@ -0,0 +1,216 @@
+"""
+Clientes simulados roteirizados (personas) para o modo IA user.
+
+Cada persona é um cenário fixo (fatos, pedido, material probatório) que
+responde às perguntas dos assistentes localmente, sem chamar o LLM do
+cliente simulado. As respostas dependem só da persona, da seed e das
+mensagens recebidas, então a mesma seed reproduz a mesma conversa do lado
+do cliente.
+
+  python personas.py              # lista as personas
+  python personas.py compra_nao_entregue --seed 3
+"""
+
+import argparse
+import random
+import unicodedata
+from dataclasses import dataclass, field
+
+# ==========================
+# 🔎 TÓPICOS DAS PERGUNTAS
+# ==========================
+# Palavras-chave (sem acento) que indicam o que os assistentes perguntaram.
+# A ordem é a prioridade quando a mensagem toca em vários tópicos.
+TOPICOS = {
+    "partes": ("partes envolvidas", "empresa", "quem ", "loja", "empregador", "contra quem"),
+    "quando": ("quando", "data", "ha quanto tempo", "em que dia", "periodo"),
+    "fatos": ("o que aconteceu", "ordem cronologica", "conte", "detalh", "como os fatos", "explique"),
+    "tentativa": ("tentativa", "tentou", "contato", "reclamacao", "procon", "protocolo", "resolver"),
+    "pedido": ("resolvido", "reembolso", "indenizacao", "correcao", "deseja", "gostaria", "busca", "pedido"),
+    "acordo": ("acordo", "negociar", "conciliacao"),
+    "valor": ("valor", "quanto", "preco", "pagou", "r$"),
+    "provas": ("prints", "nota fiscal", "comprovante", "documento", "e-mail", "email", "contrato", "prova"),
+    "testemunhas": ("testemunha",),
+}
+
+def _normalizar(texto) -> str:
+    texto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(c for c in texto if not unicodedata.combining(c)).lower()
+
+def topicos_perguntados(texto):
+    """Tópicos citados em `texto`, na ordem de prioridade de TOPICOS."""
+    t = _normalizar(texto)
+    return [nome for nome, chaves in TOPICOS.items() if any(k in t for k in chaves)]
+
+# ==========================
+# 👤 PERSONAS
+# ==========================
+@dataclass(frozen=True)
+class Persona:
+    nome: str
+    descricao: str
+    gabarito: str  # classificação esperada: Qualificado / Desqualificado
+    aberturas: tuple
+    respostas: dict  # tópico -> variações de resposta
+    genericas: tuple = field(default=(
+        "Acho que já contei tudo o que sei, mas pode perguntar o que faltar.",
+        "Não tenho mais detalhes além do que já falei.",
+        "É isso, o que mais você precisa saber?",
+    ))
+
+PERSONAS = {p.nome: p for p in (
+    Persona(
+        nome="compra_nao_entregue",
+        descricao="Consumidor: TV comprada pela internet nunca foi entregue",
+        gabarito="Qualificado",
+        aberturas=(
+            "Oi, comprei uma TV pela internet e ela nunca chegou. Queria saber o que posso fazer.",
+            "Olá! Paguei uma televisão numa loja online há mais de um mês e até agora nada de entrega.",
+        ),
+        respostas={
+            "partes": ("Fui eu que comprei, na loja online MegaEletro, e a entrega era pela transportadora deles.",),
+            "quando": ("Comprei no dia 3 de novembro, com prazo de entrega até dia 15. Já passou mais de um mês.",),
+            "fatos": ("Paguei no cartão, o pedido ficou como 'em transporte' e depois sumiu do rastreio. A loja só diz para aguardar.",),
+            "tentativa": ("Abri três protocolos no SAC e uma reclamação no Reclame Aqui, mas não resolveram nada.",),
+            "pedido": ("Quero receber a TV ou o dinheiro de volta, e acho justo algum valor pelo transtorno.",),
+            "acordo": ("Aceito acordo, desde que devolvam o dinheiro rápido.",),
+            "valor": ("A TV custou R$ 3.200,00, parcelado em 10 vezes no cartão.",),
+            "provas": ("Tenho a nota fiscal, o comprovante do cartão, os prints do rastreio e os números de protocolo.",),
+            "testemunhas": ("Minha esposa acompanhou as ligações para o SAC.",),
+        },
+    ),
+    Persona(
+        nome="trabalhista",
+        descricao="Empregado demitido sem receber verbas rescisórias e horas extras",
+        gabarito="Qualificado",
+        aberturas=(
+            "Boa tarde, fui demitido e a empresa não pagou minha rescisão.",
+            "Olá, trabalhei dois anos numa empresa e saí sem receber o que me deviam.",
+        ),
+        respostas={
+            "partes": ("Eu e a empresa Logística Sul, onde trabalhava como auxiliar de expedição.",),
+            "quando": ("Trabalhei de março de 2022 até agosto deste ano, quando fui dispensado sem justa causa.",),
+            "fatos": ("Fazia duas horas extras quase todo dia sem receber, e na demissão não pagaram as verbas rescisórias nem liberaram o FGTS.",),
+            "tentativa": ("Falei com o RH várias vezes, mandaram esperar e depois pararam de responder.",),
+            "pedido": ("Quero receber a rescisão, o FGTS com a multa e as horas extras.",),
+            "acordo": ("Topo acordo se pagarem tudo certinho.",),
+            "valor": ("Meu salário era R$ 2.400,00; acho que a rescisão passa de R$ 8.000,00 fora as horas extras.",),
+            "provas": ("Tenho a carteira assinada, os contracheques, o termo de dispensa e fotos do ponto.",),
+            "testemunhas": ("Dois colegas do mesmo turno podem confirmar as horas extras.",),
+        },
+    ),
+    Persona(
+        nome="bagagem_extraviada",
+        descricao="Passageiro com mala extraviada em voo nacional",
+        gabarito="Qualificado",
+        aberturas=("Oi, a companhia aérea perdeu minha mala numa viagem e até hoje não devolveu.",),
+        respostas={
+            "partes": ("Eu e a companhia aérea, voo de Porto Alegre para Recife.",),
+            "quando": ("Foi no dia 12 de dezembro, já se passaram mais de 30 dias.",),
+            "fatos": ("Despachei a mala, ela não chegou em Recife e fiquei a viagem toda sem roupa, tive que comprar tudo.",),
+            "tentativa": ("Registrei o RIB no aeroporto e liguei várias vezes, dizem que ainda estão procurando.",),
+            "pedido": ("Quero ser ressarcido pelos objetos e pelas compras que fiz, e pelo transtorno.",),
+            "acordo": ("Aceito acordo, sim.",),
+            "valor": ("Na mala tinha uns R$ 4.000,00 em coisas e gastei mais R$ 1.200,00 lá.",),
+            "provas": ("Tenho o cartão de embarque, a etiqueta da bagagem, o RIB e as notas das compras.",),
+            "testemunhas": ("Minha irmã estava viajando comigo.",),
+        },
+    ),
+    Persona(
+        nome="sem_merito",
+        descricao="Caso sem mérito: fone barato com defeito após mau uso, valor abaixo de R$ 1.000",
+        gabarito="Desqualificado",
+        aberturas=("Oi, meu fone de ouvido estragou e quero processar a loja.",),
+        respostas={
+            "partes": ("Eu e a loja do shopping onde comprei o fone.",),
+            "quando": ("Comprei faz uns 8 meses.",),
+            "fatos": ("Ele caiu na piscina e parou de funcionar, a loja disse que a garantia não cobre.",),
+            "tentativa": ("Fui na loja uma vez e negaram a troca.",),
+            "pedido": ("Quero um fone novo e uma indenização.",),
+            "acordo": ("Aceito um fone novo.",),
+            "valor": ("Custou R$ 180,00.",),
+            "provas": ("Não guardei a nota, só tenho a caixa.",),
+            "testemunhas": ("Não tem ninguém.",),
+        },
+    ),
+    Persona(
+        nome="penal",
+        descricao="Área penal (fora do escopo): ameaça de vizinho",
+        gabarito="Desqualificado",
+        aberturas=("Olá, meu vizinho me ameaçou e quero saber como denunciar.",),
+        respostas={
+            "partes": ("Eu e o vizinho do apartamento de cima.",),
+            "quando": ("Foi semana passada, numa discussão no corredor.",),
+            "fatos": ("Reclamei do barulho e ele disse que ia me pegar, fiquei com medo.",),
+            "tentativa": ("Falei com o síndico, mas ele não fez nada.",),
+            "pedido": ("Quero que ele responda criminalmente pela ameaça.",),
+            "acordo": ("Não quero acordo com ele.",),
+            "valor": ("Não tem valor envolvido, quero só que ele pare.",),
+            "provas": ("Tenho um áudio da discussão.",),
+            "testemunhas": ("O porteiro ouviu tudo.",),
+        },
+    ),
+)}
+
+# ==========================
+# 🤖 CLIENTE SIMULADO
+# ==========================
+class ClienteSimulado:
+    """Estado de uma persona dentro de uma sessão."""
+
+    def __init__(self, persona, seed=0, max_topicos=2):
+        self.persona = PERSONAS[persona] if isinstance(persona, str) else persona
+        self.seed = seed
+        # seed em string é determinística entre execuções (random usa sha512)
+        self.rng = random.Random(f"{self.persona.nome}:{seed}")
+        self.max_topicos = max_topicos
+        self.respondidos = set()
+        self.turno = 0
+
+    def _variacao(self, opcoes):
+        return opcoes[self.rng.randrange(len(opcoes))]
+
+    def responder(self, gpt_msg="", gemini_msg=""):
+        self.turno += 1
+        if not (gpt_msg or gemini_msg):
+            return self._variacao(self.persona.aberturas)
+
+        perguntados = topicos_perguntados(f"{gpt_msg}\n{gemini_msg}")
+        # Responde primeiro o que ainda não foi dito; repete só se perguntarem de novo
+        ordem = [t for t in perguntados if t not in self.respondidos] + \
+                [t for t in perguntados if t in self.respondidos]
+        escolhidos = [t for t in ordem if t in self.persona.respostas][: self.max_topicos]
+        if not escolhidos:
+            return self._variacao(self.persona.genericas)
+
+        self.respondidos.update(escolhidos)
+        return " ".join(self._variacao(self.persona.respostas[t]) for t in escolhidos)
+
+# ==========================
+# 🚀 CLI
+# ==========================
+def main():
+    ap = argparse.ArgumentParser(description="Personas de cliente simulado")
+    ap.add_argument("persona", nargs="?", help="Mostra uma conversa de exemplo com esta persona")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    if not args.persona:
+        for p in PERSONAS.values():
+            print(f"{p.nome:22s} [{p.gabarito}] {p.descricao}")
+        return
+
+    cliente = ClienteSimulado(args.persona, args.seed)
+    perguntas = [
+        "",
+        "Quem são as partes envolvidas e o que aconteceu, em ordem cronológica?",
+        "Quando isso ocorreu? Houve alguma tentativa de resolução anterior?",
+        "O que você gostaria que fosse resolvido? Está aberto a acordo?",
+        "Você tem prints, e-mails, contratos ou notas fiscais? Tem testemunhas?",
+    ]
+    for p in perguntas:
+        if p: print(f"🤖 {p}")
+        print(f"👤 {cliente.responder(p, p)}")
+
+if __name__ == "__main__":
+    main()
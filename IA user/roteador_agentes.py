@@ -0,0 +1,95 @@
+"""
+Roteador dos sub-agentes (fatos, pedido, material).
+
+Cada sub-agente em prompts/sub_agente_*.md tem um checklist e devolve uma frase
+de conclusão ao `main` quando ele fecha ("entendi todos os fatos", ...). Depois
+disso chamar o agente de novo é desperdício. O roteador guarda, por sessão,
+quais checklists já fecharam e libera só os agentes com itens em aberto,
+respeitando a ordem do prompt principal: Passo 1 (fatos + pedido) antes do
+Passo 2 (material).
+
+Isso depende de o workflow do n8n devolver a saída de cada sub-agente (chaves
+"fatos"/"pedido"/"material" no item ou em "agentes"). Agente cuja saída nunca
+apareceu na sessão não tem como sinalizar conclusão: continua sendo chamado e
+não segura o passo seguinte. Sem essas chaves o roteador não pula nada.
+"""
+
+import unicodedata
+
+# ==========================
+# 🔧 CONFIGURAÇÃO
+# ==========================
+AGENTES = ("fatos", "pedido", "material")
+
+# Passo 1 do prompt principal roda fatos + pedido; material só no Passo 2
+ETAPAS = (("fatos", "pedido"), ("material",))
+
+# Frases de conclusão de cada checklist (sem acento, minúsculas).
+# O prompt do pedido ainda devolve "entendi todos os fatos", por isso aceita as duas.
+FRASES_CONCLUSAO = {
+    "fatos": ("entendi todos os fatos",),
+    "pedido": ("entendi todos os pedidos", "entendi todo o pedido", "entendi todos os fatos"),
+    "material": ("entendi todo material probatorio", "entendi todo o material probatorio"),
+}
+
+
+def _normalizar(texto) -> str:
+    if not texto: return ""
+    texto = unicodedata.normalize("NFKD", str(texto))
+    return "".join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+class RoteadorAgentes:
+    def __init__(self):
+        self.concluidos = {}    # sessao -> set(agentes com checklist fechado)
+        self.vistos = {}        # sessao -> set(agentes cuja saída já veio do n8n)
+        self.economizadas = {}  # sessao -> chamadas puladas por checklist fechado
+
+    def agentes_abertos(self, sessao):
+        feitos = self.concluidos.get(sessao, set())
+        vistos = self.vistos.get(sessao, set())
+        abertos = []
+        for etapa in ETAPAS:
+            pendentes = [a for a in etapa if a not in feitos]
+            abertos.extend(pendentes)
+            # o passo só segura o seguinte se um agente em aberto dele consegue sinalizar conclusão
+            if any(a in vistos for a in pendentes): break
+        return abertos
+
+    def rotear(self, sessao):
+        """Agentes a acionar nesta rodada; os de checklist fechado contam como chamadas economizadas."""
+        chamar = self.agentes_abertos(sessao)
+        # material esperando o Passo 1 não é economia: ainda vai ser chamado
+        pulados = [a for a in AGENTES if a in self.concluidos.get(sessao, ())]
+        if pulados:
+            self.economizadas[sessao] = self.economizadas.get(sessao, 0) + len(pulados)
+            print(f"⏭️ [{sessao}] Agentes pulados: {', '.join(pulados)} "
+                  f"(economia acumulada: {self.economizadas[sessao]} chamadas)")
+        return chamar
+
+    def registrar_saida(self, sessao, out):
+        """
+        Lê a saída do n8n e marca os checklists que fecharam.
+        Aceita {"agentes": {"fatos": "...", ...}} ou as chaves direto no item.
+        """
+        if not isinstance(out, dict): return
+        saidas = out.get("agentes") if isinstance(out.get("agentes"), dict) else out
+        feitos = self.concluidos.setdefault(sessao, set())
+        vistos = self.vistos.setdefault(sessao, set())
+        for agente in AGENTES:
+            if agente in saidas: vistos.add(agente)
+            texto = _normalizar(saidas.get(agente))
+            if agente not in feitos and any(f in texto for f in FRASES_CONCLUSAO[agente]):
+                feitos.add(agente)
+                print(f"☑️ [{sessao}] Checklist '{agente}' concluído")
+
+    def resetar(self, sessao):
+        self.concluidos.pop(sessao, None)
+        self.vistos.pop(sessao, None)
+        self.economizadas.pop(sessao, None)
+
+    def resumo(self, sessao):
+        return {
+            "concluidos": sorted(self.concluidos.get(sessao, ())),
+            "chamadas_economizadas": self.economizadas.get(sessao, 0),
+        }
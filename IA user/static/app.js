@@ -8,6 +8,11 @@ const GPT_LOGO = "/static/logos/gpt.svg";
 const GEMINI_LOGO = "/static/logos/gemini.png";
 let totalGPT = 0, totalGem = 0, runCount = 0;
 
+// O servidor manda só os campos que mudaram (delta com "seq"); `estado` acumula o turno completo.
+// SESSAO vai em todo POST: o servidor processa e emite na sala dessa sessão
+const SESSAO = new URLSearchParams(window.location.search).get("sessao") || "padrao";
+let estado = {}, ultimoSeq = 0, fila = Promise.resolve();
+
 const fmtMoney = (val) => 'US$ ' + parseFloat(val || 0).toFixed(5);
 const escapeHTML = (str) => String(str || "").replace(/[&<>"']/g, (m) => ({ "&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#039;" })[m]);
 const formatText = (txt) => escapeHTML(txt).replace(/\n/g, "<br>");
@@ -64,7 +69,7 @@ async function enviarMensagem() {
     await fetch("/processar", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ entrada: texto, user_type: "human" })
+      body: JSON.stringify({ entrada: texto, user_type: "human", sessao: SESSAO })
     });
   } catch (e) { console.error(e); sendButton.disabled = false; }
 }
@@ -72,8 +77,33 @@ async function enviarMensagem() {
 input.addEventListener("keydown", (e) => { if (e.key === "Enter") enviarMensagem(); });
 sendButton.addEventListener("click", enviarMensagem);
 
-socket.on("resposta", (data) => {
-  if (data.status === "reset") { location.reload(); return; }
+// Entra na sala da sessão (também a cada reconexão); o ack traz o estado completo
+function sincronizar() {
+  socket.emit("entrar", { sessao: SESSAO }, (snap) => {
+    if (!snap) return;
+    if (snap.seq >= ultimoSeq) { estado = snap.estado || {}; ultimoSeq = snap.seq; }
+    else estado = { ...(snap.estado || {}), ...estado };
+  });
+}
+socket.on("connect", sincronizar);
+
+// Deltas grandes chegam comprimidos: {"seq", "deflate": <binário>}
+async function decodificar(data) {
+  if (!data.deflate) return data;
+  const fluxo = new Blob([data.deflate]).stream().pipeThrough(new DecompressionStream("deflate"));
+  return { seq: data.seq, ...JSON.parse(await new Response(fluxo).text()) };
+}
+
+// Fila: a descompressão é assíncrona e os deltas precisam ser aplicados na ordem
+socket.on("resposta", (bruto) => {
+  fila = fila.then(() => decodificar(bruto)).then(aplicarResposta).catch(console.error);
+});
+
+function aplicarResposta(delta) {
+  if (delta.status === "reset") { location.reload(); return; }
+  if (ultimoSeq && delta.seq !== ultimoSeq + 1) sincronizar();  // perdeu um delta: pede o estado completo
+  ultimoSeq = delta.seq;
+  const data = estado = { ...estado, ...delta };
 
   if (data.user_type === "ai_user" && data.ai_user_msg) {
       renderUserMessage(data.ai_user_msg, `👤 Cliente Simulado (L${data.loop_count})`);
@@ -118,7 +148,7 @@ socket.on("resposta", (data) => {
       runsBody.scrollTop = runsBody.scrollHeight;
   }
   sendButton.disabled = false;
-});
+}
 
 socket.on("aviso_sistema", (data) => {
     const div = document.createElement("div");
@@ -132,11 +162,21 @@ window.salvarConversaServidor = async () => {
   const btn = document.querySelector(".btn-save");
   if(btn) btn.innerText = "💾 ...";
   try {
-    const res = await fetch("/salvar_conversa", { method: "POST" });
+    const res = await fetch("/salvar_conversa", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ sessao: SESSAO })
+    });
     const data = await res.json();
     alert(data.status === "ok" ? "✅ Salvo: " + data.arquivo : "❌ " + data.mensagem);
   } catch(e) { alert("Erro conexão"); }
   if(btn) btn.innerText = "💾 Salvar JSON";
 };
 
-window.onload = () => { fetch("/start_ai_conversation", { method: "POST" }).catch(console.error); };
\ No newline at end of file
+window.onload = () => {
+  fetch("/start_ai_conversation", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ sessao: SESSAO })
+  }).catch(console.error);
+};
\ No newline at end of file
@@ -0,0 +1,58 @@
+import json
+import os
+
+import busca
+from armazenamento import Armazenamento
+
+
+def _conversa(caminho, texto_cliente):
+    historico = [{
+        "timestamp": "2026-01-05T10:00:00", "loop": 0, "user_simulado": texto_cliente,
+        "gpt": {"msg": "Entendi, pode detalhar?", "class": "Conversando"},
+        "gemini": {"msg": "Certo, qual a data da compra?", "class": "Conversando"},
+    }]
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump({"historico": historico}, f, ensure_ascii=False)
+
+
+def test_reindexar_arquivo_modificado_mantem_fts(tmp_path):
+    pasta = tmp_path / "JSON_Conversas"
+    pasta.mkdir()
+    _conversa(pasta / "conversa_2026-01-05_10-00-00.json", "comprei um celular")
+    ultimo = pasta / "conversa_2026-01-05_11-00-00.json"
+    _conversa(ultimo, "meu voo atrasou")
+    con = busca.conectar(str(tmp_path / "busca.sqlite3"))
+    assert busca.atualizar(con, (str(pasta),)) == 2
+
+    # o último arquivo indexado tem os maiores ids: reindexado, os ids são reaproveitados
+    _conversa(ultimo, "minha bagagem foi extraviada")
+    st = os.stat(ultimo)
+    os.utime(ultimo, (st.st_atime, st.st_mtime + 10))
+    assert busca.atualizar(con, (str(pasta),)) == 1
+
+    total = con.execute("SELECT count(*) FROM mensagens").fetchone()[0]
+    assert con.execute("SELECT count(*) FROM mensagens_fts_docsize").fetchone()[0] == total
+    achados = busca.buscar(con, "bagagem")
+    assert len(achados) == 1 and achados[0]["conversa"].endswith("/" + ultimo.stem)
+    assert busca.buscar(con, "atrasou") == []
+    assert len(busca.buscar(con, "celular")) == 1
+
+
+def test_conversa_migrada_sem_apagar_aparece_uma_vez(tmp_path):
+    pasta = tmp_path / "JSON_Conversas"
+    pasta.mkdir()
+    _conversa(pasta / "conversa_2026-01-05_10-00-00.json", "comprei um celular")
+    con = busca.conectar(str(tmp_path / "busca.sqlite3"))
+    assert busca.atualizar(con, (str(pasta),)) == 1
+
+    # migrar sem --apagar: o registro do índice tem o mesmo id e substitui o arquivo solto
+    Armazenamento(str(pasta), "gzip").migrar()
+    busca.atualizar(con, (str(pasta),))
+    achados = busca.buscar(con, "celular")
+    assert len(achados) == 1 and achados[0]["conversa"].endswith("/conversa_2026-01-05_10-00-00")
+    assert con.execute("SELECT count(*) FROM conversas").fetchone()[0] == 1
+
+    # banco novo: índice e arquivo lidos na mesma rodada
+    con = busca.conectar(str(tmp_path / "novo.sqlite3"))
+    assert busca.atualizar(con, (str(pasta),)) == 1
+    assert len(busca.buscar(con, "celular")) == 1
@@ -0,0 +1,237 @@
+"""
+Turno compacto para os históricos em memória do servidor.
+
+No JSON (e antes também na memória) cada turno é um dict com dois dicts
+aninhados ("gpt"/"gemini") e as mesmas chaves repetidas em todo turno: ~1 KB
+de estrutura por turno antes de contar o texto. `Turno` é uma dataclass com
+__slots__ (sem __dict__ por instância), os rótulos de classe são internados
+(sys.intern: "Conversando" é um único objeto em todos os turnos de todas as
+sessões) e a janela do n8n, que é a mesma nas duas pernas, é guardada uma vez.
+
+Para não mexer em quem já lê o histórico (formatar_contexto_historico,
+classificador, casos parecidos), `Turno` também responde a `turno["gpt"]["msg"]`
+e `turno.get("user_simulado")` com a mesma forma do JSON; `para_json()` /
+`Turno.de_json()` convertem nos dois sentidos, ida e volta sem perda.
+
+`HistoricoLimitado` segura só os últimos N turnos de cada sessão (o prompt usa
+os 4 últimos, a trava de encerramento o último); os mais antigos vão para um
+JSONL por sessão em JSON_Conversas/sessoes_ativas/ e só são lidos de volta no
+export completo (/salvar_conversa). A memória por sessão fica limitada a N
+turnos, não importa quanto a conversa dure.
+
+Medição do custo por turno (tracemalloc, turnos das conversas salvas: índice dos
+shards e conversa_*.json antigos):
+  python turnos.py --sessoes 300 --turnos 12
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import tracemalloc
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from classificador_decisao import GLOB_PADRAO, INDICE_PADRAO, carregar_historicos
+from metricas_ao_vivo import MODELOS
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PASTA_SESSOES = os.path.join(BASE_DIR, "JSON_Conversas", "sessoes_ativas")
+TURNOS_EM_MEMORIA = 16  # padrão do HistoricoLimitado (>= os 4 do contexto do prompt)
+
+# Chaves do JSON que viram campos; o resto (classificador_local, casos_similares, ...) vai para `extras`
+_CHAVES = ("timestamp", "recebido", "loop", "user_simulado") + MODELOS
+_CHAVES_PERNA = ("msg", "class", "inicio", "fim")
+
+
+def _rotulo(texto):
+    return sys.intern(texto) if texto else ""
+
+
+@dataclass(slots=True)
+class Turno:
+    timestamp: str
+    loop: Optional[int]
+    user_simulado: str
+    gpt_msg: str = ""
+    gpt_class: str = ""
+    gemini_msg: str = ""
+    gemini_class: str = ""
+    recebido: str = ""
+    # Janela da chamada ao n8n ("" na perna que não respondeu no turno)
+    gpt_inicio: str = ""
+    gpt_fim: str = ""
+    gemini_inicio: str = ""
+    gemini_fim: str = ""
+    extras: Optional[Dict[str, Any]] = None
+
+    def __post_init__(self):
+        self.gpt_class = _rotulo(self.gpt_class)
+        self.gemini_class = _rotulo(self.gemini_class)
+        # mesma janela nas duas pernas: um objeto só
+        if self.gemini_inicio == self.gpt_inicio: self.gemini_inicio = self.gpt_inicio
+        if self.gemini_fim == self.gpt_fim: self.gemini_fim = self.gpt_fim
+
+    @classmethod
+    def de_json(cls, d):
+        pernas = {m: d.get(m) if isinstance(d.get(m), dict) else {} for m in MODELOS}
+        extras = {k: v for k, v in d.items() if k not in _CHAVES}
+        for m, p in pernas.items():
+            resto = {k: v for k, v in p.items() if k not in _CHAVES_PERNA}
+            if resto: extras[f"_{m}"] = resto  # chaves desconhecidas dentro da perna
+        g, e = pernas["gpt"], pernas["gemini"]
+        return cls(
+            d.get("timestamp", ""), d.get("loop"), d.get("user_simulado", ""),
+            g.get("msg", ""), g.get("class", ""), e.get("msg", ""), e.get("class", ""),
+            d.get("recebido", ""), g.get("inicio", ""), g.get("fim", ""), e.get("inicio", ""), e.get("fim", ""),
+            extras or None,
+        )
+
+    def perna(self, modelo):
+        """{"msg", "class"[, "inicio", "fim"]} da perna, como no JSON."""
+        if modelo == "gpt":
+            p = {"msg": self.gpt_msg, "class": self.gpt_class}
+            inicio, fim = self.gpt_inicio, self.gpt_fim
+        else:
+            p = {"msg": self.gemini_msg, "class": self.gemini_class}
+            inicio, fim = self.gemini_inicio, self.gemini_fim
+        if inicio: p["inicio"] = inicio
+        if fim: p["fim"] = fim
+        if self.extras and f"_{modelo}" in self.extras: p.update(self.extras[f"_{modelo}"])
+        return p
+
+    def para_json(self):
+        d = {"timestamp": self.timestamp}
+        if self.recebido: d["recebido"] = self.recebido
+        d["loop"] = self.loop
+        d["user_simulado"] = self.user_simulado
+        d["gpt"] = self.perna("gpt")
+        d["gemini"] = self.perna("gemini")
+        if self.extras: d.update((k, v) for k, v in self.extras.items() if k.lstrip("_") not in MODELOS)
+        return d
+
+    # Leitura no formato do JSON (turno["gpt"]["class"], turno.get("user_simulado"))
+    def __getitem__(self, chave):
+        if chave in MODELOS: return self.perna(chave)
+        if chave in _CHAVES: return getattr(self, chave)
+        if self.extras and chave in self.extras and chave.lstrip("_") not in MODELOS: return self.extras[chave]
+        raise KeyError(chave)
+
+    def get(self, chave, padrao=None):
+        try: return self[chave]
+        except KeyError: return padrao
+
+
+def historico_para_json(historico):
+    """Lista pronta para json.dump (aceita turnos já em dict)."""
+    return [t.para_json() if isinstance(t, Turno) else t for t in historico]
+
+
+class HistoricoLimitado:
+    """
+    Histórico de uma sessão: buffer circular dos últimos `maximo` turnos em memória,
+    os anteriores anexados (JSONL) em `pasta/<sessao>.jsonl` quando saem do buffer.
+
+    len() conta todos os turnos da sessão; índice, fatia e iteração valem só para os
+    turnos em memória (historico[-1], historico[-4:]). `para_json()` lê o arquivo e
+    devolve a sessão inteira.
+    """
+
+    def __init__(self, sessao="padrao", maximo=TURNOS_EM_MEMORIA, pasta=PASTA_SESSOES):
+        if maximo < 1: raise ValueError("maximo precisa ser >= 1")
+        self.recentes = deque()
+        self.maximo = maximo
+        self.caminho = os.path.join(pasta, re.sub(r"[^\w.-]", "_", sessao) + ".jsonl")
+        self.despejados = 0
+        self.lock = threading.Lock()
+        # Sessão nova: o que sobrou de uma execução anterior com o mesmo nome não é dela
+        self._apagar_arquivo()
+
+    def append(self, turno):
+        with self.lock:
+            if len(self.recentes) >= self.maximo:
+                antigo = self.recentes.popleft()
+                os.makedirs(os.path.dirname(self.caminho), exist_ok=True)
+                with open(self.caminho, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(historico_para_json([antigo])[0], ensure_ascii=False) + "\n")
+                self.despejados += 1
+            self.recentes.append(turno)
+
+    def __len__(self):
+        return self.despejados + len(self.recentes)
+
+    def __iter__(self):
+        return iter(self.recentes)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice): return list(self.recentes)[i]
+        return self.recentes[i]
+
+    def para_json(self):
+        """A sessão inteira no formato do JSON (turnos despejados + os em memória)."""
+        with self.lock:
+            turnos = []
+            if self.despejados:
+                with open(self.caminho, "r", encoding="utf-8") as f:
+                    turnos = [json.loads(linha) for linha in f]
+            return turnos + historico_para_json(self.recentes)
+
+    def descartar(self):
+        """Fim da sessão: esvazia a memória e apaga o arquivo de despejo."""
+        with self.lock:
+            self.recentes.clear()
+            self.despejados = 0
+            self._apagar_arquivo()
+
+    def _apagar_arquivo(self):
+        try: os.remove(self.caminho)
+        except FileNotFoundError: pass
+
+# ==========================
+# 📏 BENCHMARK DE MEMÓRIA
+# ==========================
+def _medir(construir):
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    obj = construir()
+    depois = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, depois - antes
+
+def main():
+    ap = argparse.ArgumentParser(description="Memória por turno: dict aninhado x Turno compacto")
+    ap.add_argument("--glob", default=GLOB_PADRAO)
+    ap.add_argument("--indice", default=INDICE_PADRAO, help='Índice dos shards ("" para ignorar)')
+    ap.add_argument("--sessoes", type=int, default=300)
+    ap.add_argument("--turnos", type=int, default=12, help="Turnos por sessão (o teto do MAX_AI_LOOPS)")
+    args = ap.parse_args()
+
+    # Só os primeiros turnos do corpus servem de modelo: para de ler quando já tem o bastante
+    modelos = []
+    for _, hist in carregar_historicos(args.glob, args.indice):
+        modelos.extend(hist)
+        if len(modelos) >= args.turnos: break
+    if not modelos: raise SystemExit(f"Nenhum turno em {args.glob} nem em {args.indice or '(sem índice)'}")
+    # Texto serializado de cada turno: cada sessão decodifica o seu (strings próprias, como no servidor)
+    brutos = [json.dumps(modelos[i % len(modelos)], ensure_ascii=False) for i in range(args.turnos)]
+    n = args.sessoes * args.turnos
+
+    dicts, bytes_dict = _medir(lambda: [[json.loads(b) for b in brutos] for _ in range(args.sessoes)])
+    texto = sum(sys.getsizeof(t.get("user_simulado", "")) + sum(sys.getsizeof((t.get(m) or {}).get("msg", ""))
+                for m in MODELOS) for s in dicts for t in s)
+    del dicts
+    compactos, bytes_turno = _medir(lambda: [[Turno.de_json(json.loads(b)) for b in brutos] for _ in range(args.sessoes)])
+    assert all(t.para_json() == json.loads(b) for t, b in zip(compactos[0], brutos))
+    del compactos
+
+    print(f"📏 {args.sessoes} sessões × {args.turnos} turnos = {n} turnos ({texto / n:.0f} B de texto por turno)")
+    for nome, total in (("dict aninhado", bytes_dict), ("Turno (slots)", bytes_turno)):
+        print(f"  {nome:<14} {total / 2**20:8.2f} MB   {total / n:7.0f} B/turno   "
+              f"estrutura {(total - texto) / n:6.0f} B/turno")
+    print(f"  economia: {(bytes_dict - bytes_turno) / 2**20:.2f} MB ({1 - bytes_turno / bytes_dict:.0%})")
+
+if __name__ == "__main__":
+    main()